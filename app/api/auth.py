@@ -1,11 +1,58 @@
-from fastapi import APIRouter, HTTPException, status
+import math
+import time
+
+import redis.asyncio as aioredis
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 
 from app.api import dependencies
 from app.auth import crud, exceptions, security
-from app.auth.models import Token, UserModel
+from app.auth.cache import REDIS_USER_CHANNEL, user_key
+from app.auth.models import RefreshTokenModel, Token, UserModel
+from app.core.executor import ExecutorBusyError
+from app.core.ratelimit import RateLimitedError
+from app.events import outbox
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+BUSY_RESPONSE = {
+	"description": "Additional Response - Too many passwords are being hashed, retry later",
+	"model": dependencies.ExceptionModel,
+	"content": {
+		"application/json": {
+			"example": {"detail": "Executor 'bcrypt' is busy, try again later."},
+		}
+	},
+}
+UNAVAILABLE_RESPONSE = {
+	"description": "Additional Response - Tokens cannot be checked or revoked, retry later",
+	"model": dependencies.ExceptionModel,
+	"content": {
+		"application/json": {
+			"example": {"detail": "Refresh tokens are unavailable, try again later."},
+		}
+	},
+}
+# NOTE seconds clients should wait before retrying a rejected login or registration
+BUSY_RETRY_AFTER = 1
+# NOTE seconds clients should wait before retrying a refresh or a logout while Redis is unavailable
+UNAVAILABLE_RETRY_AFTER = 5
+
+
+def busy_exception(e: ExecutorBusyError) -> HTTPException:
+	return HTTPException(
+		status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+		detail=str(e),
+		headers={"Retry-After": str(BUSY_RETRY_AFTER)},
+	)
+
+
+def unavailable_exception(e: exceptions.RefreshTokenUnavailableError) -> HTTPException:
+	return HTTPException(
+		status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+		detail=str(e),
+		headers={"Retry-After": str(UNAVAILABLE_RETRY_AFTER)},
+	)
+
 
 @router.post(
 	"/login",
@@ -30,9 +77,26 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 				}
 			},
 		},
+		status.HTTP_429_TOO_MANY_REQUESTS: {
+			"description": "Additional Response - Too many login attempts for the username or from the client",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Too many requests, retry in 42 seconds."},
+				}
+			},
+		},
+		status.HTTP_503_SERVICE_UNAVAILABLE: BUSY_RESPONSE,
 	},
 )
-async def login(session: dependencies.SessionDep, form_data: UserModel) -> Token:
+async def login(
+	session: dependencies.SessionDep,
+	redis: dependencies.RedisDep,
+	limiter: dependencies.LoginLimiterDep,
+	settings: dependencies.SettingsDep,
+	request: Request,
+	form_data: UserModel,
+) -> Token:
 	"""This endpoint is used to authenticate a user and return a JWT token.
 
 	The token is used to access protected endpoints as an `Authorization` Bearer token.
@@ -44,7 +108,29 @@ async def login(session: dependencies.SessionDep, form_data: UserModel) -> Token
 	Authorization: Bearer <token>
 	...
 	```
+
+	The response also contains a long-lived refresh token, to exchange for new tokens at `/auth/refresh` instead of
+	logging in again when the access token expires. It is left out while refresh tokens cannot be stored.
+
+	Login attempts are rate limited per username and per client IP address. Rejected attempts get a `429` response
+	with a `Retry-After` header.
 	"""
+	client_ip = request.client.host if request.client is not None else "unknown"
+	try:
+		# NOTE checked before anything else, so that rejected attempts cost no password hash nor database query
+		await limiter.hit(
+			{
+				f"user:{form_data.username}": settings.login_rate_limit_per_username,
+				f"ip:{client_ip}": settings.login_rate_limit_per_ip,
+			},
+			redis,
+		)
+	except RateLimitedError as e:
+		raise HTTPException(
+			status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+			detail=str(e),
+			headers={"Retry-After": str(math.ceil(e.retry_after))},
+		)
 	try:
 		user_valid = await security.authenticate_user(session, form_data.username, form_data.password)
 		if not user_valid:
@@ -53,9 +139,23 @@ async def login(session: dependencies.SessionDep, form_data: UserModel) -> Token
 				detail="Incorrect username or password",
 			)
 		access_token = security.create_access_token(subject=form_data.username)
-		return Token(access_token=access_token, token_type="bearer")
+		return Token(
+			access_token=access_token,
+			token_type="bearer",
+			refresh_token=await new_refresh_token(redis, form_data.username),
+		)
 	except exceptions.UserNotFoundError as e:
 		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+	except ExecutorBusyError as e:
+		raise busy_exception(e)
+
+
+async def new_refresh_token(redis: aioredis.Redis, subject: str) -> str | None:
+	"""A new refresh token, or none while they cannot be stored: the access token is still worth returning."""
+	try:
+		return await security.issue_refresh_token(redis, subject=subject)
+	except exceptions.RefreshTokenUnavailableError:
+		return None
 
 
 @router.post(
@@ -72,9 +172,15 @@ async def login(session: dependencies.SessionDep, form_data: UserModel) -> Token
 				}
 			},
 		},
+		status.HTTP_503_SERVICE_UNAVAILABLE: BUSY_RESPONSE,
 	},
 )
-async def register(session: dependencies.SessionDep, new_user: UserModel) -> None:
+async def register(
+	session: dependencies.SessionDep,
+	publisher: dependencies.OutboxPublisherDep,
+	user_cache: dependencies.UserCacheDep,
+	new_user: UserModel,
+) -> None:
 	"""Register a new user.
 
 	Parameters:
@@ -85,10 +191,98 @@ async def register(session: dependencies.SessionDep, new_user: UserModel) -> Non
 		await crud.create_user(
 			session,
 			username=new_user.username,
-			password_hash=security.get_password_hash(new_user.password),
+			password_hash=await security.hash_password(new_user.password),
+			commit=False,
 		)
 	except exceptions.UserAlreadyExistsError as e:
 		raise HTTPException(
 			status_code=status.HTTP_409_CONFLICT,
 			detail=str(e),
 		)
+	except ExecutorBusyError as e:
+		raise busy_exception(e)
+
+	await outbox.add_event(
+		session,
+		channel=REDIS_USER_CHANNEL,
+		event_type="user_created",
+		event_data={"user": user_key(new_user.username)},
+	)
+	await session.commit()
+	# NOTE the username may be cached as unknown by this and the other workers
+	user_cache.invalidate(new_user.username)
+	publisher.wake()
+
+
+@router.post(
+	"/refresh",
+	status_code=200,
+	summary="Exchange a refresh token for new tokens",
+	responses={
+		401: {
+			"description": "Additional Response - Invalid, expired or already used refresh token",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Invalid refresh token."},
+				}
+			},
+		},
+		status.HTTP_503_SERVICE_UNAVAILABLE: UNAVAILABLE_RESPONSE,
+	},
+)
+async def refresh(redis: dependencies.RedisDep, body: RefreshTokenModel) -> Token:
+	"""Exchange a refresh token for a new access token and a new refresh token, without checking the password again.
+
+	Refresh tokens are single use: the one sent is consumed, and the new one must be used next time. While they
+	cannot be checked, the request is rejected with a `503` response and a `Retry-After` header.
+	"""
+	try:
+		username = await security.redeem_refresh_token(redis, body.refresh_token)
+	except exceptions.InvalidRefreshTokenError as e:
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+	except exceptions.RefreshTokenUnavailableError as e:
+		raise unavailable_exception(e)
+	access_token = security.create_access_token(subject=username)
+	return Token(access_token=access_token, token_type="bearer", refresh_token=await new_refresh_token(redis, username))
+
+
+@router.post(
+	"/logout",
+	status_code=204,
+	summary="Revoke the current tokens",
+	dependencies=[Depends(dependencies.get_current_user)],
+	responses={
+		401: {
+			"description": "Additional Response - Invalid refresh token",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Invalid refresh token."},
+				}
+			},
+		},
+		status.HTTP_503_SERVICE_UNAVAILABLE: UNAVAILABLE_RESPONSE,
+	},
+)
+async def logout(
+	redis: dependencies.RedisDep,
+	revocations: dependencies.RevocationListDep,
+	credentials: dependencies.JWTBearerDep,
+	body: RefreshTokenModel | None = None,
+) -> None:
+	"""Revoke the access token of the request in every worker, and the refresh token if one is sent.
+
+	While Redis is unavailable, the request is rejected with a `503` response and a `Retry-After` header, and the
+	access token stays valid until the logout is retried.
+	"""
+	claims = security.decode_access_token(credentials.credentials)
+	try:
+		if body is not None:
+			await security.revoke_refresh_token(redis, body.refresh_token)
+		if "jti" in claims and "exp" in claims:
+			await revocations.revoke(redis, claims["jti"], expires_in=claims["exp"] - time.time())
+	except exceptions.InvalidRefreshTokenError as e:
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+	except exceptions.RefreshTokenUnavailableError as e:
+		raise unavailable_exception(e)
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from collections.abc import Iterable
+from typing import Annotated, Any
 
-from app.api import dependencies
-from app.books import crud, exceptions, models
-from app.db.redis import publish_event
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api import conditional, dependencies
+from app.books import crud, exceptions, export, models, pagination, serializers
+from app.books.schemas import Book
+from app.core.config import get_app_settings
+from app.db.versions import get_table_version
+from app.events import outbox
 
 router = APIRouter(
 	prefix="/books",
@@ -11,49 +20,323 @@ router = APIRouter(
 )
 
 REDIS_BOOK_CHANNEL = "books"
+MAX_PAGE_SIZE = 1000
+MAX_BULK_ITEMS = 10_000
+
+FieldsQuery = Annotated[
+	str | None,
+	Query(description="Comma separated book fields to return, e.g. `title,author`. The id is always returned."),
+]
+
+
+def book_tags(
+	books: Iterable[Book | models.CreateBookModel | models.BookResponseModel], ids: list[int]
+) -> dict[str, list[Any]]:
+	"""The values that subscribers can filter the events of `books` on."""
+	authors, genres = set(), set()
+	for book in books:
+		authors.add(book.author)
+		genres.add(book.genre)
+	return {"book_id": ids, "author": sorted(authors), "genre": sorted(genres)}
+
+
+async def add_book_event(
+	session: AsyncSession,
+	event_type: str,
+	event_data: dict[str, Any],
+	username: str,
+	tags: dict[str, list[Any]] | None = None,
+) -> None:
+	"""Add an event to the outbox, to be published once `session` is committed."""
+	await outbox.add_event(
+		session,
+		channel=REDIS_BOOK_CHANNEL,
+		event_type=event_type,
+		event_data=event_data,
+		username=username,
+		stream_max_len=get_app_settings().book_events_stream_max_len,
+		tags=tags,
+	)
 
 
 @router.post("", status_code=201)
 async def create_book(
 	session: dependencies.SessionDep,
-	redis: dependencies.RedisDep,
+	publisher: dependencies.OutboxPublisherDep,
 	input_book: models.CreateBookModel,
 	user: dependencies.UserDep,
 ) -> models.BookResponseModel:
 	"""Create a new book."""
-	book = await crud.create_book(session, input_book)
+	book = await crud.create_book(session, input_book, commit=False)
 	response = models.BookResponseModel.model_validate(book)
 
-	await publish_event(
-		redis,
-		channel=REDIS_BOOK_CHANNEL,
+	await add_book_event(
+		session,
 		event_type="book_created",
 		event_data=response.model_dump(mode="json", include={"id", "title", "author"}),
 		username=user.username,
+		tags=book_tags([book], [book.id]),
 	)
+	await session.commit()
+	publisher.wake()
 	return response
 
 
-@router.get("", status_code=200)
+@router.post(
+	"/bulk",
+	status_code=201,
+	responses={
+		422: {
+			"description": "Additional Response - Invalid items in an all-or-nothing request",
+			"content": {
+				"application/json": {
+					"example": {
+						"detail": [
+							{
+								"index": 1,
+								"errors": [{"type": "missing", "loc": ["title"], "msg": "Field required"}],
+							}
+						]
+					},
+				}
+			},
+		},
+	},
+)
+async def create_books(
+	session: dependencies.SessionDep,
+	publisher: dependencies.OutboxPublisherDep,
+	user: dependencies.UserDep,
+	items: Annotated[list[Any], Body(max_length=MAX_BULK_ITEMS)],
+	atomic: bool = False,
+) -> models.BulkCreateResponseModel:
+	"""Create many books at once.
+
+	Each item has the same shape as the body of `POST /books` and is validated on its own:
+	- By default, invalid items are reported in `errors` and the valid ones are still created.
+	- With `atomic=true`, nothing is created if any item is invalid and the errors are returned with a 422.
+
+	`ids[i]` is the id of the book created from the i-th item, or `null` if that item was invalid.
+	All books are inserted in a single transaction and a single `books_created` event is published for the batch.
+	"""
+	valid_items: list[tuple[int, models.CreateBookModel]] = []
+	errors: list[models.BulkItemErrorModel] = []
+	for index, item in enumerate(items):
+		try:
+			valid_items.append((index, models.CreateBookModel.model_validate(item)))
+		except ValidationError as e:
+			item_errors = e.errors(include_url=False, include_context=False, include_input=False)
+			errors.append(models.BulkItemErrorModel(index=index, errors=[dict(error) for error in item_errors]))
+	if errors and atomic:
+		raise HTTPException(status_code=422, detail=[error.model_dump() for error in errors])
+
+	created_ids = await crud.create_books(session, [book for _, book in valid_items], commit=False)
+	ids: list[int | None] = [None] * len(items)
+	for (index, _), book_id in zip(valid_items, created_ids):
+		ids[index] = book_id
+
+	if created_ids:
+		await add_book_event(
+			session,
+			event_type="books_created",
+			event_data={"ids": created_ids, "count": len(created_ids)},
+			username=user.username,
+			tags=book_tags([book for _, book in valid_items], created_ids),
+		)
+	await session.commit()
+	publisher.wake()
+	return models.BulkCreateResponseModel(ids=ids, errors=errors)
+
+
+@router.get(
+	"",
+	status_code=200,
+	response_model=models.PageModel[models.BookResponseModel],
+	responses={
+		304: {"description": "Additional Response - No book changed since the `If-None-Match` ETag"},
+		400: {
+			"description": "Additional Response - Invalid pagination parameters or fields",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Invalid pagination cursor."},
+				}
+			},
+		},
+	},
+)
 async def get_books(
 	session: dependencies.SessionDep,
-	skip: int = 0,
-	limit: int = 100,
-) -> list[models.BookResponseModel]:
-	"""Get all books with pagination, ordered by id.
+	request: Request,
+	filters: Annotated[models.BookFilterModel, Depends()],
+	sort: models.BookSort = "id",
+	after: str | None = None,
+	limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 100,
+	skip: Annotated[int, Query(ge=0, deprecated=True)] = 0,
+	fields: FieldsQuery = None,
+) -> Response:
+	"""Get all books with pagination, optionally filtered and sorted.
 
-	NOTE: Uses **offset** pagination:
-	- `skip` is the number of records to skip.
+	Filters, combined with AND:
+	- `author` and `genre` match exactly.
+	- `published_from` and `published_to` select an inclusive range of publication dates.
+
+	`sort` is one of `id` (default), `title`, `author` or `published_date`, prefixed with `-` for descending order.
+	Books with the same sort value are ordered by id.
+
+	Uses **cursor** pagination:
+	- `after` is the opaque `next_cursor` returned by the previous page. Omit it to get the first page.
 	- `limit` is the maximum number of records to return.
+
+	When there are more records, the response contains a `next_cursor` and a `Link` header with `rel="next"`.
+	A cursor is only valid with the same `sort` it was created with.
+
+	NOTE: `skip` is kept for legacy **offset** pagination only. It gets slower the deeper the page, so prefer `after`.
+
+	`fields` restricts the books to a sparse fieldset, e.g. `fields=title,author` to leave out the long `summary`.
+
+	Responses carry an `ETag` that changes whenever any book is written. Send it back in `If-None-Match` to get an
+	empty `304 Not Modified` response when nothing changed.
 	"""
-	books = await crud.get_books(session, skip=skip, limit=limit)
-	return [models.BookResponseModel.model_validate(book) for book in books]
+	if after is not None and skip:
+		raise HTTPException(status_code=400, detail="Use either `after` or `skip`, not both.")
+	sort_field = sort.removeprefix("-")
+	try:
+		book_fields = serializers.parse_fields(fields)
+		after_keys = pagination.decode_cursor(after) if after is not None else None
+		# NOTE only the requested fields are selected, plus the sort keys needed by the cursor
+		columns = dict.fromkeys((*book_fields, sort_field, "id"))
+		# NOTE fetch one extra row to know whether there is a next page
+		query = crud.build_books_query(
+			skip=skip, limit=limit + 1, after=after_keys, sort=sort, filters=filters, columns=list(columns)
+		)
+	except (exceptions.InvalidCursorError, exceptions.InvalidFieldsError) as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	# NOTE compared once the parameters are known to be valid, so that invalid requests never get a 304
+	# NOTE the counter is read before the page, so a write in between may at worst send a new page with an old tag
+	etag = conditional.make_etag(Book.__tablename__, await get_table_version(session, Book.__tablename__))
+	if conditional.is_not_modified(request, etag):
+		return conditional.not_modified(etag)
+	result = await crud.execute_listing(session, query, explain=get_app_settings().debug_query_plans)
+	rows = result.mappings().all()
+
+	# NOTE the rows are plain column values encoded straight to JSON, skipping the ORM entities, the response models
+	# and FastAPI's validation of the returned value, which dominate the cost of large pages
+	next_cursor = None
+	headers = {"ETag": etag}
+	if len(rows) > limit:
+		last = rows[limit - 1]
+		next_cursor = pagination.encode_cursor({sort_field: last[sort_field], "id": last["id"]})
+		next_url = request.url.remove_query_params("skip").include_query_params(after=next_cursor)
+		headers["Link"] = f'<{next_url}>; rel="next"'
+	content = serializers.dump_page(rows[:limit], next_cursor, book_fields)
+	return Response(content=content, media_type="application/json", headers=headers)
+
+
+@router.get(
+	"/search",
+	status_code=200,
+	responses={
+		400: {
+			"description": "Additional Response - Invalid search query or pagination cursor",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Search query must contain at least one word."},
+				}
+			},
+		},
+	},
+)
+async def search_books(
+	session: dependencies.SessionDep,
+	request: Request,
+	response: Response,
+	q: Annotated[str, Query(min_length=1, max_length=256)],
+	after: str | None = None,
+	limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = 100,
+) -> models.PageModel[models.BookSearchResultModel]:
+	"""Full-text search over the title, author and summary of the books.
+
+	- `q` matches books containing all of its words. End a word with `*` to match it as a prefix, e.g. `tolk*`.
+	- Results are ranked by relevance (lower `rank` is better), and matches in the title weigh more than in the
+	author, which weigh more than in the summary.
+	- `snippet` is an excerpt of the best matching column with the matched words wrapped in `<mark>` tags.
+
+	Paginated with `after` and `limit`, like `GET /books`.
+	"""
+	try:
+		after_keys = None
+		if after is not None:
+			cursor = pagination.decode_cursor(after)
+			rank = cursor.get("rank")
+			if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+				raise exceptions.InvalidCursorError(after)
+			# NOTE ranks are floats, an integer may not fit in SQLite otherwise
+			after_keys = (float(rank), cursor["id"])
+		rows = await crud.search_books(session, q, limit=limit + 1, after=after_keys)
+	except (exceptions.InvalidCursorError, exceptions.InvalidSearchQueryError) as e:
+		raise HTTPException(status_code=400, detail=str(e))
+
+	page = models.PageModel[models.BookSearchResultModel](
+		items=[
+			models.BookSearchResultModel(
+				**models.BookResponseModel.model_validate(book).model_dump(),
+				rank=rank,
+				snippet=snippet,
+			)
+			for book, rank, snippet in rows[:limit]
+		],
+	)
+	if len(rows) > limit:
+		last = page.items[-1]
+		page.next_cursor = pagination.encode_cursor({"rank": last.rank, "id": last.id})
+		next_url = request.url.include_query_params(after=page.next_cursor)
+		response.headers["Link"] = f'<{next_url}>; rel="next"'
+	return page
+
+
+@router.get(
+	"/export",
+	status_code=200,
+	response_class=StreamingResponse,
+	responses={
+		200: {
+			"description": "The whole catalog, ordered by id",
+			"content": {media_type: {} for media_type in export.MEDIA_TYPES.values()},
+		},
+	},
+)
+async def export_books(
+	export_format: Annotated[export.ExportFormat, Query(alias="format")] = "ndjson",
+) -> StreamingResponse:
+	"""Export the whole catalog as newline-delimited JSON (`ndjson`) or `csv`.
+
+	Rows are streamed from a server-side cursor as they are read, so the response starts right away and its memory
+	footprint does not depend on the size of the catalog. Prefer it to crawling `GET /books` for full syncs.
+	"""
+	return StreamingResponse(
+		content=export.export_books(export_format),
+		media_type=export.MEDIA_TYPES[export_format],
+		headers={"Content-Disposition": f'attachment; filename="books.{export_format}"'},
+	)
 
 
 @router.get(
 	"/{book_id}",
 	status_code=200,
+	response_model=models.BookResponseModel,
 	responses={
+		304: {"description": "Additional Response - The book did not change since the `If-None-Match` ETag"},
+		400: {
+			"description": "Additional Response - Invalid fields",
+			"model": dependencies.ExceptionModel,
+			"content": {
+				"application/json": {
+					"example": {"detail": "Unknown book fields: isbn."},
+				}
+			},
+		},
 		404: {
 			"description": "Additional Response - Book not found",
 			"model": dependencies.ExceptionModel,
@@ -67,14 +350,35 @@ async def get_books(
 )
 async def get_book(
 	session: dependencies.SessionDep,
+	cache: dependencies.BookCacheDep,
+	request: Request,
+	response: Response,
 	book_id: int,
-) -> models.BookResponseModel:
-	"""Retrieves a book by book id."""
+	fields: FieldsQuery = None,
+) -> models.BookResponseModel | Response:
+	"""Retrieves a book by book id.
+
+	`fields` restricts the book to a sparse fieldset, e.g. `fields=title,author` to leave out the long `summary`.
+
+	The response carries an `ETag` derived from the version of the book. Send it back in `If-None-Match` to get an
+	empty `304 Not Modified` response while the book is unchanged.
+	"""
 	try:
-		book = await crud.get_book(session, book_id)
-		return models.BookResponseModel.model_validate(book)
+		book_fields = serializers.parse_fields(fields)
+		book = await cache.get_book(session, book_id)
+	except exceptions.InvalidFieldsError as e:
+		raise HTTPException(status_code=400, detail=str(e))
 	except exceptions.BookNotFoundError as e:
 		raise HTTPException(status_code=404, detail=str(e))
+	etag = conditional.make_etag(book.id, book.version)
+	if conditional.is_not_modified(request, etag):
+		return conditional.not_modified(etag)
+	if book_fields != serializers.BOOK_FIELDS:
+		# NOTE the whole book comes from the cache anyway, so only the response is narrowed
+		content = serializers.dump_book(vars(book), book_fields)
+		return Response(content=content, media_type="application/json", headers={"ETag": etag})
+	response.headers["ETag"] = etag
+	return book
 
 
 @router.patch(
@@ -94,25 +398,33 @@ async def get_book(
 )
 async def update_book(
 	session: dependencies.SessionDep,
-	redis: dependencies.RedisDep,
+	publisher: dependencies.OutboxPublisherDep,
+	cache: dependencies.BookCacheDep,
 	user: dependencies.UserDep,
 	book_id: int,
 	book_patch: models.UpdateBookModel,
 ) -> models.BookResponseModel:
 	"""Partially update a book by id."""
 	try:
-		book = await crud.update_book(session, book_id, book_patch)
+		# NOTE subscribers filtering on the previous author or genre must learn that the book no longer matches
+		previous = []
+		if book_patch.model_fields_set & {"author", "genre"}:
+			previous.append(models.BookResponseModel.model_validate(await crud.get_book(session, book_id)))
+		book = await crud.update_book(session, book_id, book_patch, commit=False)
 		response = models.BookResponseModel.model_validate(book)
 
 		# NOTE include only the fields that were updated and the id
 		fields_to_keep = book_patch.model_fields_set.union({"id"})
-		await publish_event(
-			redis,
-			channel=REDIS_BOOK_CHANNEL,
+		await add_book_event(
+			session,
 			event_type="book_updated",
 			event_data=response.model_dump(mode="json", include=fields_to_keep),
 			username=user.username,
+			tags=book_tags([*previous, book], [book_id]),
 		)
+		await session.commit()
+		await cache.invalidate(book_id)
+		publisher.wake()
 		return response
 	except exceptions.BookNotFoundError as e:
 		raise HTTPException(status_code=404, detail=str(e))
@@ -136,19 +448,22 @@ async def update_book(
 async def delete_book(
 	book_id: int,
 	session: dependencies.SessionDep,
-	redis: dependencies.RedisDep,
+	publisher: dependencies.OutboxPublisherDep,
+	cache: dependencies.BookCacheDep,
 	user: dependencies.UserDep,
 ) -> None:
 	"""Delete a book by id."""
 	try:
-		book = await crud.get_book(session, book_id)
-		await crud.delete_book(session, book)
-		await publish_event(
-			redis,
-			channel=REDIS_BOOK_CHANNEL,
+		book = await crud.delete_book(session, book_id, commit=False)
+		await add_book_event(
+			session,
 			event_type="book_deleted",
 			event_data={"id": book_id},
 			username=user.username,
+			tags=book_tags([book], [book_id]),
 		)
+		await session.commit()
+		await cache.invalidate(book_id)
+		publisher.wake()
 	except exceptions.BookNotFoundError as e:
 		raise HTTPException(status_code=404, detail=str(e))
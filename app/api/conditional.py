@@ -0,0 +1,23 @@
+from fastapi import Request, Response
+
+
+def make_etag(*parts: object) -> str:
+	"""Build a strong ETag from the parts identifying a version of a resource."""
+	return '"' + ".".join(str(part) for part in parts) + '"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+	"""Whether the `If-None-Match` header of the request matches `etag`, i.e. the client already has this version.
+
+	`If-None-Match` uses the weak comparison, so a `W/` prefix on the client's tags is ignored.
+	"""
+	if_none_match = request.headers.get("if-none-match")
+	if if_none_match is None:
+		return False
+	tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+	return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+	"""An empty `304 Not Modified` response."""
+	return Response(status_code=304, headers={"ETag": etag})
@@ -1,28 +1,70 @@
 from typing import Annotated
 
 import redis.asyncio as aioredis
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPAuthorizationCredentials
 from jwt.exceptions import InvalidTokenError
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth import crud, exceptions
+from app.auth import exceptions
+from app.auth.cache import UserCache, get_user_cache
+from app.auth.revocation import RevocationList, get_revocation_list
 from app.auth.schemas import User
-from app.auth.security import bearer_scheme, decode_access_token
+from app.auth.security import bearer_scheme, decode_access_token, get_login_limiter
+from app.books.cache import BookCache, get_book_cache
+from app.core.config import AppSettings, get_app_settings
+from app.core.ratelimit import SlidingWindowLimiter
+from app.db.bus import EventBus, get_event_bus
 from app.db.connection import get_db
 from app.db.redis import get_redis
+from app.events.filters import EventFilter
+from app.events.hub import EventHub, get_event_hub
+from app.events.outbox import OutboxPublisher, get_outbox_publisher
 
 SessionDep = Annotated[AsyncSession, Depends(get_db)]
 JWTBearerDep = Annotated[HTTPAuthorizationCredentials, Depends(bearer_scheme)]
 RedisDep = Annotated[aioredis.Redis, Depends(get_redis)]
+BookCacheDep = Annotated[BookCache, Depends(get_book_cache)]
+UserCacheDep = Annotated[UserCache, Depends(get_user_cache)]
+LoginLimiterDep = Annotated[SlidingWindowLimiter, Depends(get_login_limiter)]
+SettingsDep = Annotated[AppSettings, Depends(get_app_settings)]
+RevocationListDep = Annotated[RevocationList, Depends(get_revocation_list)]
+EventHubDep = Annotated[EventHub, Depends(get_event_hub)]
+OutboxPublisherDep = Annotated[OutboxPublisher, Depends(get_outbox_publisher)]
+EventBusDep = Annotated[EventBus, Depends(get_event_bus)]
+
+
+async def get_event_filter(
+	book_id: Annotated[list[int] | None, Query()] = None,
+	author: Annotated[list[str] | None, Query()] = None,
+	genre: Annotated[list[str] | None, Query()] = None,
+	event: Annotated[list[str] | None, Query()] = None,
+) -> EventFilter | None:
+	"""Get the event filter of a subscription from its query parameters, `None` to receive every event."""
+	event_filter = EventFilter(book_id=book_id, author=author, genre=genre, event=event)
+	return event_filter if event_filter.constraints() else None
+
+
+EventFilterDep = Annotated[EventFilter | None, Depends(get_event_filter)]
 
 
 async def get_current_user(
 	session: Annotated[AsyncSession, Depends(get_db)],
 	credentials: Annotated[HTTPAuthorizationCredentials, Depends(bearer_scheme)],
+	cache: Annotated[UserCache, Depends(get_user_cache)],
+	settings: Annotated[AppSettings, Depends(get_app_settings)],
+	redis: Annotated[aioredis.Redis, Depends(get_redis)],
+	revocations: Annotated[RevocationList, Depends(get_revocation_list)],
 ) -> User:
-	"""Get current user from JWT token."""
+	"""Get current user from JWT token.
+
+	Revoked tokens are rejected, which only costs a Redis lookup when the in-memory revocation filter reports a
+	possible hit.
+
+	Users are looked up through the user cache. In stateless mode the lookup is skipped altogether and a user
+	is built from the claims of the token, which then stays valid until it expires even if the user is deleted.
+	"""
 	credentials_exception = HTTPException(
 		status_code=status.HTTP_401_UNAUTHORIZED,
 		detail="Could not validate credentials",
@@ -35,8 +77,15 @@ async def get_current_user(
 		username = payload.get("sub")
 	except InvalidTokenError:
 		raise credentials_exception
+	if not isinstance(username, str):
+		raise credentials_exception
+	jti = payload.get("jti")
+	if isinstance(jti, str) and await revocations.is_revoked(redis, jti):
+		raise credentials_exception
+	if settings.auth_stateless:
+		return User(username=username)
 	try:
-		user = await crud.get_user(session, username=username)
+		user = await cache.get_user(session, username)
 	except exceptions.UserNotFoundError:
 		raise credentials_exception
 	return user
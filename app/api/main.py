@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 
-from app.api import auth, books, sse
+from app.api import auth, books, metrics, sse, websocket
 
 api_router = APIRouter()
 api_router.include_router(auth.router)
 api_router.include_router(router=books.router)
 api_router.include_router(sse.router)
+api_router.include_router(websocket.router)
+api_router.include_router(metrics.router)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+
+from app.api import dependencies
+from app.core import metrics
+
+router = APIRouter(
+	prefix="/metrics",
+	tags=["metrics"],
+	dependencies=[Depends(dependencies.get_current_user)],
+)
+
+
+@router.get(
+	"",
+	status_code=200,
+	summary="Get runtime metrics of this worker",
+)
+async def get_metrics() -> dict[str, dict[str, int | float]]:
+	"""Returns the counters of the caches, pools and queues of the worker that serves the request.
+
+	Each worker keeps its own counters, so with multiple workers consecutive requests may return different values.
+	Requires authentication, as the counters reveal the load of the worker."""
+	return metrics.collect()
@@ -1,63 +1,103 @@
-import asyncio
-import json
-from typing import AsyncGenerator
+from typing import Annotated, Any, AsyncGenerator
 
-import redis.asyncio as aioredis
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Header, HTTPException
 from sse_starlette.sse import EventSourceResponse
 
 from app.api import dependencies
+from app.db.bus import EventBus
+from app.db.redis import parse_stream_id
+from app.events.filters import EventFilter
+from app.events.hub import EventHub, OverflowPolicy, SharedEvent
 
 router = APIRouter(
 	prefix="/sse",
 	tags=["sse"],
 )
 
-# TODO move to app settings later
-STREAM_DELAY = 0.1  # second
+
+async def replay_events(bus: EventBus, channel: str, last_event_id: str) -> AsyncGenerator[dict[str, Any], None]:
+	"""Yield the events stored after `last_event_id`, preceded by a `resync` event if some may have been trimmed."""
+	first_id = await bus.first_stream_id(channel)
+	if first_id is not None and parse_stream_id(first_id) > parse_stream_id(last_event_id):
+		# NOTE the stream was trimmed past the last event of the client, which has to fetch the current state again
+		yield {"event": "resync", "data": {"last_event_id": last_event_id}}
+	async for event in bus.read_stream(channel, after_id=last_event_id):
+		yield event
 
 
 async def event_generator(
-	redis: aioredis.Redis,
+	hub: EventHub,
 	channel: str,
-	request: Request,
-) -> AsyncGenerator[str, None]:
-	pubsub = redis.pubsub()
-	await pubsub.subscribe(channel)
-
-	try:
-		while True:
-			if await request.is_disconnected():
-				break
-
-			message = await pubsub.get_message(ignore_subscribe_messages=True)
-			if message:
-				# TODO improve message handling
-				yield json.loads(message["data"])
-
-			await asyncio.sleep(STREAM_DELAY)
-	except asyncio.CancelledError:
-		raise
-	finally:
-		await pubsub.unsubscribe(channel)
-		await pubsub.close()
-		await redis.close()
+	max_size: int,
+	policy: OverflowPolicy,
+	bus: EventBus | None = None,
+	last_event_id: str | None = None,
+	event_filter: EventFilter | None = None,
+) -> AsyncGenerator[bytes, None]:
+	"""Yield the ready-to-send frames of the events of `channel` for one client.
+
+	Live events are encoded once by the hub for all of its clients, only replayed events are encoded here."""
+	# NOTE waits on the client's buffer until the hub broadcasts an event, and is cancelled when the client
+	# disconnects. Ends when the client falls too far behind with the `disconnect` policy.
+	async with hub.subscribe(channel, max_size, policy, event_filter) as subscription:
+		# NOTE subscribed before replaying, so that events published during the replay are buffered, not missed
+		last_id = parse_stream_id(last_event_id) if last_event_id else None
+		if bus is not None and last_event_id:
+			async for event in replay_events(bus, channel, last_event_id):
+				if "id" in event:
+					last_id = parse_stream_id(event["id"])
+				if event_filter is None or event["event"] == "resync" or event_filter.matches(event):
+					yield SharedEvent(event).sse_frame
+		async for shared in subscription:
+			if "id" in shared.event and last_id is not None:
+				event_id = parse_stream_id(shared.event["id"])
+				if event_id <= last_id:
+					continue
+				last_id = event_id
+			yield shared.sse_frame
 
 
 @router.get(
 	"/updates/{channel}",
 	status_code=200,
 	summary="Get update stream from channel",
+	responses={400: {"description": "Additional Response - Invalid `Last-Event-ID`"}},
 )
 async def sse_updates(
-	redis: dependencies.RedisDep,
+	hub: dependencies.EventHubDep,
+	bus: dependencies.EventBusDep,
+	settings: dependencies.SettingsDep,
+	event_filter: dependencies.EventFilterDep,
 	channel: str,
-	request: Request,
+	last_event_id: Annotated[str | None, Header()] = None,
 ) -> EventSourceResponse:
-	"""This endpoint provides a server-sent events (SSE) stream of real-time updates from a specified Redis channel.
-	
-	Clients can subscribe to this stream to receive updates as they occur."""
+	"""This endpoint provides a server-sent events (SSE) stream of real-time updates from a specified channel.
+
+	Clients can subscribe to this stream to receive updates as they occur. Events of channels stored in a stream,
+	such as `books` when `BOOK_EVENTS_STREAM_MAX_LEN` is set, carry an `id`. Clients that reconnect with
+	its value in the `Last-Event-ID` header first receive the events they missed, or a `resync` event if those are
+	no longer stored.
+
+	Clients that fall behind are handled according to `SSE_OVERFLOW_POLICY`: their oldest events are dropped, they
+	are disconnected, or their pending events of the same book are merged into one.
+
+	Clients only receive the events matching the `book_id`, `author`, `genre` and `event` (type) query parameters
+	they give, e.g. `?author=Tolkien&author=Herbert&event=book_updated`. Use `/ws/updates/{channel}` to change
+	filters without reconnecting."""
+	if last_event_id is not None:
+		try:
+			parse_stream_id(last_event_id)
+		except ValueError:
+			raise HTTPException(status_code=400, detail=f"Invalid Last-Event-ID '{last_event_id}'.")
 	return EventSourceResponse(
-		content=event_generator(redis, channel, request),
+		content=event_generator(
+			hub,
+			channel,
+			max_size=settings.sse_queue_size,
+			policy=settings.sse_overflow_policy,
+			bus=bus,
+			last_event_id=last_event_id,
+			event_filter=event_filter,
+		),
 		send_timeout=30,  # seconds
 	)
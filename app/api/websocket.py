@@ -0,0 +1,79 @@
+import asyncio
+from contextlib import suppress
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+
+from app.api import dependencies
+from app.events.filters import EventFilter
+from app.events.hub import EventHub, Subscription
+
+router = APIRouter(
+	prefix="/ws",
+	tags=["websocket"],
+)
+
+
+async def send_events(websocket: WebSocket, subscription: Subscription) -> None:
+	"""Send the events of `subscription` until it ends, which only happens with the `disconnect` policy."""
+	async for event in subscription:
+		await websocket.send_text(event.ws_message)
+
+
+async def receive_filters(websocket: WebSocket, hub: EventHub, subscription: Subscription) -> None:
+	"""Replace the filter of `subscription` with every filter the client sends, until it disconnects."""
+	while True:
+		message = await websocket.receive()
+		if message["type"] == "websocket.disconnect":
+			raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE), message.get("reason"))
+		if message.get("text") is None:
+			await websocket.send_json({"event": "error", "data": {"detail": "Filters must be sent as text messages."}})
+			continue
+		try:
+			event_filter = EventFilter.model_validate_json(message["text"])
+		except ValidationError as e:
+			errors = e.errors(include_url=False, include_context=False, include_input=False)
+			await websocket.send_json({"event": "error", "data": {"detail": [dict(error) for error in errors]}})
+			continue
+		hub.set_filter(subscription, event_filter)
+		await websocket.send_json({"event": "filter", "data": event_filter.model_dump(exclude_none=True)})
+
+
+@router.websocket("/updates/{channel}")
+async def websocket_updates(
+	websocket: WebSocket,
+	hub: dependencies.EventHubDep,
+	settings: dependencies.SettingsDep,
+	event_filter: dependencies.EventFilterDep,
+	channel: str,
+) -> None:
+	"""This endpoint streams the events of a channel over a WebSocket, as JSON messages with an `event` and
+	its `data`, like `/sse/updates/{channel}`.
+
+	The initial filter is given with the same query parameters as for server-sent events. Clients change it at any
+	time by sending a new filter, e.g. `{"author": ["Tolkien"], "event": ["book_updated"]}`, or `{}` to receive every
+	event, which is acknowledged with a `filter` message, or answered with an `error` message if it is invalid or
+	not sent as text.
+
+	Clients that fall behind are handled according to `WS_OVERFLOW_POLICY`, and closed with code 1013 (try again
+	later) by the `disconnect` policy."""
+	await websocket.accept()
+	max_size, policy = settings.ws_queue_size, settings.ws_overflow_policy
+	async with hub.subscribe(channel, max_size, policy, event_filter) as subscription:
+		tasks = {
+			asyncio.create_task(send_events(websocket, subscription)),
+			asyncio.create_task(receive_filters(websocket, hub, subscription)),
+		}
+		try:
+			done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+		finally:
+			# NOTE not awaited when the request is cancelled, the server would cancel the wait too
+			for task in tasks:
+				task.cancel()
+		if pending:
+			await asyncio.wait(pending)
+		for task in done:
+			with suppress(WebSocketDisconnect):
+				task.result()
+	if subscription.disconnected:
+		await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
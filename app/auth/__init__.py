@@ -1,8 +1,10 @@
-from . import crud, exceptions, models, schemas, security
+from . import cache, crud, exceptions, models, revocation, schemas, security
 
 __all__ = [
+	"cache",
 	"crud",
 	"models",
+	"revocation",
 	"schemas",
 	"security",
 	"exceptions",
@@ -0,0 +1,94 @@
+import hashlib
+from functools import lru_cache
+from typing import Any, Literal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import crud, exceptions
+from app.auth.schemas import User
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import get_app_settings
+
+REDIS_USER_CHANNEL = "users"
+INVALIDATING_EVENTS = {"user_created", "user_updated", "user_deleted"}
+
+
+def user_key(username: str) -> str:
+	"""Key of a user in the cache and in the events of the `users` channel.
+
+	A digest rather than the username itself, so that user events do not disclose usernames to channel subscribers.
+	"""
+	return hashlib.sha256(username.encode("utf-8")).hexdigest()
+
+
+class UserCache:
+	"""Cache of the users authenticated by `get_current_user`, in front of `crud.get_user`.
+
+	Unknown usernames are cached too (as `False`) for `negative_ttl` seconds, so that tokens of deleted users do not
+	cost a query per request. Workers drop their copy of a user when they receive one of its events on the `users`
+	channel (see `handle_event`), and `ttl` bounds how long a user outlives a change whose event was missed.
+	"""
+
+	def __init__(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+		self.local = TTLCache[str, User | Literal[False]](max_size=max_size, ttl=ttl)
+		self.negative_ttl = negative_ttl
+		# NOTE bumped on every invalidation so that a read racing with a write does not cache the stale row
+		self._generation = 0
+
+	async def get_user(self, db: AsyncSession, username: str) -> User:
+		"""Get a user by username, from the cache when possible.
+
+		Raises:
+			exceptions.UserNotFoundError
+		"""
+		key = user_key(username)
+		user = self.local.get(key)
+		if user is False:
+			raise exceptions.UserNotFoundError(username)
+		if user is not None:
+			return user
+
+		generation = self._generation
+		try:
+			user = await crud.get_user(db, username)
+		except exceptions.UserNotFoundError:
+			if generation == self._generation:
+				self.local.set(key, False, ttl=self.negative_ttl)
+			raise
+		# NOTE a copy, the loaded user stays bound to the request's session which expires it on rollback
+		user = User(id=user.id, username=user.username, password_hash=user.password_hash)
+		if generation == self._generation:
+			self.local.set(key, user)
+		return user
+
+	def invalidate(self, username: str) -> None:
+		self.invalidate_key(user_key(username))
+
+	def invalidate_key(self, key: str) -> None:
+		self._generation += 1
+		self.local.pop(key)
+
+	def clear(self) -> None:
+		self._generation += 1
+		self.local.clear()
+
+	def handle_event(self, event: dict[str, Any]) -> None:
+		"""Drop the cached user changed by a `users` channel event."""
+		if event.get("event") in INVALIDATING_EVENTS:
+			self.invalidate_key(event["data"]["user"])
+
+	def stats(self) -> dict[str, int]:
+		return self.local.stats()
+
+
+@lru_cache
+def get_user_cache() -> UserCache:
+	settings = get_app_settings()
+	cache = UserCache(
+		max_size=settings.user_cache_max_size,
+		ttl=settings.user_cache_ttl_seconds,
+		negative_ttl=settings.user_cache_negative_ttl_seconds,
+	)
+	metrics.register("user_cache", cache.stats)
+	return cache
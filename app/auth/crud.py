@@ -1,4 +1,4 @@
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -10,16 +10,19 @@ async def create_user(
 	db: AsyncSession,
 	username: str,
 	password_hash: str,
+	commit: bool = True,
 ) -> User:
 	user = User(username=username, password_hash=password_hash)
 	try:
 		db.add(user)
-		await db.commit()
-		await db.refresh(user)
-		return user
+		await db.flush()
 	except IntegrityError:
 		await db.rollback()
 		raise exceptions.UserAlreadyExistsError(username)
+	if commit:
+		await db.commit()
+		await db.refresh(user)
+	return user
 
 
 async def get_user(db: AsyncSession, username: str) -> User:
@@ -28,3 +31,8 @@ async def get_user(db: AsyncSession, username: str) -> User:
 	if not user:
 		raise exceptions.UserNotFoundError(username)
 	return user
+
+
+async def update_password_hash(db: AsyncSession, username: str, password_hash: str) -> None:
+	await db.execute(update(User).where(User.username == username).values(password_hash=password_hash))
+	await db.commit()
@@ -12,6 +12,23 @@ class UserNotFoundError(UserError):
 		self.username = username
 
 
+class InvalidRefreshTokenError(UserError):
+	"""Exception raised when a refresh token is invalid, expired, revoked or already used."""
+
+	def __init__(self) -> None:
+		super().__init__("Invalid refresh token.")
+
+
+class RefreshTokenUnavailableError(UserError):
+	"""Exception raised when refresh tokens cannot be stored, checked or revoked, because Redis is unavailable.
+
+	Also raised when an access token cannot be revoked, for the same reason.
+	"""
+
+	def __init__(self) -> None:
+		super().__init__("Refresh tokens are unavailable, try again later.")
+
+
 class UserAlreadyExistsError(UserError):
 	"""Exception raised when a user already exists."""
 
@@ -5,6 +5,13 @@ from typing_extensions import Annotated
 class Token(BaseModel):
 	access_token: str
 	token_type: str
+	refresh_token: str | None = None
+
+
+class RefreshTokenModel(BaseModel):
+	refresh_token: str
+
+	model_config = ConfigDict(extra="forbid")
 
 
 def password_validator(password: str) -> str:
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import math
+from functools import lru_cache
+from typing import Any
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.auth import exceptions
+from app.core import metrics
+from app.core.bloom import BloomFilter
+from app.core.config import get_app_settings
+from app.db.bus import get_event_bus, publish_event
+
+logger = logging.getLogger(__name__)
+
+REDIS_TOKEN_CHANNEL = "tokens"
+REVOKED_KEY_PREFIX = "auth:revoked:"
+
+
+class RevocationList:
+	"""Ids (`jti`) of the revoked access tokens that did not expire yet.
+
+	Redis is the source of truth: one key per revoked token, expiring with the token. Each worker keeps a Bloom filter
+	of the revoked ids, kept in sync by the `token_revoked` events of the `tokens` channel, so that checking a token
+	costs no round trip unless the filter reports a possible hit. The filter is rebuilt from Redis whenever the
+	subscription is (re)established and every `refresh_forever` interval, which also drops the expired ids.
+	"""
+
+	def __init__(self, capacity: int, error_rate: float) -> None:
+		self.capacity = capacity
+		self.error_rate = error_rate
+		self.filter = BloomFilter(capacity, error_rate)
+		self.possible_hits = 0
+		self.false_positives = 0
+		self.redis_errors = 0
+		# NOTE ids revoked while the filter is being rebuilt, which the scan may have missed
+		self._revoked_during_reload: list[str] | None = None
+
+	@staticmethod
+	def _redis_key(jti: str) -> str:
+		return f"{REVOKED_KEY_PREFIX}{jti}"
+
+	def _add(self, jti: str) -> None:
+		if jti not in self.filter:
+			self.filter.add(jti)
+		if self._revoked_during_reload is not None:
+			self._revoked_during_reload.append(jti)
+
+	async def revoke(self, redis: aioredis.Redis, jti: str, expires_in: float) -> None:
+		"""Revoke a token that expires in `expires_in` seconds, in every worker.
+
+		Raises:
+			exceptions.RefreshTokenUnavailableError
+		"""
+		if expires_in <= 0:
+			return
+		try:
+			await redis.set(self._redis_key(jti), 1, ex=math.ceil(expires_in))
+			self._add(jti)
+			await publish_event(
+				get_event_bus(), channel=REDIS_TOKEN_CHANNEL, event_type="token_revoked", event_data={"jti": jti}
+			)
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not revoke token %s in Redis: %s", jti, e)
+			raise exceptions.RefreshTokenUnavailableError()
+
+	async def is_revoked(self, redis: aioredis.Redis, jti: str) -> bool:
+		"""Whether a token was revoked. Fails closed: a possible hit that cannot be checked counts as revoked."""
+		if jti not in self.filter:
+			return False
+		self.possible_hits += 1
+		try:
+			revoked = bool(await redis.exists(self._redis_key(jti)))
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not check the revocation of token %s in Redis: %s", jti, e)
+			return True
+		if not revoked:
+			self.false_positives += 1
+		return revoked
+
+	def handle_event(self, event: dict[str, Any]) -> None:
+		"""Add the token revoked by a `tokens` channel event to the filter."""
+		if event.get("event") == "token_revoked":
+			self._add(event["data"]["jti"])
+
+	async def reload(self, redis: aioredis.Redis) -> None:
+		"""Rebuild the filter from the revoked tokens in Redis."""
+		self._revoked_during_reload = []
+		try:
+			rebuilt = BloomFilter(self.capacity, self.error_rate)
+			async for key in redis.scan_iter(match=f"{REVOKED_KEY_PREFIX}*", count=1000):
+				rebuilt.add(key.removeprefix(REVOKED_KEY_PREFIX))
+			for jti in self._revoked_during_reload:
+				rebuilt.add(jti)
+			self.filter = rebuilt
+		finally:
+			self._revoked_during_reload = None
+		if self.filter.is_full:
+			logger.warning("%s revoked tokens exceed the capacity of the revocation filter", self.filter.count)
+
+	async def refresh_forever(self, redis: aioredis.Redis, interval: float) -> None:
+		"""Rebuild the filter every `interval` seconds until cancelled."""
+		while True:
+			await asyncio.sleep(interval)
+			try:
+				await self.reload(redis)
+			except RedisError as e:
+				self.redis_errors += 1
+				logger.warning("Could not rebuild the revocation filter: %s", e)
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"size": self.filter.count,
+			"capacity": self.capacity,
+			"possible_hits": self.possible_hits,
+			"false_positives": self.false_positives,
+			"redis_errors": self.redis_errors,
+		}
+
+
+@lru_cache
+def get_revocation_list() -> RevocationList:
+	settings = get_app_settings()
+	revocations = RevocationList(
+		capacity=settings.revocation_filter_capacity,
+		error_rate=settings.revocation_filter_error_rate,
+	)
+	metrics.register("token_revocation", revocations.stats)
+	return revocations
@@ -1,15 +1,37 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Any
 
 import bcrypt
 import jwt
+import redis.asyncio as aioredis
 from fastapi.security import HTTPBearer
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth import crud
-from app.core import config
+from app.auth import crud, exceptions
+from app.core import config, metrics
+from app.core.cache import TTLCache
+from app.core.executor import BoundedExecutor, ExecutorBusyError
+from app.core.ratelimit import SlidingWindowLimiter
+
+logger = logging.getLogger(__name__)
 
 ALGORITHM = "HS256"
+# NOTE the cost of `bcrypt.gensalt()`, used until the cost is calibrated
+BCRYPT_DEFAULT_ROUNDS = 12
+CALIBRATION_SAMPLES = 3
+# NOTE the cost calibrated by the first worker, adopted by the others so that they all hash with the same cost
+BCRYPT_ROUNDS_KEY = "auth:bcrypt_rounds"
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+REFRESH_TOKEN_KEY_PREFIX = "auth:refresh:"
 bearer_scheme = HTTPBearer(
 	bearerFormat="JWT",
 	description="Authentication scheme for JWT tokens.\n\n"
@@ -19,21 +41,159 @@ bearer_scheme = HTTPBearer(
 )
 
 
+@lru_cache
+def get_signing_key() -> str:
+	return config.get_app_settings().jwt_secret.get_secret_value()
+
+
+@lru_cache
+def get_token_cache() -> TTLCache[str, dict[str, Any]]:
+	"""Cache of the claims of verified tokens, keyed by a digest of the token. Entries expire with their token."""
+	cache = TTLCache[str, dict[str, Any]](max_size=config.get_app_settings().token_cache_max_size, ttl=0)
+	metrics.register("token_cache", cache.stats)
+	return cache
+
+
+@lru_cache
+def get_password_executor() -> BoundedExecutor:
+	"""Thread pool running bcrypt, which takes tens of milliseconds per call and would block the event loop."""
+	settings = config.get_app_settings()
+	executor = BoundedExecutor(
+		"bcrypt",
+		max_workers=settings.password_hash_workers,
+		max_queue=settings.password_hash_max_queue,
+	)
+	metrics.register("password_hashing", executor.stats)
+	return executor
+
+
+@lru_cache
+def get_login_limiter() -> SlidingWindowLimiter:
+	"""Rate limiter of the login attempts, checked before any password is hashed."""
+	settings = config.get_app_settings()
+	limiter = SlidingWindowLimiter(window=settings.login_rate_limit_window_seconds, prefix="ratelimit:login")
+	metrics.register("login_rate_limit", limiter.stats)
+	return limiter
+
+
 async def authenticate_user(session: AsyncSession, username: str, password: str) -> bool:
+	"""Check the password of a user.
+
+	Raises:
+		exceptions.UserNotFoundError
+		ExecutorBusyError: too many passwords are being checked already
+	"""
 	user = await crud.get_user(session, username)
+	password_hash = user.password_hash
+	# NOTE end the read transaction to give the connection back to the pool while the password is checked,
+	# otherwise a burst of logins exhausts the pool for every other request
+	await session.rollback()
+	valid = await get_password_executor().run(verify_password, password, password_hash)
+	# NOTE never lowered: a cost above the current one was picked on purpose, or by a faster machine
+	if valid and get_hash_rounds(password_hash) < get_bcrypt_rounds():
+		await _rehash_password(session, username, password)
+	return valid
+
+
+async def _rehash_password(session: AsyncSession, username: str, password: str) -> None:
+	"""Replace the hash of a password with one of the higher current bcrypt cost, now that the password is known."""
+	try:
+		password_hash = await hash_password(password)
+	except ExecutorBusyError:
+		# NOTE not worth failing the login for, it is retried on the next one
+		logger.info("Skipped rehashing the password of user '%s', the password thread pool is busy", username)
+		return
+	await crud.update_password_hash(session, username, password_hash)
+
+
+async def hash_password(password: str) -> str:
+	"""`get_password_hash` on the password thread pool.
+
+	Raises:
+		ExecutorBusyError: too many passwords are being hashed already
+	"""
+	return await get_password_executor().run(get_password_hash, password)
+
+
+def verify_password(password: str, password_hash: str) -> bool:
 	return bcrypt.checkpw(
 		password=password.encode("utf-8"),
-		hashed_password=user.password_hash.encode("utf-8"),
+		hashed_password=password_hash.encode("utf-8"),
 	)
 
 
 def get_password_hash(password: str) -> str:
 	return bcrypt.hashpw(
 		password=password.encode("utf-8"),
-		salt=bcrypt.gensalt(),
+		salt=bcrypt.gensalt(rounds=get_bcrypt_rounds()),
 	).decode("utf-8")
 
 
+_calibrated_rounds: int | None = None
+
+
+def get_bcrypt_rounds() -> int:
+	"""The bcrypt cost of new password hashes: configured, calibrated at startup, or the bcrypt default."""
+	return config.get_app_settings().bcrypt_rounds or _calibrated_rounds or BCRYPT_DEFAULT_ROUNDS
+
+
+def get_hash_rounds(password_hash: str) -> int:
+	"""The bcrypt cost of a hash, e.g. 12 for `$2b$12$...`."""
+	return int(password_hash.split("$")[2])
+
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+	"""Find the highest bcrypt cost whose hash takes at most `target_ms` on this machine, within the given bounds.
+
+	Every round doubles the hash time, so only `min_rounds` is measured and the other costs are extrapolated.
+	"""
+	salt = bcrypt.gensalt(rounds=min_rounds)
+	elapsed_ms = math.inf
+	for _ in range(CALIBRATION_SAMPLES):
+		started = time.perf_counter()
+		bcrypt.hashpw(b"calibration", salt)
+		elapsed_ms = min(elapsed_ms, (time.perf_counter() - started) * 1000)
+	rounds = min_rounds
+	while rounds < max_rounds and elapsed_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+		rounds += 1
+	return rounds
+
+
+async def calibrate_password_hashing(redis: aioredis.Redis) -> int:
+	"""Calibrate the bcrypt cost to `bcrypt_target_ms`, unless `bcrypt_rounds` is configured, and return it.
+
+	The cost is calibrated once and stored in Redis, and the workers started later adopt it: costs calibrated by each
+	worker would differ with timing noise. Delete `BCRYPT_ROUNDS_KEY` to calibrate again, e.g. on new hardware.
+	"""
+	global _calibrated_rounds
+	settings = config.get_app_settings()
+	if settings.bcrypt_rounds is not None:
+		return settings.bcrypt_rounds
+	try:
+		stored = await redis.get(BCRYPT_ROUNDS_KEY)
+	except RedisError as e:
+		logger.warning("Could not read the calibrated bcrypt cost from Redis, calibrating it locally: %s", e)
+		stored = None
+	if stored is not None:
+		_calibrated_rounds = int(stored)
+		return _calibrated_rounds
+	rounds = await asyncio.to_thread(
+		calibrate_bcrypt_rounds,
+		settings.bcrypt_target_ms,
+		settings.bcrypt_min_rounds,
+		settings.bcrypt_max_rounds,
+	)
+	logger.info("Calibrated bcrypt to %s rounds for %sms hashes", rounds, settings.bcrypt_target_ms)
+	try:
+		# NOTE another worker may have stored its cost in the meantime, which wins
+		await redis.set(BCRYPT_ROUNDS_KEY, rounds, nx=True)
+		rounds = int(await redis.get(BCRYPT_ROUNDS_KEY) or rounds)
+	except RedisError as e:
+		logger.warning("Could not store the calibrated bcrypt cost in Redis: %s", e)
+	_calibrated_rounds = rounds
+	return rounds
+
+
 def create_access_token(subject: str, expires_in_minutes: int | None = None) -> str:
 	settings = config.get_app_settings()
 	now = datetime.now(timezone.utc)
@@ -46,19 +206,108 @@ def create_access_token(subject: str, expires_in_minutes: int | None = None) ->
 		"sub": subject,
 		"iat": now,
 		"exp": expire,
+		"jti": uuid.uuid4().hex,
+		"type": ACCESS_TOKEN_TYPE,
 	}
 	encoded_jwt = jwt.encode(
 		payload=to_encode,
-		key=settings.jwt_secret.get_secret_value(),
+		key=get_signing_key(),
 		algorithm=ALGORITHM,
 	)
 	return encoded_jwt
 
 
 def decode_access_token(token: str) -> Any:
+	"""Verify a token and return its claims.
+
+	Clients send the same token with every request, so verified tokens are cached until they expire.
+
+	Raises:
+		jwt.exceptions.InvalidTokenError
+	"""
+	cache = get_token_cache()
+	key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+	claims = cache.get(key)
+	if claims is None:
+		claims = jwt.decode(
+			jwt=token,
+			key=get_signing_key(),
+			algorithms=[ALGORITHM],
+		)
+		if claims.get("type", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE:
+			raise jwt.InvalidTokenError("Not an access token")
+		if "exp" in claims:
+			cache.set(key, claims, ttl=claims["exp"] - time.time())
+	return dict(claims)
+
+
+def _refresh_token_key(jti: str) -> str:
+	return f"{REFRESH_TOKEN_KEY_PREFIX}{jti}"
+
+
+async def issue_refresh_token(redis: aioredis.Redis, subject: str) -> str:
+	"""Create a refresh token and store it in Redis until it expires.
+
+	Raises:
+		exceptions.RefreshTokenUnavailableError
+	"""
 	settings = config.get_app_settings()
-	return jwt.decode(
-		jwt=token,
-		key=settings.jwt_secret.get_secret_value(),
-		algorithms=[ALGORITHM],
-	)
+	now = datetime.now(timezone.utc)
+	expires_in = timedelta(days=settings.refresh_token_expire_days)
+	jti = uuid.uuid4().hex
+	to_encode = {
+		"sub": subject,
+		"iat": now,
+		"exp": now + expires_in,
+		"jti": jti,
+		"type": REFRESH_TOKEN_TYPE,
+	}
+	try:
+		await redis.set(_refresh_token_key(jti), subject, ex=expires_in)
+	except RedisError as e:
+		logger.warning("Could not store a refresh token in Redis: %s", e)
+		raise exceptions.RefreshTokenUnavailableError()
+	return jwt.encode(payload=to_encode, key=get_signing_key(), algorithm=ALGORITHM)
+
+
+async def redeem_refresh_token(redis: aioredis.Redis, token: str) -> str:
+	"""Consume a refresh token and return its subject. Each refresh token can only be redeemed once.
+
+	Raises:
+		exceptions.InvalidRefreshTokenError
+		exceptions.RefreshTokenUnavailableError
+	"""
+	jti = _decode_refresh_token(token)["jti"]
+	try:
+		subject: str | None = await redis.getdel(_refresh_token_key(jti))
+	except RedisError as e:
+		logger.warning("Could not redeem a refresh token in Redis: %s", e)
+		raise exceptions.RefreshTokenUnavailableError()
+	if subject is None:
+		raise exceptions.InvalidRefreshTokenError()
+	return subject
+
+
+async def revoke_refresh_token(redis: aioredis.Redis, token: str) -> None:
+	"""Delete a refresh token from Redis.
+
+	Raises:
+		exceptions.InvalidRefreshTokenError
+		exceptions.RefreshTokenUnavailableError
+	"""
+	jti = _decode_refresh_token(token)["jti"]
+	try:
+		await redis.delete(_refresh_token_key(jti))
+	except RedisError as e:
+		logger.warning("Could not revoke a refresh token in Redis: %s", e)
+		raise exceptions.RefreshTokenUnavailableError()
+
+
+def _decode_refresh_token(token: str) -> Any:
+	try:
+		claims = jwt.decode(jwt=token, key=get_signing_key(), algorithms=[ALGORITHM])
+	except jwt.InvalidTokenError:
+		raise exceptions.InvalidRefreshTokenError()
+	if claims.get("type") != REFRESH_TOKEN_TYPE or "jti" not in claims:
+		raise exceptions.InvalidRefreshTokenError()
+	return claims
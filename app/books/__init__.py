@@ -1,8 +1,12 @@
-from . import crud, exceptions, models, schemas
+from . import cache, crud, exceptions, export, models, pagination, schemas, serializers
 
 __all__ = [
+	"cache",
 	"crud",
 	"exceptions",
+	"export",
 	"models",
+	"pagination",
 	"schemas",
+	"serializers",
 ]
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any
+
+import redis.asyncio as aioredis
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.books import crud
+from app.books.models import BookResponseModel
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import get_app_settings
+from app.db.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+INVALIDATING_EVENTS = {"book_updated", "book_deleted"}
+
+
+class BookCache:
+	"""Read-through cache in front of `crud.get_book`.
+
+	Books are looked up in an in-process LRU first, then in the optional shared Redis tier, and only then in the
+	database. Writers call `invalidate` once committed, and every worker drops its copies when it receives the
+	`book_updated` or `book_deleted` event of the book (see `handle_event`). Rows read while the book was invalidated
+	in this worker are returned but not cached, in either tier.
+	"""
+
+	def __init__(self, max_size: int, ttl: float, shared: bool = False) -> None:
+		self.local = TTLCache[int, BookResponseModel](max_size=max_size, ttl=ttl)
+		self.shared = shared
+		self.ttl = ttl
+		self.redis_hits = 0
+		self.redis_misses = 0
+		self.redis_errors = 0
+		# NOTE bumped on every invalidation so that a read racing with a write does not cache the stale row
+		self._generation = 0
+		# NOTE deletions of the shared tier started by `handle_event`, referenced until they are done
+		self._deletions: set[asyncio.Task[None]] = set()
+
+	@property
+	def redis(self) -> aioredis.Redis | None:
+		return get_redis_client() if self.shared else None
+
+	@staticmethod
+	def _redis_key(book_id: int) -> str:
+		return f"books:cache:{book_id}"
+
+	async def get_book(self, db: AsyncSession, book_id: int) -> BookResponseModel:
+		"""Get a book by ID, from the cache when possible.
+
+		Raises:
+			exceptions.BookNotFoundError
+		"""
+		book = self.local.get(book_id)
+		if book is not None:
+			return book
+
+		generation = self._generation
+		book = await self._get_shared(book_id)
+		if book is None:
+			book = BookResponseModel.model_validate(await crud.get_book(db, book_id))
+			if generation == self._generation:
+				await self._set_shared(book)
+		if generation == self._generation:
+			self.local.set(book_id, book)
+		return book
+
+	async def invalidate(self, book_id: int) -> None:
+		"""Drop a book from the local and the shared tier. Called by the worker that changed the book."""
+		self.invalidate_local(book_id)
+		await self._delete_shared(book_id)
+
+	def invalidate_local(self, book_id: int) -> None:
+		self._generation += 1
+		self.local.pop(book_id)
+
+	def clear_local(self) -> None:
+		self._generation += 1
+		self.local.clear()
+
+	def handle_event(self, event: dict[str, Any]) -> None:
+		"""Drop the local and the shared copy of the book changed by a `books` channel event.
+
+		The writer already deleted the shared copy, but another worker may have stored the row it read before the
+		write committed in the meantime, as its own generation did not change until this event.
+		"""
+		if event.get("event") not in INVALIDATING_EVENTS:
+			return
+		book_id = event["data"]["id"]
+		self.invalidate_local(book_id)
+		if self.redis is not None:
+			task = asyncio.create_task(self._delete_shared(book_id))
+			self._deletions.add(task)
+			task.add_done_callback(self._deletions.discard)
+
+	async def _get_shared(self, book_id: int) -> BookResponseModel | None:
+		if self.redis is None:
+			return None
+		try:
+			raw = await self.redis.get(self._redis_key(book_id))
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not read book %s from Redis: %s", book_id, e)
+			return None
+		if raw is None:
+			self.redis_misses += 1
+			return None
+		try:
+			book = BookResponseModel.model_validate_json(raw)
+		except ValidationError:
+			# e.g. an entry written before a change of the model
+			self.redis_misses += 1
+			return None
+		self.redis_hits += 1
+		return book
+
+	async def _delete_shared(self, book_id: int) -> None:
+		if self.redis is None:
+			return
+		try:
+			await self.redis.delete(self._redis_key(book_id))
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not invalidate book %s in Redis: %s", book_id, e)
+
+	async def _set_shared(self, book: BookResponseModel) -> None:
+		if self.redis is None:
+			return
+		try:
+			# NOTE never overwrites an entry, which may be fresher: writers delete it after they commit instead
+			await self.redis.set(self._redis_key(book.id), book.model_dump_json(), ex=max(int(self.ttl), 1), nx=True)
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not write book %s to Redis: %s", book.id, e)
+
+	def stats(self) -> dict[str, int | float]:
+		return {
+			**self.local.stats(),
+			"redis_hits": self.redis_hits,
+			"redis_misses": self.redis_misses,
+			"redis_errors": self.redis_errors,
+		}
+
+
+@lru_cache
+def get_book_cache() -> BookCache:
+	settings = get_app_settings()
+	cache = BookCache(
+		max_size=settings.book_cache_max_size,
+		ttl=settings.book_cache_ttl_seconds,
+		shared=settings.book_cache_redis,
+	)
+	metrics.register("book_cache", cache.stats)
+	return cache
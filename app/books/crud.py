@@ -1,30 +1,308 @@
-from typing import Sequence
+import logging
+import re
+from datetime import date
+from typing import Any, AsyncIterator, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import (
+	ColumnClause,
+	ColumnElement,
+	Result,
+	Row,
+	RowMapping,
+	Select,
+	and_,
+	delete,
+	func,
+	insert,
+	literal_column,
+	or_,
+	select,
+	update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
 
 from app.books import exceptions
-from app.books.models import CreateBookModel, UpdateBookModel
-from app.books.schemas import Book
+from app.books.models import BookFilterModel, BookSort, BookSortField, CreateBookModel, UpdateBookModel
+from app.books.schemas import Book, books_fts
+from app.db.versions import bump_table_version
 
+logger = logging.getLogger(__name__)
 
-async def create_book(db: AsyncSession, book_model: CreateBookModel) -> Book:
-	db_book = Book(**book_model.model_dump())
-	db.add(db_book)
-	await db.commit()
-	await db.refresh(db_book)
+BULK_INSERT_CHUNK_SIZE = 500
+STREAM_BATCH_SIZE = 1000
+# bm25 weights of the title, author and summary columns of the search index
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+SEARCH_TERM_PATTERN = re.compile(r"\w+\*?")
+SORT_COLUMNS: dict[BookSortField, InstrumentedAttribute[Any]] = {
+	"id": Book.id,
+	"title": Book.title,
+	"author": Book.author,
+	"published_date": Book.published_date,
+}
+
+
+async def create_book(db: AsyncSession, book_model: CreateBookModel, commit: bool = True) -> Book:
+	"""Insert a book with a single `INSERT ... RETURNING` statement, and bump the change counter of `books`."""
+	version = await bump_table_version(db, Book.__tablename__)
+	result = await db.execute(insert(Book).values(**book_model.model_dump(), version=version).returning(Book))
+	db_book = result.scalar_one()
+	if commit:
+		await db.commit()
 	return db_book
 
 
+async def create_books(
+	db: AsyncSession,
+	book_models: Sequence[CreateBookModel],
+	chunk_size: int = BULK_INSERT_CHUNK_SIZE,
+	commit: bool = True,
+) -> list[int]:
+	"""Insert many books in a single transaction and return their ids, in the same order as `book_models`.
+
+	Each chunk is sent as one executemany `INSERT ... RETURNING id`, and nothing is committed if any chunk fails.
+	The change counter of `books` is bumped once for the whole batch.
+	"""
+	version = await bump_table_version(db, Book.__tablename__)
+	statement = insert(Book).returning(Book.id, sort_by_parameter_order=True)
+	ids: list[int] = []
+	for start in range(0, len(book_models), chunk_size):
+		chunk = [
+			{**book_model.model_dump(), "version": version} for book_model in book_models[start : start + chunk_size]
+		]
+		result = await db.execute(statement, chunk)
+		ids.extend(result.scalars().all())
+	if commit:
+		await db.commit()
+	return ids
+
+
+def _parse_sort(sort: BookSort) -> tuple[BookSortField, bool]:
+	"""Split a sort parameter into the sorted field and whether it is descending."""
+	descending = sort.startswith("-")
+	return sort.removeprefix("-"), descending  # type: ignore[return-value]
+
+
+def _filter_conditions(filters: BookFilterModel) -> list[ColumnElement[bool]]:
+	conditions = []
+	if filters.author is not None:
+		conditions.append(Book.author == filters.author)
+	if filters.genre is not None:
+		conditions.append(Book.genre == filters.genre)
+	if filters.published_from is not None:
+		conditions.append(Book.published_date >= filters.published_from)
+	if filters.published_to is not None:
+		conditions.append(Book.published_date <= filters.published_to)
+	return conditions
+
+
+def _after_condition(
+	field: BookSortField,
+	descending: bool,
+	after: dict[str, Any],
+	sort_column: ColumnElement[Any],
+	id_column: ColumnElement[int],
+) -> ColumnElement[bool]:
+	"""Keyset condition selecting the rows that come after the row with the sort keys `after`.
+
+	SQLite sorts NULLs first in ascending order and last in descending order, which matters for nullable columns.
+
+	Raises:
+		exceptions.InvalidCursorError
+	"""
+	book_id: int = after["id"]
+	if field == "id":
+		return id_column < book_id if descending else id_column > book_id
+	if field not in after:
+		raise exceptions.InvalidCursorError(str(after))
+	value = after[field]
+	if value is not None and field == "published_date":
+		try:
+			value = date.fromisoformat(value)
+		except (TypeError, ValueError):
+			raise exceptions.InvalidCursorError(str(after))
+	elif value is not None and not isinstance(value, str):
+		raise exceptions.InvalidCursorError(str(after))
+
+	if value is None:
+		if descending:
+			return and_(sort_column.is_(None), id_column < book_id)
+		return or_(sort_column.is_not(None), and_(sort_column.is_(None), id_column > book_id))
+	if descending:
+		return or_(sort_column < value, and_(sort_column == value, id_column < book_id), sort_column.is_(None))
+	return or_(sort_column > value, and_(sort_column == value, id_column > book_id))
+
+
+def _without_index(column: ColumnElement[Any]) -> ColumnElement[Any]:
+	"""Wrap a column in a unary `+`, which SQLite cannot look up in an index."""
+	return UnaryExpression(column, operator=custom_op("+"))
+
+
+def build_books_query(
+	skip: int = 0,
+	limit: int = 100,
+	after: dict[str, Any] | None = None,
+	sort: BookSort = "id",
+	filters: BookFilterModel | None = None,
+	columns: Sequence[str] | None = None,
+) -> Select[Any]:
+	"""Build the query of `get_books`, selecting only `columns` of the books if given.
+
+	Raises:
+		exceptions.InvalidCursorError
+	"""
+	field, descending = _parse_sort(sort)
+	conditions = _filter_conditions(filters) if filters is not None else []
+	has_equality_filter = filters is not None and (filters.author is not None or filters.genre is not None)
+	sort_column: ColumnElement[Any] = SORT_COLUMNS[field].expression
+	id_column: ColumnElement[int] = Book.id.expression
+
+	# NOTE with only a date range filter, SQLite may prefer walking the index of the sort column (or the primary key)
+	# and discard the rows out of range, i.e. a full scan. Hiding the sort columns from the planner makes it search
+	# the date index instead.
+	if conditions and not has_equality_filter and field != "published_date":
+		sort_column, id_column = _without_index(sort_column), _without_index(id_column)
+
+	order_by = [id_column.desc() if descending else id_column.asc()]
+	if field != "id":
+		order_by.insert(0, sort_column.desc() if descending else sort_column.asc())
+
+	query = select(*(getattr(Book, name) for name in columns)) if columns else select(Book)
+	query = query.where(*conditions).order_by(*order_by).limit(limit)
+	if after is not None:
+		query = query.where(_after_condition(field, descending, after, sort_column, id_column))
+	else:
+		query = query.offset(skip)
+	return query
+
+
+async def explain_query_plan(db: AsyncSession, query: Select[Any]) -> list[str]:
+	"""Get the `EXPLAIN QUERY PLAN` of a query, one line per step."""
+	compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+	# NOTE straight to the driver: `text()` would parse e.g. `:b` in a filter value as a bind parameter
+	connection = await db.connection()
+	result = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")
+	return [row.detail for row in result]
+
+
 async def get_books(
 	db: AsyncSession,
 	skip: int = 0,
 	limit: int = 100,
+	after: dict[str, Any] | None = None,
+	sort: BookSort = "id",
+	filters: BookFilterModel | None = None,
+	explain: bool = False,
 ) -> Sequence[Book]:
-	result = await db.execute(select(Book).order_by(Book.id).offset(skip).limit(limit))
+	"""Get books matching `filters`, ordered by `sort` then id.
+
+	When `after` is given, uses keyset pagination: `after` holds the sort keys of the last book of the previous page
+	(its id and the sorted field), which lets the index seek straight to the page. Otherwise falls back to offset
+	pagination. Every filter and sort is backed by an index of `books`, and `explain` logs the query plan to check it.
+
+	Raises:
+		exceptions.InvalidCursorError
+	"""
+	query = build_books_query(skip=skip, limit=limit, after=after, sort=sort, filters=filters)
+	result = await execute_listing(db, query, explain)
 	return result.scalars().all()
 
 
+async def get_book_rows(
+	db: AsyncSession,
+	columns: Sequence[str],
+	skip: int = 0,
+	limit: int = 100,
+	after: dict[str, Any] | None = None,
+	sort: BookSort = "id",
+	filters: BookFilterModel | None = None,
+	explain: bool = False,
+) -> Sequence[RowMapping]:
+	"""Like `get_books`, but selects plain values of `columns` instead of `Book` entities, which is much cheaper
+	to load and to serialize.
+
+	Raises:
+		exceptions.InvalidCursorError
+	"""
+	query = build_books_query(skip=skip, limit=limit, after=after, sort=sort, filters=filters, columns=columns)
+	result = await execute_listing(db, query, explain)
+	return result.mappings().all()
+
+
+async def execute_listing(db: AsyncSession, query: Select[Any], explain: bool = False) -> Result[Any]:
+	"""Execute a query built by `build_books_query`, logging its query plan first with `explain`."""
+	if explain:
+		plan = await explain_query_plan(db, query)
+		logger.info("Query plan of %s\n%s", query, "\n".join(plan))
+	return await db.execute(query)
+
+
+async def stream_books(db: AsyncSession, batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[Book]:
+	"""Stream all books ordered by id from a server-side cursor, fetching `batch_size` rows at a time."""
+	result = await db.stream_scalars(select(Book).order_by(Book.id).execution_options(yield_per=batch_size))
+	# NOTE iterating partitions instead of rows crosses the async/sync boundary once per batch instead of once per row
+	async for partition in result.partitions():
+		for book in partition:
+			yield book
+
+
+def build_match_query(query: str) -> str:
+	"""Turn user input into an FTS5 query that matches documents containing all of its words.
+
+	Every word is quoted so that FTS5 operators and punctuation in the input are never interpreted,
+	and a trailing `*` on a word is kept as a prefix query.
+
+	Raises:
+		exceptions.InvalidSearchQueryError
+	"""
+	terms = []
+	for term in SEARCH_TERM_PATTERN.findall(query):
+		word = term.rstrip("*")
+		terms.append(f'"{word}"*' if term.endswith("*") else f'"{word}"')
+	if not terms:
+		raise exceptions.InvalidSearchQueryError(query)
+	return " ".join(terms)
+
+
+async def search_books(
+	db: AsyncSession,
+	query: str,
+	limit: int = 100,
+	after: tuple[float, int] | None = None,
+) -> Sequence[Row[tuple[Book, float, str]]]:
+	"""Full-text search over the title, author and summary of the books.
+
+	Returns `(book, rank, snippet)` rows ordered by bm25 rank (best first) then id. `after` is the `(rank, id)` of the
+	last row of the previous page.
+
+	Raises:
+		exceptions.InvalidSearchQueryError
+	"""
+	index: ColumnClause[Any] = literal_column("books_fts")
+	hits = (
+		select(
+			books_fts.c.rowid.label("id"),
+			func.bm25(index, *SEARCH_WEIGHTS).label("rank"),
+			func.snippet(index, -1, "<mark>", "</mark>", "…", 16).label("snippet"),
+		)
+		.where(index.op("MATCH")(build_match_query(query)))
+		.subquery()
+	)
+	statement = (
+		select(Book, hits.c.rank, hits.c.snippet)
+		.join(hits, hits.c.id == Book.id)
+		.order_by(hits.c.rank, Book.id)
+		.limit(limit)
+	)
+	if after is not None:
+		rank, book_id = after
+		statement = statement.where(or_(hits.c.rank > rank, and_(hits.c.rank == rank, Book.id > book_id)))
+	result = await db.execute(statement)
+	return result.all()
+
+
 async def get_book(db: AsyncSession, book_id: int) -> Book:
 	"""Get a book by ID.
 
@@ -38,15 +316,40 @@ async def get_book(db: AsyncSession, book_id: int) -> Book:
 	return book
 
 
-async def update_book(db: AsyncSession, book_id: int, book_patch: UpdateBookModel) -> Book:
-	db_book = await get_book(db, book_id)
-	for key, value in book_patch.model_dump(exclude_unset=True).items():
-		setattr(db_book, key, value)
-	await db.commit()
-	await db.refresh(db_book)
+async def update_book(db: AsyncSession, book_id: int, book_patch: UpdateBookModel, commit: bool = True) -> Book:
+	"""Update the fields set in `book_patch` with a single `UPDATE ... RETURNING` statement, and bump the change
+	counter of `books`.
+
+	Raises:
+		exceptions.BookNotFoundError
+	"""
+	values = book_patch.model_dump(exclude_unset=True)
+	if not values:
+		return await get_book(db, book_id)
+	version = await bump_table_version(db, Book.__tablename__)
+	result = await db.execute(update(Book).where(Book.id == book_id).values(**values, version=version).returning(Book))
+	db_book = result.scalar_one_or_none()
+	if db_book is None:
+		await db.rollback()
+		raise exceptions.BookNotFoundError(book_id)
+	if commit:
+		await db.commit()
 	return db_book
 
 
-async def delete_book(db: AsyncSession, book: Book) -> None:
-	await db.delete(book)
-	await db.commit()
+async def delete_book(db: AsyncSession, book_id: int, commit: bool = True) -> Book:
+	"""Delete a book with a single `DELETE ... RETURNING` statement, bump the change counter of `books` and return
+	the deleted book.
+
+	Raises:
+		exceptions.BookNotFoundError
+	"""
+	await bump_table_version(db, Book.__tablename__)
+	result = await db.execute(delete(Book).where(Book.id == book_id).returning(Book))
+	db_book = result.scalar_one_or_none()
+	if db_book is None:
+		await db.rollback()
+		raise exceptions.BookNotFoundError(book_id)
+	if commit:
+		await db.commit()
+	return db_book
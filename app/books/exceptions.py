@@ -10,3 +10,27 @@ class BookNotFoundError(BookError):
 	def __init__(self, book_id: int):
 		self.book_id = book_id
 		super().__init__(f"Book with id {book_id} not found.")
+
+
+class InvalidCursorError(BookError):
+	"""Exception raised when a pagination cursor cannot be decoded."""
+
+	def __init__(self, cursor: str):
+		self.cursor = cursor
+		super().__init__("Invalid pagination cursor.")
+
+
+class InvalidSearchQueryError(BookError):
+	"""Exception raised when a search query has no searchable terms."""
+
+	def __init__(self, query: str):
+		self.query = query
+		super().__init__("Search query must contain at least one word.")
+
+
+class InvalidFieldsError(BookError):
+	"""Exception raised when a sparse fieldset names fields that books do not have."""
+
+	def __init__(self, fields: list[str]):
+		self.fields = fields
+		super().__init__(f"Unknown book fields: {', '.join(fields)}.")
@@ -0,0 +1,63 @@
+import csv
+import io
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from typing import Literal
+
+from app.books import crud
+from app.books.models import BookResponseModel
+from app.books.schemas import Book
+from app.db.connection import create_session
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES: dict[ExportFormat, str] = {
+	"ndjson": "application/x-ndjson",
+	"csv": "text/csv",
+}
+# NOTE rows are sent in chunks to avoid one ASGI message per row
+ROWS_PER_CHUNK = 500
+
+
+async def to_ndjson(books: AsyncIterable[Book]) -> AsyncIterator[str]:
+	"""Encode books as newline-delimited JSON, one book per line."""
+	lines: list[str] = []
+	async for book in books:
+		lines.append(BookResponseModel.model_validate(book).model_dump_json())
+		if len(lines) == ROWS_PER_CHUNK:
+			yield "\n".join(lines) + "\n"
+			lines.clear()
+	if lines:
+		yield "\n".join(lines) + "\n"
+
+
+async def to_csv(books: AsyncIterable[Book]) -> AsyncIterator[str]:
+	"""Encode books as CSV with a header row."""
+	buffer = io.StringIO()
+	writer = csv.DictWriter(buffer, fieldnames=list(BookResponseModel.model_fields))
+	writer.writeheader()
+	rows = 0
+	async for book in books:
+		writer.writerow(BookResponseModel.model_validate(book).model_dump(mode="json"))
+		rows += 1
+		if rows == ROWS_PER_CHUNK:
+			yield buffer.getvalue()
+			buffer.seek(0)
+			buffer.truncate()
+			rows = 0
+	yield buffer.getvalue()
+
+
+ENCODERS: dict[ExportFormat, Callable[[AsyncIterable[Book]], AsyncIterator[str]]] = {
+	"ndjson": to_ndjson,
+	"csv": to_csv,
+}
+
+
+async def export_books(export_format: ExportFormat) -> AsyncIterator[str]:
+	"""Stream the whole catalog in `export_format`.
+
+	Uses its own session because a streaming response outlives the request dependencies.
+	"""
+	async with create_session() as session:
+		async for chunk in ENCODERS[export_format](crud.stream_books(session)):
+			yield chunk
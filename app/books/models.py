@@ -1,7 +1,14 @@
 from datetime import date
+from typing import Any, Generic, Literal, TypeVar
 
 from pydantic import BaseModel, ConfigDict
 
+ItemT = TypeVar("ItemT")
+
+BookSortField = Literal["id", "title", "author", "published_date"]
+# NOTE a leading "-" sorts in descending order
+BookSort = Literal["id", "-id", "title", "-title", "author", "-author", "published_date", "-published_date"]
+
 
 class CreateBookModel(BaseModel):
 	title: str
@@ -20,10 +27,16 @@ class BookResponseModel(BaseModel):
 	published_date: date | None = None
 	summary: str | None = None
 	genre: str
+	version: int
 
 	model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 
+class BookSearchResultModel(BookResponseModel):
+	rank: float
+	snippet: str
+
+
 class UpdateBookModel(BaseModel):
 	title: str | None = None
 	author: str | None = None
@@ -32,3 +45,25 @@ class UpdateBookModel(BaseModel):
 	genre: str | None = None
 
 	model_config = ConfigDict(extra="forbid")
+
+
+class BookFilterModel(BaseModel):
+	author: str | None = None
+	genre: str | None = None
+	published_from: date | None = None
+	published_to: date | None = None
+
+
+class PageModel(BaseModel, Generic[ItemT]):
+	items: list[ItemT]
+	next_cursor: str | None = None
+
+
+class BulkItemErrorModel(BaseModel):
+	index: int
+	errors: list[dict[str, Any]]
+
+
+class BulkCreateResponseModel(BaseModel):
+	ids: list[int | None]
+	errors: list[BulkItemErrorModel]
@@ -0,0 +1,36 @@
+import base64
+import binascii
+import json
+from typing import Any
+
+from app.books import exceptions
+
+ROW_ID_MIN = -(2**63)
+ROW_ID_MAX = 2**63 - 1
+
+
+def encode_cursor(keys: dict[str, Any]) -> str:
+	"""Encode the sort keys of the last row of a page into an opaque cursor."""
+	raw = json.dumps(keys, separators=(",", ":"), default=str).encode("utf-8")
+	return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+	"""Decode a cursor created by `encode_cursor`.
+
+	Raises:
+		exceptions.InvalidCursorError
+	"""
+	try:
+		padded = cursor + "=" * (-len(cursor) % 4)
+		keys = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+	except (UnicodeEncodeError, binascii.Error, ValueError):
+		raise exceptions.InvalidCursorError(cursor)
+	if not isinstance(keys, dict) or not _is_row_id(keys.get("id")):
+		raise exceptions.InvalidCursorError(cursor)
+	return keys
+
+
+def _is_row_id(value: Any) -> bool:
+	"""Whether `value` can be a SQLite row id: a signed 64-bit integer, and not a `bool` although it is an `int`."""
+	return isinstance(value, int) and not isinstance(value, bool) and ROW_ID_MIN <= value <= ROW_ID_MAX
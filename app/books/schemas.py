@@ -1,8 +1,11 @@
 from datetime import date
+from typing import Any
 
+from sqlalchemy import Connection, Index, MetaData, column, event, table, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.connection import Base
+from app.db.versions import TableVersion
 
 
 # NOTE should there be a unique key on title or a composite key on title and author?
@@ -15,3 +18,89 @@ class Book(Base):
 	published_date: Mapped[date | None]
 	summary: Mapped[str | None]
 	genre: Mapped[str]
+	# NOTE the value of the `books` change counter (see `app.db.versions`) when the book was last written, so it
+	# also changes when a deleted book's id is reused
+	version: Mapped[int] = mapped_column(default=1, server_default=text("1"))
+
+	# NOTE SQLite appends the id to every index, so the single column indexes also serve "filter then sort by id",
+	# and the composite ones serve a date range or a date sort within an author or a genre.
+	__table_args__ = (
+		Index("ix_books_title", "title"),
+		Index("ix_books_author", "author"),
+		Index("ix_books_genre", "genre"),
+		Index("ix_books_published_date", "published_date"),
+		Index("ix_books_author_published_date", "author", "published_date"),
+		Index("ix_books_genre_published_date", "genre", "published_date"),
+	)
+
+
+# Full-text index over the searchable columns of `books`. It is an FTS5 external content table: it only stores the
+# index and reads the text back from `books`, and the triggers below keep it in sync with every write.
+books_fts = table("books_fts", column("rowid"), column("title"), column("author"), column("summary"))
+
+_CREATE_BOOKS_FTS = """
+CREATE VIRTUAL TABLE books_fts USING fts5(
+	title, author, summary,
+	content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+)
+"""
+_BOOKS_FTS_TRIGGERS = (
+	"""
+	CREATE TRIGGER IF NOT EXISTS books_fts_after_insert AFTER INSERT ON books BEGIN
+		INSERT INTO books_fts(rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+	END
+	""",
+	"""
+	CREATE TRIGGER IF NOT EXISTS books_fts_after_delete AFTER DELETE ON books BEGIN
+		INSERT INTO books_fts(books_fts, rowid, title, author, summary)
+		VALUES ('delete', old.id, old.title, old.author, old.summary);
+	END
+	""",
+	"""
+	CREATE TRIGGER IF NOT EXISTS books_fts_after_update AFTER UPDATE OF title, author, summary ON books BEGIN
+		INSERT INTO books_fts(books_fts, rowid, title, author, summary)
+		VALUES ('delete', old.id, old.title, old.author, old.summary);
+		INSERT INTO books_fts(rowid, title, author, summary) VALUES (new.id, new.title, new.author, new.summary);
+	END
+	""",
+)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_search_index(target: MetaData, connection: Connection, **kw: Any) -> None:
+	"""Create the full-text index of `books`, and build it from the existing rows if it did not exist yet."""
+	if connection.dialect.name != "sqlite":
+		return
+	exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"))
+	if exists.first() is None:
+		connection.execute(text(_CREATE_BOOKS_FTS))
+		connection.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+	for trigger in _BOOKS_FTS_TRIGGERS:
+		connection.execute(text(trigger))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def add_version_column(target: MetaData, connection: Connection, **kw: Any) -> None:
+	"""Add the `version` column to a `books` table created before it existed, as `create_all` skips it.
+
+	The change counter of `books` starts at the highest version of its rows, so that the next write gives the
+	book it changes a new version rather than the `1` the existing books already have.
+	"""
+	if connection.dialect.name != "sqlite":
+		return
+	columns = connection.execute(text("SELECT name FROM pragma_table_info('books')")).scalars().all()
+	if "version" not in columns:
+		connection.execute(text("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+	connection.execute(
+		text(
+			f"INSERT OR IGNORE INTO {TableVersion.__tablename__} (name, version) "
+			"SELECT 'books', COALESCE(MAX(version), 0) FROM books"
+		)
+	)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_missing_indexes(target: MetaData, connection: Connection, **kw: Any) -> None:
+	"""Create the indexes added to `books` after the table itself was created, as `create_all` skips them."""
+	for index in Book.__table__.indexes:  # type: ignore[attr-defined]
+		index.create(connection, checkfirst=True)
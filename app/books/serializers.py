@@ -0,0 +1,72 @@
+from collections.abc import Iterable, Mapping, Sequence
+from functools import lru_cache
+from typing import Any
+
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from app.books import exceptions
+from app.books.models import BookResponseModel
+
+BOOK_FIELDS = tuple(BookResponseModel.model_fields)
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...]:
+	"""Parse a comma separated sparse fieldset, e.g. `title,author`, into book fields in their canonical order.
+
+	The id is always included, and an empty fieldset means all the fields.
+
+	Raises:
+		exceptions.InvalidFieldsError
+	"""
+	if not fields:
+		return BOOK_FIELDS
+	requested = {field.strip() for field in fields.split(",")} - {""}
+	unknown = sorted(requested.difference(BOOK_FIELDS))
+	if unknown:
+		raise exceptions.InvalidFieldsError(unknown)
+	requested.add("id")
+	return tuple(field for field in BOOK_FIELDS if field in requested)
+
+
+@lru_cache
+def row_type(fields: tuple[str, ...] = BOOK_FIELDS) -> type[Any]:
+	"""`TypedDict` of the book `fields`, mirroring their types in `BookResponseModel`."""
+	return TypedDict(  # type: ignore[no-any-return, operator]
+		"BookRow",
+		{field: BookResponseModel.model_fields[field].annotation for field in fields},
+	)
+
+
+@lru_cache
+def book_adapter(fields: tuple[str, ...] = BOOK_FIELDS) -> TypeAdapter[Any]:
+	"""Adapter serializing a single book row restricted to `fields`, cached per combination of fields."""
+	return TypeAdapter(row_type(fields))
+
+
+@lru_cache
+def page_adapter(fields: tuple[str, ...] = BOOK_FIELDS) -> TypeAdapter[Any]:
+	"""Adapter serializing a page of plain book rows restricted to `fields`, cached per combination of fields.
+
+	Rows are typed as a `TypedDict` mirroring `BookResponseModel`, so dumping them does not build nor validate any
+	model: the page is encoded to JSON in one pass.
+	"""
+	BookPage = TypedDict("BookPage", {"items": list[row_type(fields)], "next_cursor": str | None})  # type: ignore[misc]
+	return TypeAdapter(BookPage)
+
+
+def dump_book(book: Mapping[Any, Any], fields: Sequence[str] = BOOK_FIELDS) -> bytes:
+	"""Encode a single book row to JSON."""
+	fields = tuple(fields)
+	return book_adapter(fields).dump_json({field: book[field] for field in fields})
+
+
+def dump_page(
+	rows: Iterable[Mapping[Any, Any]],
+	next_cursor: str | None,
+	fields: Sequence[str] = BOOK_FIELDS,
+) -> bytes:
+	"""Encode a page of book rows, e.g. `RowMapping`s of a column query, to JSON."""
+	fields = tuple(fields)
+	items = [{field: row[field] for field in fields} for row in rows]
+	return page_adapter(fields).dump_json({"items": items, "next_cursor": next_cursor})
@@ -0,0 +1,39 @@
+import hashlib
+import math
+from collections.abc import Iterator
+
+
+class BloomFilter:
+	"""Set membership test in constant memory, with false positives but no false negatives.
+
+	Sized for `capacity` items at a false positive rate of `error_rate`. Beyond `capacity` the rate degrades, so
+	owners should rebuild it (see `is_full`). Items cannot be removed.
+	"""
+
+	def __init__(self, capacity: int, error_rate: float) -> None:
+		self.capacity = capacity
+		self.error_rate = error_rate
+		self.size = max(1, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))  # in bits
+		self.hash_count = max(1, round(self.size / max(capacity, 1) * math.log(2)))
+		self._bits = bytearray((self.size + 7) // 8)
+		self.count = 0
+
+	def _positions(self, item: str) -> Iterator[int]:
+		# NOTE double hashing: k positions derived from the two halves of a single digest
+		digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+		h1 = int.from_bytes(digest[:8], "little")
+		h2 = int.from_bytes(digest[8:], "little") | 1
+		for i in range(self.hash_count):
+			yield (h1 + i * h2) % self.size
+
+	def add(self, item: str) -> None:
+		for position in self._positions(item):
+			self._bits[position >> 3] |= 1 << (position & 7)
+		self.count += 1
+
+	def __contains__(self, item: str) -> bool:
+		return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+	@property
+	def is_full(self) -> bool:
+		return self.count >= self.capacity
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+KeyT = TypeVar("KeyT")
+ValueT = TypeVar("ValueT")
+
+
+class TTLCache(Generic[KeyT, ValueT]):
+	"""In-process least-recently-used cache whose entries also expire after a time-to-live.
+
+	A `max_size` of 0 disables the cache. Not thread-safe: meant to be used from the event loop only.
+	"""
+
+	def __init__(self, max_size: int, ttl: float) -> None:
+		self.max_size = max_size
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries: OrderedDict[KeyT, tuple[float, ValueT]] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def get(self, key: KeyT, default: ValueT | None = None) -> ValueT | None:
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return default
+		expires_at, value = entry
+		if expires_at <= time.monotonic():
+			del self._entries[key]
+			self.misses += 1
+			return default
+		self._entries.move_to_end(key)
+		self.hits += 1
+		return value
+
+	def set(self, key: KeyT, value: ValueT, ttl: float | None = None) -> None:
+		"""Store `value` under `key`, for `ttl` seconds if given instead of the cache default."""
+		if self.max_size <= 0:
+			return
+		self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+
+	def pop(self, key: KeyT) -> None:
+		self._entries.pop(key, None)
+
+	def clear(self) -> None:
+		self._entries.clear()
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"size": len(self._entries),
+			"max_size": self.max_size,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+		}
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic import Field, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -9,10 +10,78 @@ class AppSettings(BaseSettings):
 	port: int = 8000
 	database_url: str = "sqlite+aiosqlite:///./books.db"
 	redis_url: str = Field("redis://redis:6379", alias="rediscloud_url")
+	debug_query_plans: bool = False  # log the EXPLAIN QUERY PLAN of book listings
+
+	# Database
+	database_pool_size: int = 5  # connections kept open per worker
+	database_max_overflow: int = 10  # connections opened beyond the pool under load, closed when returned
+	database_pool_timeout_seconds: float = 30.0  # wait for a free connection before failing the request
+
+	# SQLite, PRAGMAs set on every new connection
+	# wal lets readers and the writer run concurrently, delete is the SQLite default where writers block readers
+	sqlite_journal_mode: Literal["wal", "delete", "truncate", "persist", "memory", "off"] = "wal"
+	# normal only syncs at checkpoints in WAL mode: commits survive crashes of the process, not power losses
+	sqlite_synchronous: Literal["off", "normal", "full", "extra"] = "normal"
+	sqlite_cache_size_kib: int = 32_768  # page cache per connection
+	sqlite_mmap_size_bytes: int = 268_435_456  # reads through memory mapping up to that size, 0 disables it
+	sqlite_temp_store: Literal["default", "file", "memory"] = "memory"  # where sorts and temporary tables live
+	sqlite_busy_timeout_ms: int = 5_000  # wait for a lock held by another connection before failing
+
+	# Redis
+	redis_max_connections: int = 50  # per worker, commands wait for a free connection beyond that
+	redis_pool_timeout_seconds: float = 5.0  # wait for a free connection before failing the command
+	redis_socket_timeout_seconds: float = 5.0
+	redis_connect_timeout_seconds: float = 2.0
+	redis_health_check_interval_seconds: int = 30  # connections idle for longer are pinged before reuse
+
+	# Books cache
+	book_cache_max_size: int = 10_000  # 0 disables the in-process tier
+	book_cache_ttl_seconds: float = 60.0
+	book_cache_redis: bool = False  # share cached books between workers through Redis
+
+	# Authentication
+	auth_stateless: bool = False  # trust the claims of valid tokens without looking the user up
+	user_cache_max_size: int = 10_000  # 0 disables the cache
+	user_cache_ttl_seconds: float = 30.0  # bound on how long a changed or deleted user stays cached
+	user_cache_negative_ttl_seconds: float = 5.0  # how long an unknown username stays cached
+
+	# Login rate limits, 0 disables a limit
+	login_rate_limit_window_seconds: float = 60.0
+	login_rate_limit_per_username: int = 10
+	login_rate_limit_per_ip: int = 30
+
+	# Password hashing
+	bcrypt_rounds: int | None = None  # bcrypt cost of new hashes, calibrated once and kept in Redis when not set
+	bcrypt_target_ms: float = 250.0  # hash time the calibration aims for
+	bcrypt_min_rounds: int = 10
+	bcrypt_max_rounds: int = 16
+	password_hash_workers: int = 4  # threads running bcrypt
+	password_hash_max_queue: int = 32  # hashes waiting for a thread before logins are rejected with 503
 
 	# JWT
 	jwt_secret: SecretStr
 	jwt_expire_minutes: int = 30
+	token_cache_max_size: int = 10_000  # verified tokens cached per worker, 0 disables the cache
+	refresh_token_expire_days: int = 14
+	revocation_filter_capacity: int = 100_000  # revoked tokens tracked per worker before false positives grow
+	revocation_filter_error_rate: float = 0.001
+
+	# Server-sent events
+	sse_queue_size: int = 100  # events buffered per client before the overflow policy applies
+	sse_overflow_policy: Literal["drop_oldest", "disconnect", "conflate"] = "drop_oldest"
+	book_events_stream_max_len: int = 0  # book events kept in a Redis Stream for clients to resume from, 0 disables
+
+	# WebSockets
+	ws_queue_size: int = 100  # events buffered per client before the overflow policy applies
+	ws_overflow_policy: Literal["drop_oldest", "disconnect", "conflate"] = "drop_oldest"
+
+	# Event outbox
+	outbox_batch_size: int = 500  # events published per Redis round trip
+	outbox_interval_seconds: float = 1.0  # polling interval, for events written by other workers or left by failures
+	outbox_lease_seconds: float = 30.0  # after which a batch that was not confirmed is published again
+	event_codec: Literal["json", "msgpack"] = "json"  # encoding of events on Redis, msgpack needs the msgpack package
+	# redis for every deployment, or memory for a single worker: events then never leave the process
+	event_bus: Literal["redis", "memory"] = "redis"
 
 	# .ENV
 	model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
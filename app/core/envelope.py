@@ -0,0 +1,79 @@
+import json
+from typing import Any, Literal
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+ENVELOPE_VERSION = 1
+# NOTE separates the stream id of an event, empty if it is not stored in a stream, from its envelope in pub/sub messages
+MESSAGE_ID_SEPARATOR = b" "
+
+EventCodec = Literal["json", "msgpack"]
+
+
+def encode(event: dict[str, Any], codec: EventCodec = "json") -> bytes:
+	"""Encode an event into a versioned envelope, the bytes stored in the outbox, the stream and pub/sub messages.
+
+	`msgpack` is more compact and faster to decode, and requires the `msgpack` package. Either codec can be decoded
+	by `decode`, so that workers with different codecs can share channels.
+	"""
+	envelope = {"v": ENVELOPE_VERSION, **event}
+	if codec == "msgpack":
+		if msgpack is None:
+			raise RuntimeError("The msgpack event codec requires the msgpack package")
+		packed: bytes = msgpack.packb(envelope)
+		return packed
+	return json.dumps(envelope, separators=(",", ":")).encode()
+
+
+def decode(payload: bytes) -> dict[str, Any]:
+	"""Decode an envelope encoded with any codec into its event.
+
+	Raises:
+		ValueError: if `payload` is not an envelope of a supported version
+	"""
+	if payload[:1] == b"{":
+		envelope = json.loads(payload)
+	elif msgpack is None:
+		raise ValueError("Cannot decode a msgpack event without the msgpack package")
+	else:
+		envelope = msgpack.unpackb(payload)
+	if not isinstance(envelope, dict):
+		raise ValueError(f"Invalid event envelope {envelope!r}")
+	# NOTE events stored before the envelope was versioned have the same fields and no version
+	version = envelope.pop("v", ENVELOPE_VERSION)
+	if version != ENVELOPE_VERSION:
+		raise ValueError(f"Unsupported event envelope version {version!r}")
+	return envelope
+
+
+def pack_message(payload: bytes, stream_id: str = "") -> bytes:
+	"""Build the pub/sub message of an envelope, see `unpack_message`."""
+	return stream_id.encode() + MESSAGE_ID_SEPARATOR + payload
+
+
+def unpack_message(message: bytes) -> tuple[str | None, bytes]:
+	"""Split a pub/sub message into the stream id of its event, if any, and its envelope.
+
+	Raises:
+		ValueError: if `message` was not built by `pack_message`
+	"""
+	stream_id, separator, payload = message.partition(MESSAGE_ID_SEPARATOR)
+	if not separator:
+		raise ValueError("Missing the stream id separator of the event message")
+	return stream_id.decode() or None, payload
+
+
+def decode_message(message: bytes) -> dict[str, Any]:
+	"""Decode a pub/sub message into its event, with its stream id as `id` if it has one.
+
+	Raises:
+		ValueError: if `message` is not a valid event message
+	"""
+	stream_id, payload = unpack_message(message)
+	event = decode(payload)
+	if stream_id is not None:
+		event["id"] = stream_id
+	return event
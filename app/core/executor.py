@@ -0,0 +1,111 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from typing import ParamSpec, TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# NOTE latency percentiles are computed over the most recent calls only
+LATENCY_SAMPLES = 1000
+
+
+class ExecutorBusyError(Exception):
+	"""Exception raised when a bounded executor has no room left in its wait queue."""
+
+	def __init__(self, name: str):
+		self.name = name
+		super().__init__(f"Executor '{name}' is busy, try again later.")
+
+
+class BoundedExecutor:
+	"""Thread pool for blocking calls made from async code, with a bounded wait queue.
+
+	At most `max_workers` calls run at once and at most `max_queue` more wait for a thread. Calls beyond that are
+	rejected right away with `ExecutorBusyError`, so a burst sheds load instead of piling up work that would time out
+	anyway. Meant for CPU-bound functions that release the GIL, e.g. bcrypt.
+	"""
+
+	def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+		self.name = name
+		self.max_workers = max_workers
+		self.max_queue = max_queue
+		self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+		self._pending = 0
+		self.completed = 0
+		self.rejected = 0
+		self._wait_times: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+		self._run_times: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+	async def run(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+		"""Run `fn` on a worker thread and wait for its result.
+
+		Raises:
+			ExecutorBusyError
+		"""
+		if self._pending >= self.max_workers + self.max_queue:
+			self.rejected += 1
+			raise ExecutorBusyError(self.name)
+		loop = asyncio.get_running_loop()
+		submitted = time.perf_counter()
+
+		def timed() -> tuple[T, float, float]:
+			started = time.perf_counter()
+			result = fn(*args, **kwargs)
+			return result, started - submitted, time.perf_counter() - started
+
+		def done(future: Future[tuple[T, float, float]]) -> None:
+			# NOTE counted when the thread is done, not when the caller stops waiting, e.g. on a cancelled request
+			with suppress(RuntimeError):  # the loop is already closed
+				loop.call_soon_threadsafe(self._record, future)
+
+		self._pending += 1
+		try:
+			future = self._executor.submit(timed)
+		except BaseException:
+			# NOTE e.g. after `shutdown`, `done` is never called to give the slot back
+			self._pending -= 1
+			raise
+		future.add_done_callback(done)
+		result, _, _ = await asyncio.wrap_future(future)
+		return result
+
+	def _record(self, future: Future[tuple[T, float, float]]) -> None:
+		self._pending -= 1
+		if future.cancelled() or future.exception() is not None:
+			return
+		_, wait_time, run_time = future.result()
+		self.completed += 1
+		self._wait_times.append(wait_time)
+		self._run_times.append(run_time)
+
+	@property
+	def queued(self) -> int:
+		return max(self._pending - self.max_workers, 0)
+
+	def shutdown(self) -> None:
+		self._executor.shutdown(wait=False, cancel_futures=True)
+
+	def stats(self) -> dict[str, int | float]:
+		return {
+			"workers": self.max_workers,
+			"max_queue": self.max_queue,
+			"in_flight": self._pending - self.queued,
+			"queued": self.queued,
+			"completed": self.completed,
+			"rejected": self.rejected,
+			"wait_ms_p50": _percentile_ms(self._wait_times, 50),
+			"wait_ms_p95": _percentile_ms(self._wait_times, 95),
+			"run_ms_p50": _percentile_ms(self._run_times, 50),
+			"run_ms_p95": _percentile_ms(self._run_times, 95),
+		}
+
+
+def _percentile_ms(samples: deque[float], percentile: int) -> float:
+	if len(samples) < 2:
+		return samples[0] * 1000 if samples else 0.0
+	return statistics.quantiles(samples, n=100)[percentile - 1] * 1000
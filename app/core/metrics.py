@@ -0,0 +1,14 @@
+from collections.abc import Callable, Mapping
+
+MetricsProvider = Callable[[], Mapping[str, int | float]]
+
+_providers: dict[str, MetricsProvider] = {}
+
+
+def register(name: str, provider: MetricsProvider) -> None:
+	"""Register a callable returning the current metrics of a component under `name`."""
+	_providers[name] = provider
+
+
+def collect() -> dict[str, dict[str, int | float]]:
+	return {name: dict(provider()) for name, provider in _providers.items()}
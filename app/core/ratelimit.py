@@ -0,0 +1,119 @@
+import logging
+import secrets
+import time
+from collections import deque
+from collections.abc import Mapping
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# KEYS: one sorted set of request timestamps per limited subject
+# ARGV: the current time and the window in milliseconds, a unique id of the request, then the limit of each key
+# Returns 0 and records the request when every key is under its limit, otherwise the milliseconds to wait.
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+	redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+	if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+		local oldest = tonumber(redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')[2])
+		retry_after = math.max(retry_after, oldest + window - now)
+	end
+end
+if retry_after > 0 then
+	return retry_after
+end
+for _, key in ipairs(KEYS) do
+	redis.call('ZADD', key, now, ARGV[3])
+	redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+
+class RateLimitedError(Exception):
+	"""Exception raised when a rate limit is exceeded."""
+
+	def __init__(self, retry_after: float):
+		self.retry_after = retry_after
+		super().__init__(f"Too many requests, retry in {retry_after:.0f} seconds.")
+
+
+class SlidingWindowLimiter:
+	"""Sliding window rate limiter allowing at most a given number of requests per key within `window` seconds.
+
+	A request is checked against several keys at once, e.g. a username and an IP address, and it only counts against
+	them when all of them allow it. Counters are kept in Redis by an atomic Lua script, so that every worker shares
+	them. When Redis is unavailable, the limiter falls back to per-worker counters, which are looser but still bound
+	the load of each worker.
+	"""
+
+	def __init__(self, window: float, prefix: str = "ratelimit", local_max_keys: int = 100_000) -> None:
+		self.window = window
+		self.prefix = prefix
+		self._local = TTLCache[str, deque[float]](max_size=local_max_keys, ttl=window)
+		self.allowed = 0
+		self.rejected = 0
+		self.redis_errors = 0
+
+	async def hit(self, limits: Mapping[str, int], redis: aioredis.Redis | None) -> None:
+		"""Count a request against each key of `limits`, a mapping of key to its limit. A limit of 0 is no limit.
+
+		Uses the local counters only when `redis` is None.
+
+		Raises:
+			RateLimitedError
+		"""
+		limits = {f"{self.prefix}:{key}": limit for key, limit in limits.items() if limit > 0}
+		if not limits:
+			return
+		retry_after = await self._hit_shared(limits, redis) if redis is not None else None
+		if retry_after is None:
+			retry_after = self._hit_local(limits)
+		if retry_after > 0:
+			self.rejected += 1
+			raise RateLimitedError(retry_after)
+		self.allowed += 1
+
+	async def _hit_shared(self, limits: dict[str, int], redis: aioredis.Redis) -> float | None:
+		script = redis.register_script(_SLIDING_WINDOW_SCRIPT)
+		now_ms = int(time.time() * 1000)
+		args: list[int | str] = [now_ms, int(self.window * 1000), f"{now_ms}-{secrets.token_hex(4)}", *limits.values()]
+		try:
+			retry_after_ms = await script(keys=list(limits), args=args)
+		except RedisError as e:
+			self.redis_errors += 1
+			logger.warning("Could not check rate limits in Redis, falling back to local limits: %s", e)
+			return None
+		return int(retry_after_ms) / 1000
+
+	def _hit_local(self, limits: dict[str, int]) -> float:
+		now = time.monotonic()
+		windows = {}
+		retry_after = 0.0
+		for key, limit in limits.items():
+			hits = self._local.get(key) or deque()
+			while hits and hits[0] <= now - self.window:
+				hits.popleft()
+			windows[key] = hits
+			if len(hits) >= limit:
+				retry_after = max(retry_after, hits[0] + self.window - now)
+		if retry_after > 0:
+			return retry_after
+		for key, hits in windows.items():
+			hits.append(now)
+			self._local.set(key, hits)
+		return 0.0
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"allowed": self.allowed,
+			"rejected": self.rejected,
+			"redis_errors": self.redis_errors,
+			"local_keys": len(self._local),
+		}
@@ -0,0 +1,245 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Awaitable, Iterable
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Protocol, Self
+
+import redis.asyncio as aioredis
+
+from app.core import envelope, metrics
+from app.core.config import get_app_settings
+from app.db.redis import (
+	create_redis_client,
+	first_stream_id,
+	get_redis_client,
+	parse_stream_id,
+	publish_events,
+	read_stream,
+)
+
+
+class EventSubscriber(Protocol):
+	"""The pub/sub connection of an event bus, used by the event hub: the part of Redis' `PubSub` it relies on.
+
+	Messages are dicts with the `channel` and the `data` of the message, as bytes (see `app.core.envelope`).
+	"""
+
+	async def __aenter__(self) -> Self: ...
+
+	def __aexit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> Awaitable[Any]: ...
+
+	def subscribe(self, *channels: str) -> Awaitable[Any]: ...
+
+	def unsubscribe(self, *channels: str) -> Awaitable[Any]: ...
+
+	async def get_message(
+		self, ignore_subscribe_messages: bool = False, timeout: float | None = 0.0
+	) -> dict[str, Any] | None: ...
+
+
+class EventBus(Protocol):
+	"""Carries the events of the outbox and the other publishers to the event hubs, and stores the streamed ones."""
+
+	def subscriber(self) -> EventSubscriber: ...
+
+	async def publish(self, events: Iterable[tuple[str, bytes, int]]) -> None:
+		"""Publish event envelopes, given as `(channel, payload, stream_max_len)`, see `publish_events`."""
+
+	def read_stream(self, channel: str, after_id: str, batch_size: int = 500) -> AsyncIterator[dict[str, Any]]: ...
+
+	async def first_stream_id(self, channel: str) -> str | None: ...
+
+	async def aclose(self) -> None: ...
+
+
+class RedisEventBus:
+	"""Events published with Redis pub/sub and stored in Redis Streams, shared by every worker of every node.
+
+	Publishing and reading streams go through `redis`, the shared client by default, while the pub/sub connection
+	of the hub has a client of its own that leaves the binary event envelopes alone.
+	"""
+
+	def __init__(self, redis: aioredis.Redis | None = None) -> None:
+		self._redis = redis
+		self._listener: aioredis.Redis | None = None
+
+	@property
+	def redis(self) -> aioredis.Redis:
+		return self._redis or get_redis_client()
+
+	def subscriber(self) -> EventSubscriber:
+		if self._listener is None:
+			self._listener = create_redis_client(get_app_settings(), decode_responses=False)
+		pubsub: EventSubscriber = self._listener.pubsub(ignore_subscribe_messages=True)
+		return pubsub
+
+	async def publish(self, events: Iterable[tuple[str, bytes, int]]) -> None:
+		await publish_events(self.redis, events)
+
+	def read_stream(self, channel: str, after_id: str, batch_size: int = 500) -> AsyncIterator[dict[str, Any]]:
+		return read_stream(self.redis, channel, after_id, batch_size)
+
+	async def first_stream_id(self, channel: str) -> str | None:
+		return await first_stream_id(self.redis, channel)
+
+	async def aclose(self) -> None:
+		if self._listener is not None:
+			await self._listener.aclose()
+			self._listener = None
+
+
+class MemorySubscriber:
+	"""The pub/sub connection of a `MemoryEventBus`."""
+
+	def __init__(self, bus: "MemoryEventBus") -> None:
+		self._bus = bus
+		self._messages: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+		self.channels: set[str] = set()
+
+	async def __aenter__(self) -> Self:
+		return self
+
+	async def __aexit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+		await self.unsubscribe(*self.channels)
+
+	def deliver(self, message: dict[str, Any]) -> None:
+		self._messages.put_nowait(message)
+
+	async def subscribe(self, *channels: str) -> None:
+		for channel in channels:
+			self._bus._subscribers[channel].add(self)
+		self.channels.update(channels)
+
+	async def unsubscribe(self, *channels: str) -> None:
+		for channel in channels:
+			subscribers = self._bus._subscribers.get(channel)
+			if subscribers is not None:
+				subscribers.discard(self)
+				if not subscribers:
+					del self._bus._subscribers[channel]
+		self.channels.difference_update(channels)
+
+	async def get_message(
+		self, ignore_subscribe_messages: bool = False, timeout: float | None = 0.0
+	) -> dict[str, Any] | None:
+		"""The next message, waiting for it up to `timeout` seconds, or for good if it is `None`, like Redis."""
+		try:
+			if timeout == 0:
+				return self._messages.get_nowait()
+			return await asyncio.wait_for(self._messages.get(), timeout)
+		except (asyncio.QueueEmpty, TimeoutError):
+			return None
+
+
+class MemoryEventBus:
+	"""Events broadcast between the tasks of this process, without any network round trip.
+
+	Only for a single worker, e.g. single-node deployments or the tests: other processes never see the events.
+	Streams are capped at `stream_max_len` events like in Redis, and lost on restart, in which case clients that
+	resume from an unknown id are asked to resync.
+	"""
+
+	def __init__(self) -> None:
+		self._subscribers: defaultdict[str, set[MemorySubscriber]] = defaultdict(set)
+		self._streams: dict[str, deque[tuple[str, bytes]]] = {}
+		self._last_id = (0, 0)
+		self.published = 0
+
+	def _next_stream_id(self) -> str:
+		# NOTE same format and ordering as Redis: milliseconds, and a sequence within the same millisecond
+		milliseconds = time.time_ns() // 1_000_000
+		last_milliseconds, sequence = self._last_id
+		self._last_id = (milliseconds, 0) if milliseconds > last_milliseconds else (last_milliseconds, sequence + 1)
+		return "%d-%d" % self._last_id
+
+	def subscriber(self) -> MemorySubscriber:
+		return MemorySubscriber(self)
+
+	async def publish(self, events: Iterable[tuple[str, bytes, int]]) -> None:
+		for channel, payload, stream_max_len in events:
+			stream_id = ""
+			if stream_max_len:
+				stream = self._streams.get(channel)
+				if stream is None or stream.maxlen != stream_max_len:
+					stream = self._streams[channel] = deque(stream or (), maxlen=stream_max_len)
+				stream_id = self._next_stream_id()
+				stream.append((stream_id, payload))
+			message = {"channel": channel.encode(), "data": envelope.pack_message(payload, stream_id)}
+			for subscriber in self._subscribers.get(channel, ()):
+				subscriber.deliver(message)
+			self.published += 1
+
+	async def read_stream(self, channel: str, after_id: str, batch_size: int = 500) -> AsyncIterator[dict[str, Any]]:
+		after = parse_stream_id(after_id)
+		# NOTE a copy, the stream may change while the events are consumed
+		for stream_id, payload in list(self._streams.get(channel, ())):
+			if parse_stream_id(stream_id) > after:
+				event = envelope.decode(payload)
+				event["id"] = stream_id
+				yield event
+
+	async def first_stream_id(self, channel: str) -> str | None:
+		stream = self._streams.get(channel)
+		return stream[0][0] if stream else None
+
+	async def aclose(self) -> None:
+		pass
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"published": self.published,
+			"channels": len(self._subscribers),
+			"stored": sum(len(stream) for stream in self._streams.values()),
+		}
+
+
+@lru_cache
+def get_event_bus() -> EventBus:
+	"""The event bus of this worker, selected by the `EVENT_BUS` setting."""
+	if get_app_settings().event_bus == "memory":
+		bus = MemoryEventBus()
+		metrics.register("event_bus", bus.stats)
+		return bus
+	return RedisEventBus()
+
+
+def build_event(
+	event_type: str,
+	event_data: dict[str, Any],
+	username: str | None = None,
+	tags: dict[str, list[Any]] | None = None,
+) -> dict[str, Any]:
+	"""Build an event. Its `tags` are what subscribers filter it on (see `app.events.filters`), not sent to them."""
+	new_data = {
+		"timestamp": datetime.now().isoformat(sep="T", timespec="auto"),
+	}
+	event_data.update(new_data)
+	if username:
+		event_data["event_user"] = username
+	event: dict[str, Any] = {
+		"event": event_type,
+		"data": event_data,
+	}
+	if tags:
+		event["tags"] = tags
+	return event
+
+
+async def publish_event(
+	bus: EventBus,
+	channel: str,
+	event_type: str,
+	event_data: dict[str, Any],
+	username: str | None = None,
+	stream_max_len: int = 0,
+	codec: envelope.EventCodec | None = None,
+) -> None:
+	"""Publish an event on `channel`, encoded with `codec`, or the `EVENT_CODEC` setting.
+
+	With a `stream_max_len`, the event is also appended to the stream of the channel, capped to about that many
+	events, and published with its stream entry id as `id` so that clients can resume from it (see `read_stream`).
+	"""
+	payload = envelope.encode(build_event(event_type, event_data, username), codec or get_app_settings().event_codec)
+	await bus.publish([(channel, payload, stream_max_len)])
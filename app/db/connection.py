@@ -1,6 +1,8 @@
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Mapping
+from typing import Any
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from app.core.config import AppSettings
@@ -10,9 +12,50 @@ class Base(DeclarativeBase):
 	pass
 
 
+def sqlite_pragmas(app_settings: AppSettings) -> dict[str, str | int]:
+	"""The PRAGMAs set on every new SQLite connection, from the `SQLITE_*` settings."""
+	return {
+		"journal_mode": app_settings.sqlite_journal_mode,
+		"synchronous": app_settings.sqlite_synchronous,
+		# NOTE negative: a size in KiB rather than in pages
+		"cache_size": -app_settings.sqlite_cache_size_kib,
+		"mmap_size": app_settings.sqlite_mmap_size_bytes,
+		"temp_store": app_settings.sqlite_temp_store,
+		"busy_timeout": app_settings.sqlite_busy_timeout_ms,
+	}
+
+
+def set_sqlite_pragmas(engine: AsyncEngine, pragmas: Mapping[str, str | int]) -> None:
+	"""Set `pragmas` on every connection `engine` opens, before it is used."""
+
+	@event.listens_for(engine.sync_engine, "connect")
+	def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+		cursor = dbapi_connection.cursor()
+		for name, value in pragmas.items():
+			cursor.execute(f"PRAGMA {name} = {value}")
+		cursor.close()
+
+
+def create_engine(app_settings: AppSettings) -> AsyncEngine:
+	"""Create the engine of `DATABASE_URL`, with the `DATABASE_POOL_*` settings and, for SQLite, the `SQLITE_*` ones."""
+	url = make_url(app_settings.database_url)
+	options: dict[str, Any] = {}
+	# NOTE an in-memory SQLite database lives in its only connection, there is no pool to size
+	if url.database not in (None, "", ":memory:"):
+		options.update(
+			pool_size=app_settings.database_pool_size,
+			max_overflow=app_settings.database_max_overflow,
+			pool_timeout=app_settings.database_pool_timeout_seconds,
+		)
+	engine = create_async_engine(url, **options)
+	if url.get_backend_name() == "sqlite":
+		set_sqlite_pragmas(engine, sqlite_pragmas(app_settings))
+	return engine
+
+
 async def create_db(app_settings: AppSettings) -> None:
 	global SessionLocal
-	engine = create_async_engine(app_settings.database_url)
+	engine = create_engine(app_settings)
 	SessionLocal = async_sessionmaker(  # type: ignore[name-defined]
 		bind=engine,
 		class_=AsyncSession,
@@ -24,6 +67,15 @@ async def create_db(app_settings: AppSettings) -> None:
 		await conn.run_sync(Base.metadata.create_all)
 
 
+def create_session() -> AsyncSession:
+	"""Create a session that is not bound to a request, e.g. for streaming responses or background tasks.
+
+	The caller is responsible for closing it, preferably with `async with create_session() as session:`.
+	"""
+	session: AsyncSession = SessionLocal()  # type: ignore[name-defined]
+	return session
+
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
 	async with SessionLocal() as session:  # type: ignore[name-defined]
 		yield session
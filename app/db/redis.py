@@ -1,37 +1,171 @@
-import json
-from collections.abc import AsyncGenerator
-from datetime import datetime
+import asyncio
+from collections.abc import AsyncIterator, Iterable
 from typing import Any
 
 import redis.asyncio as aioredis
+from redis.asyncio.connection import AbstractConnection
+from redis.client import NEVER_DECODE
+from redis.exceptions import ConnectionError
 
-from app.core.config import get_app_settings
+from app.core import envelope, metrics
+from app.core.config import AppSettings
 
+STREAM_EVENT_FIELD = "event"
+# NOTE appends an envelope to a stream and publishes it with the id of the stream entry, in one round trip
+_STREAM_PUBLISH_SCRIPT = f"""
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', '{STREAM_EVENT_FIELD}', ARGV[1])
+redis.call('PUBLISH', ARGV[3], id .. '{envelope.MESSAGE_ID_SEPARATOR.decode()}' .. ARGV[1])
+return id
+"""
 
-async def get_redis() -> AsyncGenerator[aioredis.Redis, None]:
-	settings = get_app_settings()
-	async with aioredis.from_url(  # type: ignore[no-untyped-call]
+_redis: aioredis.Redis | None = None
+
+
+class InstrumentedConnectionPool(aioredis.BlockingConnectionPool):
+	"""`BlockingConnectionPool` that counts how often commands had to wait for a free connection."""
+
+	def __init__(self, **kwargs: Any) -> None:
+		super().__init__(**kwargs)
+		self.acquired = 0
+		self.waited = 0
+		self.timeouts = 0
+
+	async def get_connection(self, command_name: Any, *keys: Any, **options: Any) -> AbstractConnection:
+		self.acquired += 1
+		if not self.can_get_connection():
+			self.waited += 1
+		try:
+			connection: AbstractConnection = await super().get_connection(  # type: ignore[no-untyped-call]
+				command_name, *keys, **options
+			)
+			return connection
+		except ConnectionError as e:
+			if isinstance(e.__cause__, asyncio.TimeoutError):
+				self.timeouts += 1
+			raise
+
+	def stats(self) -> dict[str, int]:
+		idle = len(self._available_connections)
+		in_use = len(self._in_use_connections)
+		return {
+			"max_connections": self.max_connections,
+			"connections": idle + in_use,
+			"in_use": in_use,
+			"idle": idle,
+			"acquired": self.acquired,
+			"waited": self.waited,
+			"timeouts": self.timeouts,
+		}
+
+
+def create_redis_pool(settings: AppSettings, decode_responses: bool = True) -> InstrumentedConnectionPool:
+	return InstrumentedConnectionPool.from_url(
 		settings.redis_url,
-		decode_responses=True,
-	) as redis:
-		yield redis
+		decode_responses=decode_responses,
+		max_connections=settings.redis_max_connections,
+		timeout=settings.redis_pool_timeout_seconds,
+		socket_timeout=settings.redis_socket_timeout_seconds,
+		socket_connect_timeout=settings.redis_connect_timeout_seconds,
+		health_check_interval=settings.redis_health_check_interval_seconds,
+	)
+
+
+def create_redis_client(settings: AppSettings, decode_responses: bool = True) -> aioredis.Redis:
+	"""Create a client with its own connection pool, closed along with the client.
+
+	Without `decode_responses` replies are returned as bytes, e.g. for the pub/sub connection of the event hub,
+	which receives binary event envelopes.
+	"""
+	return aioredis.Redis.from_pool(create_redis_pool(settings, decode_responses))
+
+
+def init_redis(settings: AppSettings) -> aioredis.Redis:
+	"""Create the client shared by the requests of this worker."""
+	global _redis
+	pool = create_redis_pool(settings)
+	_redis = aioredis.Redis.from_pool(pool)
+	metrics.register("redis_pool", pool.stats)
+	return _redis
+
+
+async def close_redis() -> None:
+	global _redis
+	if _redis is not None:
+		await _redis.aclose()
+		_redis = None
+
 
+def get_redis_client() -> aioredis.Redis:
+	"""The shared client, for code that does not run in a request."""
+	if _redis is None:
+		raise RuntimeError("Redis is not initialized, call init_redis first")
+	return _redis
 
-async def publish_event(
+
+async def get_redis() -> aioredis.Redis:
+	return get_redis_client()
+
+
+async def publish_events(redis: aioredis.Redis, events: Iterable[tuple[str, bytes, int]]) -> None:
+	"""Publish event envelopes, given as `(channel, payload, stream_max_len)`, in a single round trip.
+
+	With a `stream_max_len`, an envelope is also appended to the stream of the channel, capped to about that many
+	events, and published with its stream entry id so that clients can resume from it (see `read_stream`). Each
+	envelope is sent as is, to the stream and in the pub/sub message (see `app.core.envelope.pack_message`).
+	"""
+	script = redis.register_script(_STREAM_PUBLISH_SCRIPT)
+	async with redis.pipeline(transaction=False) as pipe:
+		for channel, payload, stream_max_len in events:
+			if stream_max_len:
+				await script(keys=[stream_key(channel)], args=[payload, stream_max_len, channel], client=pipe)
+			else:
+				pipe.publish(channel, envelope.pack_message(payload))
+		await pipe.execute()
+
+
+def stream_key(channel: str) -> str:
+	return f"events:{channel}"
+
+
+def parse_stream_id(stream_id: str) -> tuple[int, int]:
+	"""Split a stream entry id such as `1700000000000-0` into comparable parts.
+
+	Raises:
+		ValueError: if `stream_id` is not a stream entry id
+	"""
+	milliseconds, _, sequence = stream_id.partition("-")
+	return int(milliseconds), int(sequence or 0)
+
+
+async def read_stream(
 	redis: aioredis.Redis,
 	channel: str,
-	event_type: str,
-	event_data: dict[str, Any],
-	username: str | None = None,
-) -> None:
-	new_data = {
-		"timestamp": datetime.now().isoformat(sep="T", timespec="auto"),
-	}
-	event_data.update(new_data)
-	if username:
-		event_data["event_user"] = username
-	event = {
-		"event": event_type,
-		"data": event_data,
-	}
-	await redis.publish(channel, json.dumps(event))
+	after_id: str,
+	batch_size: int = 500,
+) -> AsyncIterator[dict[str, Any]]:
+	"""Yield the events stored in the stream of `channel` after the entry `after_id`, oldest first.
+
+	Raises:
+		ValueError: if an entry is not a valid event envelope
+	"""
+	key = stream_key(channel)
+	field = STREAM_EVENT_FIELD.encode()
+	while True:
+		# NOTE envelopes may be binary, so the reply is not decoded whatever the client does
+		response = await redis.execute_command(  # type: ignore[no-untyped-call]
+			"XREAD", "COUNT", batch_size, "STREAMS", key, after_id, **{NEVER_DECODE: True}
+		)
+		if not response:
+			return
+		for entry_id, fields in response[0][1]:
+			event = envelope.decode(fields[field])
+			event["id"] = after_id = entry_id.decode()
+			yield event
+
+
+async def first_stream_id(redis: aioredis.Redis, channel: str) -> str | None:
+	"""The id of the oldest event still stored in the stream of `channel`, if any."""
+	entries = await redis.execute_command(  # type: ignore[no-untyped-call]
+		"XRANGE", stream_key(channel), "-", "+", "COUNT", 1, **{NEVER_DECODE: True}
+	)
+	return entries[0][0].decode() if entries else None
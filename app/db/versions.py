@@ -0,0 +1,33 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.connection import Base
+
+
+class TableVersion(Base):
+	"""Change counter of a table, bumped by every write to the table within the same transaction."""
+
+	__tablename__ = "table_versions"
+
+	name: Mapped[str] = mapped_column(primary_key=True)
+	version: Mapped[int]
+
+
+async def bump_table_version(db: AsyncSession, name: str) -> int:
+	"""Increment the change counter of a table and return its new value. Does not commit."""
+	statement = (
+		insert(TableVersion)
+		.values(name=name, version=1)
+		.on_conflict_do_update(index_elements=[TableVersion.name], set_={"version": TableVersion.version + 1})
+		.returning(TableVersion.version)
+	)
+	result = await db.execute(statement)
+	return result.scalar_one()
+
+
+async def get_table_version(db: AsyncSession, name: str) -> int:
+	"""Get the change counter of a table, 0 if it was never written to."""
+	result = await db.execute(select(TableVersion.version).where(TableVersion.name == name))
+	return result.scalar_one_or_none() or 0
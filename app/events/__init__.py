@@ -0,0 +1,7 @@
+from . import filters, hub, outbox
+
+__all__ = [
+	"filters",
+	"hub",
+	"outbox",
+]
@@ -0,0 +1,95 @@
+from collections import Counter, defaultdict
+from collections.abc import Hashable, Iterator
+from itertools import chain
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel, ConfigDict
+
+# NOTE `event` is the event type, the other dimensions are matched against the `tags` of the events
+FILTER_DIMENSIONS = ("book_id", "author", "genre", "event")
+
+SubscriberT = TypeVar("SubscriberT", bound=Hashable)
+
+
+class EventFilter(BaseModel):
+	"""Events a client subscribes to: an event matches if it matches every given dimension, and it matches a
+	dimension if it has any of its values. Dimensions that are not given match every event."""
+
+	book_id: list[int] | None = None
+	author: list[str] | None = None
+	genre: list[str] | None = None
+	event: list[str] | None = None
+
+	model_config = ConfigDict(extra="forbid")
+
+	def constraints(self) -> dict[str, frozenset[Any]]:
+		return {dimension: frozenset(values) for dimension in FILTER_DIMENSIONS if (values := getattr(self, dimension))}
+
+	def matches(self, event: dict[str, Any]) -> bool:
+		"""Check a single event, e.g. a replayed one. Live events are matched through a `SubscriptionIndex`."""
+		tags = event_tags(event)
+		return all(not values.isdisjoint(tags.get(dimension, ())) for dimension, values in self.constraints().items())
+
+
+def event_tags(event: dict[str, Any]) -> dict[str, list[Any]]:
+	"""The values of an event for each filter dimension."""
+	return {**event.get("tags", {}), "event": [event.get("event")]}
+
+
+def client_event(event: dict[str, Any]) -> dict[str, Any]:
+	"""The part of an event that is sent to clients, without its tags."""
+	return {key: value for key, value in event.items() if key != "tags"}
+
+
+class SubscriptionIndex(Generic[SubscriberT]):
+	"""The subscribers of a channel, indexed by the values of their filters.
+
+	`match` looks the values of an event up in the index, so that its cost depends on the number of subscribers
+	that accept one of these values rather than on the number of subscribers: filters are never checked one by one.
+	"""
+
+	def __init__(self) -> None:
+		self._unfiltered: set[SubscriberT] = set()
+		self._constraints: dict[SubscriberT, dict[str, frozenset[Any]]] = {}
+		# NOTE the filtered subscribers that accept each value of each dimension
+		self._by_value: dict[str, defaultdict[Any, set[SubscriberT]]] = {d: defaultdict(set) for d in FILTER_DIMENSIONS}
+
+	def __len__(self) -> int:
+		return len(self._unfiltered) + len(self._constraints)
+
+	def __iter__(self) -> Iterator[SubscriberT]:
+		return chain(self._unfiltered, self._constraints)
+
+	def add(self, subscriber: SubscriberT, event_filter: EventFilter | None = None) -> None:
+		constraints = event_filter.constraints() if event_filter is not None else {}
+		if not constraints:
+			self._unfiltered.add(subscriber)
+			return
+		self._constraints[subscriber] = constraints
+		for dimension, values in constraints.items():
+			for value in values:
+				self._by_value[dimension][value].add(subscriber)
+
+	def remove(self, subscriber: SubscriberT) -> None:
+		self._unfiltered.discard(subscriber)
+		constraints = self._constraints.pop(subscriber, None)
+		if constraints is None:
+			return
+		for dimension, values in constraints.items():
+			by_value = self._by_value[dimension]
+			for value in values:
+				by_value[value].discard(subscriber)
+				if not by_value[value]:
+					del by_value[value]
+
+	def match(self, event: dict[str, Any]) -> Iterator[SubscriberT]:
+		"""The subscribers whose filter matches `event`."""
+		if not self._constraints:
+			return iter(self._unfiltered)
+		# NOTE a filtered subscriber matches if the event hits each dimension it constrains
+		hits = Counter[SubscriberT]()
+		for dimension, values in event_tags(event).items():
+			by_value = self._by_value[dimension]
+			hits.update(set[SubscriberT]().union(*(by_value.get(value, ()) for value in values)))
+		matched = (subscriber for subscriber, count in hits.items() if count == len(self._constraints[subscriber]))
+		return chain(self._unfiltered, matched)
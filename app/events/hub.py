@@ -0,0 +1,303 @@
+import asyncio
+import inspect
+import itertools
+import json
+import logging
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+from contextlib import asynccontextmanager
+from functools import cached_property, lru_cache
+from typing import Any, Literal
+
+from redis.exceptions import RedisError
+from sse_starlette import ServerSentEvent
+
+from app.core import envelope, metrics
+from app.db.bus import EventBus, EventSubscriber
+from app.events.filters import EventFilter, SubscriptionIndex, client_event
+
+logger = logging.getLogger(__name__)
+
+Event = dict[str, Any]
+EventHandler = Callable[[Event], None]
+SubscribeHandler = Callable[[], Awaitable[None] | None]
+OverflowPolicy = Literal["drop_oldest", "disconnect", "conflate"]
+
+
+def _object_id(event: Event) -> Any:
+	data = event.get("data")
+	return data.get("id") if isinstance(data, dict) else None
+
+
+class SharedEvent:
+	"""An event on its way to clients. It is encoded for them once, and the same frames are sent to all of them."""
+
+	def __init__(self, event: Event) -> None:
+		self.event = event
+
+	@cached_property
+	def sse_frame(self) -> bytes:
+		"""The ready-to-send server-sent event."""
+		return ServerSentEvent(
+			id=self.event.get("id"),
+			event=self.event.get("event"),
+			data=json.dumps(self.event.get("data")),
+		).encode()
+
+	@cached_property
+	def ws_message(self) -> str:
+		"""The ready-to-send WebSocket text message."""
+		return json.dumps(client_event(self.event))
+
+
+def _merge(buffered: Event, event: Event) -> Event:
+	"""Conflate two events of the same object into one that leaves a client in the same state."""
+	if event["event"].endswith("_deleted") or buffered["event"].endswith("_deleted"):
+		return event
+	# NOTE updates only carry the changed fields, so the fields of both are kept, and a created object stays created
+	event_type = buffered["event"] if buffered["event"].endswith("_created") else event["event"]
+	return {**event, "event": event_type, "data": {**buffered["data"], **event["data"]}}
+
+
+class Subscription:
+	"""Events of one channel for one client, buffered up to `max_size` events.
+
+	What happens to a client that falls behind depends on the `policy`:
+	- `drop_oldest`: the oldest buffered event is dropped to make room.
+	- `disconnect`: the subscription ends, so that the client reconnects, and resumes from its `Last-Event-ID` when
+	the channel is stored in a stream.
+	- `conflate`: a new event replaces the buffered event of the same object, by the `id` of their data, so that only
+	the latest state of e.g. each book is kept. Beyond `max_size` distinct objects the oldest event is dropped.
+
+	Dropped, conflated and disconnected subscriptions are counted in `counters`.
+	"""
+
+	def __init__(
+		self,
+		channel: str,
+		max_size: int,
+		policy: OverflowPolicy = "drop_oldest",
+		counters: Counter[str] | None = None,
+	) -> None:
+		self.channel = channel
+		self.max_size = max_size
+		self.policy = policy
+		self.counters = Counter[str]() if counters is None else counters
+		self.disconnected = False
+		# NOTE keyed by object id when conflating, otherwise by arrival
+		self._buffer: dict[Hashable, SharedEvent] = {}
+		self._arrivals = itertools.count()
+		self._ready = asyncio.Event()
+
+	def put(self, event: SharedEvent) -> None:
+		if self.disconnected:
+			return
+		key: Hashable = next(self._arrivals)
+		if self.policy == "conflate" and (object_id := _object_id(event.event)) is not None:
+			key = ("id", object_id)
+			buffered = self._buffer.pop(key, None)
+			if buffered is not None:
+				event = SharedEvent(_merge(buffered.event, event.event))
+				self.counters["conflated"] += 1
+		if len(self._buffer) >= self.max_size:
+			if self.policy == "disconnect":
+				self.disconnected = True
+				self._buffer.clear()
+				self.counters["disconnected"] += 1
+				self._ready.set()
+				return
+			del self._buffer[next(iter(self._buffer))]
+			self.counters["dropped"] += 1
+		self._buffer[key] = event
+		self._ready.set()
+
+	def __aiter__(self) -> AsyncIterator[SharedEvent]:
+		return self
+
+	async def __anext__(self) -> SharedEvent:
+		while not self._buffer:
+			if self.disconnected:
+				raise StopAsyncIteration
+			self._ready.clear()
+			await self._ready.wait()
+		return self._buffer.pop(next(iter(self._buffer)))
+
+
+class EventHub:
+	"""Fans the events of the channels of the event bus out to the clients and listeners of this worker.
+
+	The hub holds a single pub/sub connection, subscribed once to every channel that has a listener or a
+	client, and blocks on it while there is nothing to read. Each event is decoded once and handed to the
+	listeners registered with `add_listener`, then to the `Subscription` queue of every client of the channel
+	whose filter it matches, as one `SharedEvent` encoded at most once per protocol whatever the number of
+	clients. Idle clients cost no CPU at all. Filters are looked up in a `SubscriptionIndex`
+	once per event, and clients never see the events they filter out.
+	"""
+
+	def __init__(self) -> None:
+		self._listeners: dict[str, list[tuple[EventHandler, SubscribeHandler | None]]] = defaultdict(list)
+		self._subscriptions: dict[str, SubscriptionIndex[Subscription]] = defaultdict(SubscriptionIndex)
+		self._pubsub: EventSubscriber | None = None
+		self._channels_changed = asyncio.Event()
+		self.received = 0
+		self.delivered = 0
+		self.malformed = 0
+		self.errors = 0
+		self._subscription_counters = Counter[str]()
+
+	@property
+	def channels(self) -> set[str]:
+		return {channel for channel in (*self._listeners, *self._subscriptions) if self._is_wanted(channel)}
+
+	def _is_wanted(self, channel: str) -> bool:
+		return bool(self._listeners.get(channel) or len(self._subscriptions.get(channel, ())))
+
+	def add_listener(self, channel: str, on_event: EventHandler, on_subscribe: SubscribeHandler | None = None) -> None:
+		"""Pass every event of `channel` to `on_event`, which replaces its previous registration on the channel, e.g.
+		when the application starts again with the same hub.
+
+		Events published while the hub is disconnected are lost, so `on_subscribe` is called, and awaited if it is
+		a coroutine function, every time the subscription is (re)established to let the listener resynchronize.
+		"""
+		listeners = [listener for listener in self._listeners[channel] if listener[0] != on_event]
+		self._listeners[channel] = [*listeners, (on_event, on_subscribe)]
+		self._channels_changed.set()
+
+	async def _subscribe_channel(self, channel: str) -> None:
+		if self._pubsub is None:
+			# NOTE subscribed by `run` once connected
+			return
+		try:
+			await self._pubsub.subscribe(channel)
+		except (RedisError, OSError) as e:
+			# NOTE the listening side notices the broken connection and resubscribes to every channel
+			logger.warning("Could not subscribe to channel '%s': %s", channel, e)
+		self._channels_changed.set()
+
+	async def _unsubscribe_channel(self, channel: str) -> None:
+		if self._pubsub is None:
+			return
+		try:
+			await self._pubsub.unsubscribe(channel)
+		except (RedisError, OSError) as e:
+			logger.warning("Could not unsubscribe from channel '%s': %s", channel, e)
+
+	@asynccontextmanager
+	async def subscribe(
+		self,
+		channel: str,
+		max_size: int,
+		policy: OverflowPolicy = "drop_oldest",
+		event_filter: EventFilter | None = None,
+	) -> AsyncIterator[Subscription]:
+		"""Buffer the events of `channel` that match `event_filter`, or all of them, for a client until the context
+		exits, see `Subscription`."""
+		subscription = Subscription(channel, max_size, policy, self._subscription_counters)
+		is_new_channel = not self._is_wanted(channel)
+		self._subscriptions[channel].add(subscription, event_filter)
+		try:
+			if is_new_channel:
+				await self._subscribe_channel(channel)
+			yield subscription
+		finally:
+			self._subscriptions[channel].remove(subscription)
+			if not self._is_wanted(channel):
+				del self._subscriptions[channel]
+				await self._unsubscribe_channel(channel)
+
+	def set_filter(self, subscription: Subscription, event_filter: EventFilter | None) -> None:
+		"""Replace the filter of an active subscription, which then only receives the events matching it."""
+		index = self._subscriptions[subscription.channel]
+		index.remove(subscription)
+		index.add(subscription, event_filter)
+
+	def dispatch(self, channel: str, event: Event) -> None:
+		"""Hand an event of `channel` to its listeners and to the clients whose filter it matches.
+
+		A listener or a client that fails is logged and counted in `errors`, the others still get the event.
+		"""
+		for on_event, _ in self._listeners.get(channel, ()):
+			try:
+				on_event(event)
+			except Exception:
+				self.errors += 1
+				logger.exception("Listener %r failed on an event of channel '%s'", on_event, channel)
+		index = self._subscriptions.get(channel)
+		if index is None:
+			return
+		shared = SharedEvent(event)
+		for subscription in index.match(event):
+			try:
+				subscription.put(shared)
+			except Exception:
+				self.errors += 1
+				logger.exception("Could not deliver an event of channel '%s' to a client", channel)
+				continue
+			self.delivered += 1
+
+	def _handle_message(self, message: dict[str, Any]) -> None:
+		self.received += 1
+		channel = message["channel"].decode()
+		try:
+			self.dispatch(channel, envelope.decode_message(message["data"]))
+		except (ValueError, KeyError, TypeError):
+			self.malformed += 1
+			logger.warning("Ignoring malformed event on channel '%s': %r", channel, message["data"])
+
+	async def _on_subscribe(self) -> None:
+		for listeners in list(self._listeners.values()):
+			for _, on_subscribe in listeners:
+				if on_subscribe is not None:
+					result = on_subscribe()
+					if inspect.isawaitable(result):
+						await result
+
+	async def run(self, bus: EventBus, idle_timeout: float = 30.0, retry_delay: float = 1.0) -> None:
+		"""Listen to the channels of the hub on the event bus until cancelled, reconnecting after any error.
+
+		Reads wake up after `idle_timeout` seconds without events, so that the health checks of the client get a
+		chance to detect a dead connection. Blocking reads would instead fail on the socket timeout of the client.
+		"""
+		while True:
+			try:
+				async with bus.subscriber() as pubsub:
+					self._pubsub = pubsub
+					while not (channels := self.channels):
+						self._channels_changed.clear()
+						await self._channels_changed.wait()
+					await pubsub.subscribe(*channels)
+					await self._on_subscribe()
+					while True:
+						message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=idle_timeout)
+						if message is not None:
+							self._handle_message(message)
+			except (RedisError, OSError) as e:
+				logger.warning("Event hub connection lost (%s), retrying in %ss", e, retry_delay)
+				await asyncio.sleep(retry_delay)
+			except Exception:
+				# NOTE e.g. a failing `on_subscribe`: without the hub, caches go stale and clients get no events
+				self.errors += 1
+				logger.exception("Event hub failed, restarting in %ss", retry_delay)
+				await asyncio.sleep(retry_delay)
+			finally:
+				self._pubsub = None
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"channels": len(self.channels),
+			"subscribers": sum(len(index) for index in self._subscriptions.values()),
+			"received": self.received,
+			"delivered": self.delivered,
+			"malformed": self.malformed,
+			"errors": self.errors,
+			"dropped": self._subscription_counters["dropped"],
+			"conflated": self._subscription_counters["conflated"],
+			"disconnected": self._subscription_counters["disconnected"],
+		}
+
+
+@lru_cache
+def get_event_hub() -> EventHub:
+	hub = EventHub()
+	metrics.register("event_hub", hub.stats)
+	return hub
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from functools import lru_cache
+from typing import Any
+
+from redis.exceptions import RedisError
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core import envelope, metrics
+from app.core.config import get_app_settings
+from app.db.bus import EventBus, build_event
+from app.db.connection import Base, create_session
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxEvent(Base):
+	"""Event waiting to be published, written in the same transaction as the change it describes."""
+
+	__tablename__ = "event_outbox"
+
+	id: Mapped[int] = mapped_column(primary_key=True)
+	channel: Mapped[str]
+	payload: Mapped[bytes]  # the event envelope, see `app.core.envelope`
+	stream_max_len: Mapped[int] = mapped_column(default=0)
+	# NOTE epoch seconds until which a publisher owns the event, 0 if none does
+	claimed_until: Mapped[float] = mapped_column(default=0)
+
+
+async def add_event(
+	db: AsyncSession,
+	channel: str,
+	event_type: str,
+	event_data: dict[str, Any],
+	username: str | None = None,
+	stream_max_len: int = 0,
+	tags: dict[str, list[Any]] | None = None,
+) -> None:
+	"""Queue an event for the outbox publisher. Does not commit, the event is published only if the caller does.
+
+	The event is encoded once, here, with the `EVENT_CODEC` setting, and published as is.
+	"""
+	payload = envelope.encode(build_event(event_type, event_data, username, tags), get_app_settings().event_codec)
+	await db.execute(
+		insert(OutboxEvent).values(channel=channel, payload=payload, stream_max_len=stream_max_len),
+	)
+
+
+class OutboxPublisher:
+	"""Publishes the events of the outbox to the event bus in batches, oldest first.
+
+	Delivery is at least once: a batch is claimed for `lease` seconds, published in one pipelined round trip, and
+	only then deleted. A batch that fails or whose publisher dies is published again once its lease expires,
+	possibly by another worker. Writers call `wake` after committing an event so that it is published right away,
+	and the outbox is also polled every `interval` seconds.
+	"""
+
+	def __init__(self, batch_size: int, interval: float, lease: float) -> None:
+		self.batch_size = batch_size
+		self.interval = interval
+		self.lease = lease
+		self._wakeup = asyncio.Event()
+		self.published = 0
+		self.batches = 0
+		self.errors = 0
+
+	def wake(self) -> None:
+		self._wakeup.set()
+
+	async def _claim(self, db: AsyncSession) -> list[OutboxEvent]:
+		now = time.time()
+		batch = (
+			select(OutboxEvent.id)
+			.where(OutboxEvent.claimed_until < now)
+			.order_by(OutboxEvent.id)
+			.limit(self.batch_size)
+		)
+		result = await db.execute(
+			update(OutboxEvent)
+			.where(OutboxEvent.id.in_(batch.scalar_subquery()))
+			.values(claimed_until=now + self.lease)
+			.returning(OutboxEvent),
+		)
+		events = sorted(result.scalars().all(), key=lambda event: event.id)
+		await db.commit()
+		return events
+
+	async def publish_pending(self, bus: EventBus) -> int:
+		"""Publish one batch of events and return its size."""
+		async with create_session() as db:
+			events = await self._claim(db)
+			if not events:
+				return 0
+			await bus.publish([(event.channel, event.payload, event.stream_max_len) for event in events])
+			await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+			await db.commit()
+		self.published += len(events)
+		self.batches += 1
+		return len(events)
+
+	async def run(self, bus: EventBus, retry_delay: float = 1.0) -> None:
+		"""Publish the outbox until cancelled."""
+		while True:
+			self._wakeup.clear()
+			try:
+				if await self.publish_pending(bus) == self.batch_size:
+					continue
+			except (RedisError, OSError, SQLAlchemyError) as e:
+				self.errors += 1
+				logger.warning("Could not publish the event outbox (%s), retrying in %ss", e, retry_delay)
+				await asyncio.sleep(retry_delay)
+				continue
+			with suppress(TimeoutError):
+				await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+
+	def stats(self) -> dict[str, int]:
+		return {
+			"published": self.published,
+			"batches": self.batches,
+			"errors": self.errors,
+		}
+
+
+@lru_cache
+def get_outbox_publisher() -> OutboxPublisher:
+	settings = get_app_settings()
+	publisher = OutboxPublisher(
+		batch_size=settings.outbox_batch_size,
+		interval=settings.outbox_interval_seconds,
+		lease=settings.outbox_lease_seconds,
+	)
+	metrics.register("event_outbox", publisher.stats)
+	return publisher
@@ -1,4 +1,6 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from functools import partial
 from typing import AsyncGenerator
 
 import uvicorn
@@ -6,8 +8,17 @@ from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 
 from app.api import api_router
+from app.api.books import REDIS_BOOK_CHANNEL
+from app.auth import security
+from app.auth.cache import REDIS_USER_CHANNEL, get_user_cache
+from app.auth.revocation import REDIS_TOKEN_CHANNEL, get_revocation_list
+from app.books.cache import get_book_cache
 from app.core import config
+from app.db.bus import get_event_bus
 from app.db.connection import create_db
+from app.db.redis import close_redis, init_redis
+from app.events.hub import get_event_hub
+from app.events.outbox import get_outbox_publisher
 
 
 class BooksAPI(FastAPI):
@@ -18,8 +29,31 @@ class BooksAPI(FastAPI):
 async def lifespan(app: BooksAPI) -> AsyncGenerator[None, None]:
 	# startup
 	await create_db(app.settings)
+	security.get_signing_key()
+	redis = init_redis(app.settings)
+	await security.calibrate_password_hashing(redis)
+	book_cache = get_book_cache()
+	user_cache = get_user_cache()
+	revocations = get_revocation_list()
+	hub = get_event_hub()
+	bus = get_event_bus()
+	hub.add_listener(REDIS_BOOK_CHANNEL, book_cache.handle_event, on_subscribe=book_cache.clear_local)
+	hub.add_listener(REDIS_USER_CHANNEL, user_cache.handle_event, on_subscribe=user_cache.clear)
+	hub.add_listener(REDIS_TOKEN_CHANNEL, revocations.handle_event, on_subscribe=partial(revocations.reload, redis))
+	background_tasks = [
+		asyncio.create_task(hub.run(bus, idle_timeout=app.settings.redis_health_check_interval_seconds)),
+		asyncio.create_task(get_outbox_publisher().run(bus)),
+		# NOTE revoked tokens expire with the access tokens, so the rebuilt filter drops the expired ones
+		asyncio.create_task(revocations.refresh_forever(redis, interval=app.settings.jwt_expire_minutes * 60)),
+	]
 	yield
 	# shutdown
+	for task in background_tasks:
+		task.cancel()
+		with suppress(asyncio.CancelledError):
+			await task
+	await bus.aclose()
+	await close_redis()
 
 
 def create_app(settings: config.AppSettings | None = None) -> BooksAPI:
@@ -0,0 +1,64 @@
+"""Compare the per-request authentication overhead with the verified-token cache on and off.
+
+`decode` is the JWT verification alone, and `get_current_user` is the whole dependency run by every protected route,
+including the user lookup through the user cache.
+
+Usage:
+	python -m benchmarks.bench_auth [--repeat 10000]
+"""
+
+import argparse
+import asyncio
+import os
+
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import insert
+
+from app.api.dependencies import get_current_user
+from app.auth import security
+from app.auth.cache import get_user_cache
+from app.auth.revocation import get_revocation_list
+from app.auth.schemas import User
+from app.core import config
+from app.db.redis import create_redis_client
+from benchmarks.common import measure, report, seeded_session
+
+
+def configure(token_cache_max_size: int) -> config.AppSettings:
+	os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+	os.environ["TOKEN_CACHE_MAX_SIZE"] = str(token_cache_max_size)
+	for cached in (config.get_app_settings, security.get_signing_key, security.get_token_cache):
+		cached.cache_clear()
+	return config.get_app_settings()
+
+
+async def main(repeat: int) -> None:
+	async with seeded_session(0) as session_factory:
+		async with session_factory() as session:
+			await session.execute(insert(User).values(username="reader", password_hash="unused"))
+			await session.commit()
+
+			for mode, max_size in (("cache off", 0), ("cache on", 10_000)):
+				settings = configure(max_size)
+				token = security.create_access_token(subject="reader")
+				credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+				user_cache = get_user_cache()
+				# NOTE only read when the revocation filter reports a possible hit, which never happens here
+				redis = create_redis_client(settings)
+				revocations = get_revocation_list()
+
+				async def decode() -> None:
+					security.decode_access_token(token)
+
+				async def current_user() -> None:
+					await get_current_user(session, credentials, user_cache, settings, redis, revocations)
+
+				report(f"decode ({mode})", await measure(decode, repeat=repeat))
+				report(f"get_current_user ({mode})", await measure(current_user, repeat=repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--repeat", type=int, default=10_000)
+	args = parser.parse_args()
+	asyncio.run(main(args.repeat))
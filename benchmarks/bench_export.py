@@ -0,0 +1,91 @@
+"""Measure the throughput and peak memory of the catalog export.
+
+Each mode runs in its own process so that its peak RSS is not polluted by seeding or by the other modes:
+- `ndjson` and `csv` stream the catalog like `GET /books/export`.
+- `pages` crawls the catalog with 100-row `GET /books` pages and keeps the encoded pages, like a client would.
+- `list` loads every row in one `crud.get_books` call, as a reference for an unbounded query.
+
+Usage:
+	python -m benchmarks.bench_export [--rows 1000000] [--modes ndjson csv pages list]
+"""
+
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from app.books import crud, export, models
+from app.core.config import AppSettings
+from app.db.connection import create_db, create_session
+from benchmarks.common import seeded_database
+
+MODES = ("ndjson", "csv", "pages", "list")
+PAGE_SIZE = 100
+
+
+def peak_rss_mb() -> float:
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_mode(mode: str, path: Path) -> None:
+	await create_db(AppSettings(database_url=f"sqlite+aiosqlite:///{path}", jwt_secret="benchmark"))
+	rss_before = peak_rss_mb()
+	rows = 0
+	size = 0
+	started = time.perf_counter()
+
+	if mode in ("ndjson", "csv"):
+		async for chunk in export.export_books(mode):
+			rows += chunk.count("\n")
+			size += len(chunk)
+		if mode == "csv":
+			rows -= 1  # header
+	elif mode == "pages":
+		pages = []
+		async with create_session() as session:
+			after = 0
+			while books := await crud.get_books(session, limit=PAGE_SIZE, after=after):
+				page = models.PageModel[models.BookResponseModel](
+					items=[models.BookResponseModel.model_validate(book) for book in books]
+				)
+				pages.append(page.model_dump_json())
+				rows += len(books)
+				after = books[-1].id
+		size = sum(len(page) for page in pages)
+	else:
+		async with create_session() as session:
+			books = await crud.get_books(session, limit=-1)
+			payload = models.PageModel[models.BookResponseModel](
+				items=[models.BookResponseModel.model_validate(book) for book in books]
+			).model_dump_json()
+			rows = len(books)
+			size = len(payload)
+
+	elapsed = time.perf_counter() - started
+	print(
+		f"{mode:<8} {rows:>10,} rows  {rows / elapsed:>10,.0f} rows/s  {size / elapsed / 2**20:>7.1f} MiB/s  "
+		f"peak RSS {peak_rss_mb():>7.1f} MiB (+{peak_rss_mb() - rss_before:.1f} MiB)"
+	)
+
+
+def main(rows: int, modes: list[str]) -> None:
+	with seeded_database(rows) as path:
+		for mode in modes:
+			command = [sys.executable, "-m", "benchmarks.bench_export", "--run", mode, "--db", str(path)]
+			subprocess.run(command, check=True)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=1_000_000)
+	parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+	parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+	parser.add_argument("--db", type=Path, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.run:
+		asyncio.run(run_mode(args.run, args.db))
+	else:
+		main(args.rows, args.modes)
@@ -0,0 +1,74 @@
+"""CPU cost of fanning one event out to SSE clients, with the frame encoded per client or shared by all of them.
+
+Each run hands one pub/sub message to the event hub, which decodes it and queues it for every client, then takes
+the frame every client would send from its queue:
+- `decode and encode per client`: each client decodes the envelope and encodes its own frame.
+- `encode per client`: the event is decoded once, and each client encodes its own frame.
+- `shared frame`: the event is decoded and encoded once, and all clients send the same bytes.
+
+Usage:
+	python -m benchmarks.bench_fanout [--clients 1000] [--repeat 200]
+"""
+
+import argparse
+import asyncio
+import json
+from collections.abc import Callable
+from contextlib import AsyncExitStack
+from typing import Any
+
+from sse_starlette import ServerSentEvent
+
+from app.core import envelope
+from app.events.hub import EventHub, SharedEvent
+from benchmarks.common import book_row, measure, report
+
+CHANNEL = "bench:fanout"
+
+
+def book_event() -> dict[str, Any]:
+	row = book_row(42)
+	return {
+		"event": "book_updated",
+		"data": {"id": 42, "title": row["title"], "author": row["author"], "timestamp": "2025-01-01T00:00:00"},
+		"tags": {"book_id": [42], "author": [row["author"]], "genre": [row["genre"]]},
+	}
+
+
+def encode_frame(event: dict[str, Any]) -> bytes:
+	return ServerSentEvent(id=event.get("id"), event=event.get("event"), data=json.dumps(event.get("data"))).encode()
+
+
+async def main(clients: int, repeat: int) -> None:
+	hub = EventHub()
+	async with AsyncExitStack() as stack:
+		subscriptions = [await stack.enter_async_context(hub.subscribe(CHANNEL, max_size=10)) for _ in range(clients)]
+
+		for codec in ("json", "msgpack"):
+			payload = envelope.encode(book_event(), codec)
+			message = {"channel": CHANNEL.encode(), "data": envelope.pack_message(payload, "1700000000000-0")}
+			print(f"{codec}: {len(payload)} bytes per event")
+
+			def fan_out(frame: Callable[[SharedEvent], bytes]) -> Callable[[], Any]:
+				async def run() -> None:
+					hub._handle_message(message)
+					for subscription in subscriptions:
+						frame(await anext(subscription))
+
+				return run
+
+			runs = {
+				"decode and encode per client": fan_out(lambda shared: encode_frame(envelope.decode(payload))),
+				"encode per client": fan_out(lambda shared: encode_frame(shared.event)),
+				"shared frame": fan_out(lambda shared: shared.sse_frame),
+			}
+			for name, run in runs.items():
+				report(f"{name} ({codec}, {clients:,} clients)", await measure(run, repeat=repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--clients", type=int, default=1_000)
+	parser.add_argument("--repeat", type=int, default=200)
+	args = parser.parse_args()
+	asyncio.run(main(args.clients, args.repeat))
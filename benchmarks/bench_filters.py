@@ -0,0 +1,54 @@
+"""Cost of finding the subscribers of one event among filtered subscriptions.
+
+Each client filters on a few books of its own, or on an author, a genre and event types. The script compares the
+`SubscriptionIndex` used by the event hub with checking the filter of every client in turn.
+
+Usage:
+	python -m benchmarks.bench_filters [--clients 10000] [--repeat 200]
+"""
+
+import argparse
+import asyncio
+
+from app.events.filters import EventFilter, SubscriptionIndex
+from benchmarks.common import GENRES, book_row, measure, report
+
+
+def client_filter(i: int) -> EventFilter:
+	if i % 2:
+		return EventFilter(book_id=[i, i + 1, i + 2])
+	row = book_row(i)
+	return EventFilter(author=[row["author"]], genre=[row["genre"]], event=["book_updated", "book_deleted"])
+
+
+async def main(clients: int, repeat: int) -> None:
+	filters = [(i, client_filter(i)) for i in range(clients)]
+	index = SubscriptionIndex[int]()
+	for i, event_filter in filters:
+		index.add(i, event_filter)
+	row = book_row(42)
+	event = {
+		"event": "book_updated",
+		"data": {"id": 42},
+		"tags": {"book_id": [42], "author": [row["author"]], "genre": [GENRES[0], row["genre"]]},
+	}
+	matched = sorted(index.match(event))
+	assert matched == [i for i, event_filter in filters if event_filter.matches(event)]
+	print(f"{clients:,} filtered clients, {len(matched)} matching the event")
+
+	async def match_index() -> None:
+		list(index.match(event))
+
+	async def check_each() -> None:
+		[i for i, event_filter in filters if event_filter.matches(event)]
+
+	report("match through the index", await measure(match_index, repeat=repeat))
+	report("check the filter of each client", await measure(check_each, repeat=repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--clients", type=int, default=10_000)
+	parser.add_argument("--repeat", type=int, default=200)
+	args = parser.parse_args()
+	asyncio.run(main(args.clients, args.repeat))
@@ -0,0 +1,125 @@
+"""Load test of `POST /auth/login` during a credential-stuffing attack, with the login rate limits off and on.
+
+Legitimate users log in one after another, each from their own address, while attackers try wrong passwords for
+existing accounts from a single address. Without limits every attempt costs a bcrypt hash, so the legitimate logins
+queue behind the attack, or are rejected with 503 once the hashing queue is full. With limits the attempts beyond
+the allowance of the attacker are rejected before hashing and the legitimate logins keep their latency. Logins are
+measured once the attack reached its steady state, i.e. after the hashes of the allowed attempts.
+
+Counters are shared through Redis when it is reachable at `REDISCLOUD_URL`, otherwise each worker falls back to
+local counters, which behave the same in this single-process test.
+
+Usage:
+	python -m benchmarks.bench_login_attack [--logins 20] [--attackers 32]
+"""
+
+import argparse
+import asyncio
+import os
+import secrets
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+from sqlalchemy import insert
+
+from app.auth import security
+from app.auth.schemas import User
+from app.core import config
+from app.db.connection import create_db, create_session
+from app.main import create_app
+from benchmarks.common import report
+
+PASSWORD = "correct horse battery staple"
+VICTIMS = 20
+
+
+async def attack(app: httpx.ASGITransport, victims: list[str], stop: asyncio.Event, statuses: Counter[int]) -> None:
+	async with httpx.AsyncClient(transport=app, base_url="http://test") as client:
+		while not stop.is_set():
+			username = secrets.choice(victims)
+			r = await client.post("/auth/login", json={"username": username, "password": secrets.token_hex(8)})
+			statuses[r.status_code] += 1
+
+
+async def settle(attack_tasks: list[asyncio.Task[None]], timeout: float = 30) -> None:
+	"""Wait for the attack to reach its steady state: the hashing queue drained if the attack gets rate limited, or
+	saturated otherwise."""
+	if not attack_tasks:
+		return
+	executor = security.get_password_executor()
+	deadline = time.monotonic() + timeout
+	await asyncio.sleep(1)
+	while executor.stats()["queued"] and time.monotonic() < deadline:
+		await asyncio.sleep(0.1)
+
+
+async def run(mode: str, settings: config.AppSettings, logins: int, attackers: int, run_id: str) -> None:
+	app = create_app(settings)
+	app.dependency_overrides[config.get_app_settings] = lambda: settings
+	victims = [f"victim-{run_id}-{mode}-{i}" for i in range(VICTIMS)]
+	users = [f"reader-{run_id}-{mode}-{i}" for i in range(logins)]
+	password_hash = security.get_password_hash(PASSWORD)
+	async with create_session() as session:
+		await session.execute(insert(User), [{"username": u, "password_hash": password_hash} for u in victims + users])
+		await session.commit()
+
+	stop = asyncio.Event()
+	attack_statuses: Counter[int] = Counter()
+	attacker_ip = f"10.66.{secrets.randbelow(256)}.{secrets.randbelow(256)}"
+	attack_tasks = [
+		asyncio.create_task(
+			attack(
+				httpx.ASGITransport(app=app, raise_app_exceptions=False, client=(attacker_ip, 4242)),
+				victims,
+				stop,
+				attack_statuses,
+			)
+		)
+		for _ in range(attackers if mode != "no attack" else 0)
+	]
+	await settle(attack_tasks)
+
+	timings = []
+	statuses: Counter[int] = Counter()
+	for i, username in enumerate(users):
+		transport = httpx.ASGITransport(
+			app=app, raise_app_exceptions=False, client=(f"10.1.{i // 256}.{i % 256}", 4242)
+		)
+		async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+			started = time.perf_counter()
+			r = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+			timings.append((time.perf_counter() - started) * 1000)
+			statuses[r.status_code] += 1
+
+	stop.set()
+	await asyncio.gather(*attack_tasks)
+	report(f"legit logins, {mode}", timings)
+	print(f"{'':<40} legit statuses {dict(statuses)}, attack statuses {dict(attack_statuses)}")
+
+
+async def main(logins: int, attackers: int) -> None:
+	run_id = secrets.token_hex(4)
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+		os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(tmp_dir) / 'bench.db'}"
+		modes = {
+			"no attack": {},
+			"attack, limits off": {"login_rate_limit_per_username": 0, "login_rate_limit_per_ip": 0},
+			"attack, limits on": {},
+		}
+		for mode, overrides in modes.items():
+			config.get_app_settings.cache_clear()
+			settings = config.get_app_settings().model_copy(update=overrides)
+			await create_db(settings)
+			await run(mode, settings, logins, attackers, run_id)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--logins", type=int, default=20)
+	parser.add_argument("--attackers", type=int, default=32)
+	args = parser.parse_args()
+	asyncio.run(main(args.logins, args.attackers))
@@ -0,0 +1,37 @@
+"""Compare page latency of offset and cursor pagination on `crud.get_books`.
+
+Usage:
+	python -m benchmarks.bench_pagination [--rows 1000100] [--limit 100] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+
+from app.books import crud
+from benchmarks.common import measure, report, seeded_session
+
+
+async def main(rows: int, limit: int, repeat: int) -> None:
+	deep_offset = max(rows - limit, 0)
+	async with seeded_session(rows) as session_factory:
+		async with session_factory() as session:
+			# Book ids start at 1, so the cursor for offset N is the id N.
+			cases = {
+				"offset 0 (skip)": lambda: crud.get_books(session, skip=0, limit=limit),
+				f"offset {deep_offset:,} (skip)": lambda: crud.get_books(session, skip=deep_offset, limit=limit),
+				"offset 0 (after)": lambda: crud.get_books(session, after={"id": 0}, limit=limit),
+				f"offset {deep_offset:,} (after)": lambda: crud.get_books(
+					session, after={"id": deep_offset}, limit=limit
+				),
+			}
+			for name, fn in cases.items():
+				report(name, await measure(fn, repeat=repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=1_000_100)
+	parser.add_argument("--limit", type=int, default=100)
+	parser.add_argument("--repeat", type=int, default=20)
+	args = parser.parse_args()
+	asyncio.run(main(args.rows, args.limit, args.repeat))
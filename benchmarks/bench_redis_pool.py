@@ -0,0 +1,81 @@
+"""Compare the throughput of `POST /books` with a Redis client per request and with the shared connection pool.
+
+`legacy_get_redis` reproduces the previous dependency, which created a client, and so a connection, for every
+request. Writes run `--concurrency` at a time against a throwaway database: more than one concurrent writer makes
+SQLite fail with "database is locked" on the default settings. Requires Redis at `REDISCLOUD_URL`.
+
+Usage:
+	python -m benchmarks.bench_redis_pool [--writes 2000] [--concurrency 1]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import httpx
+import redis.asyncio as aioredis
+from fastapi.encoders import jsonable_encoder
+
+from app.api.dependencies import get_current_user
+from app.auth.schemas import User
+from app.core import config, metrics
+from app.db.connection import create_db
+from app.db.redis import close_redis, get_redis, init_redis
+from app.main import create_app
+from benchmarks.common import book_row, report
+
+
+async def legacy_get_redis() -> AsyncGenerator[aioredis.Redis, None]:
+	settings = config.get_app_settings()
+	async with aioredis.from_url(settings.redis_url, decode_responses=True) as redis:  # type: ignore[no-untyped-call]
+		yield redis
+
+
+async def run(name: str, settings: config.AppSettings, writes: int, concurrency: int, legacy: bool) -> None:
+	app = create_app(settings)
+	app.dependency_overrides[get_current_user] = lambda: User(username="writer")
+	if legacy:
+		app.dependency_overrides[get_redis] = legacy_get_redis
+	payloads = iter([jsonable_encoder(book_row(i)) for i in range(writes)])
+	timings: list[float] = []
+
+	async def writer(client: httpx.AsyncClient) -> None:
+		for payload in payloads:
+			write_started = time.perf_counter()
+			r = await client.post("/books", json=payload)
+			r.raise_for_status()
+			timings.append((time.perf_counter() - write_started) * 1000)
+
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+		started = time.perf_counter()
+		await asyncio.gather(*(writer(client) for _ in range(concurrency)))
+		elapsed = time.perf_counter() - started
+	report(f"{name} ({writes / elapsed:,.0f} writes/s)", timings)
+
+
+async def main(writes: int, concurrency: int) -> None:
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+		os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(tmp_dir) / 'bench.db'}"
+		config.get_app_settings.cache_clear()
+		settings = config.get_app_settings()
+		await create_db(settings)
+		init_redis(settings)
+		try:
+			await run("client per request", settings, writes, concurrency, legacy=True)
+			await run("shared pool", settings, writes, concurrency, legacy=False)
+			print(f"{'':<40} pool {metrics.collect()['redis_pool']}")
+		finally:
+			await close_redis()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--writes", type=int, default=2_000)
+	parser.add_argument("--concurrency", type=int, default=1)
+	args = parser.parse_args()
+	asyncio.run(main(args.writes, args.concurrency))
@@ -0,0 +1,48 @@
+"""Compare full-text search with `crud.search_books` against a `LIKE '%q%'` scan of the same columns.
+
+Usage:
+	python -m benchmarks.bench_search [--rows 1000000] [--limit 100] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+from collections.abc import Sequence
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.books import crud
+from app.books.schemas import Book
+from benchmarks.common import measure, report, seeded_session
+
+# A rare word (a single book number), a common word (every summary) and a prefix query
+QUERIES = ("123457", "summary", "autho*")
+
+
+async def like_scan(db: AsyncSession, query: str, limit: int) -> Sequence[Book]:
+	pattern = f"%{query.rstrip('*')}%"
+	statement = (
+		select(Book)
+		.where(or_(Book.title.like(pattern), Book.author.like(pattern), Book.summary.like(pattern)))
+		.order_by(Book.id)
+		.limit(limit)
+	)
+	result = await db.execute(statement)
+	return result.scalars().all()
+
+
+async def main(rows: int, limit: int, repeat: int) -> None:
+	async with seeded_session(rows) as session_factory:
+		async with session_factory() as session:
+			for query in QUERIES:
+				report(f"fts5  q={query!r}", await measure(lambda: crud.search_books(session, query, limit), repeat))
+				report(f"like  q={query!r}", await measure(lambda: like_scan(session, query, limit), repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=1_000_000)
+	parser.add_argument("--limit", type=int, default=100)
+	parser.add_argument("--repeat", type=int, default=20)
+	args = parser.parse_args()
+	asyncio.run(main(args.rows, args.limit, args.repeat))
@@ -0,0 +1,80 @@
+"""Compare the cost of loading and encoding a page of `GET /books` with response models and with the fast path.
+
+The model path is what the route did before: load `Book` entities, validate a `PageModel` from them, then let FastAPI
+validate the returned model against the response model and encode it with `json.dumps`. The fast path selects plain
+column values and encodes them with a cached `TypeAdapter` in one pass.
+
+Usage:
+	python -m benchmarks.bench_serialization [--rows 10000] [--limit 100] [--repeat 200]
+"""
+
+import argparse
+import asyncio
+import json
+
+from pydantic import TypeAdapter
+
+from app.books import crud, models, serializers
+from benchmarks.common import measure, report, seeded_session
+
+Page = models.PageModel[models.BookResponseModel]
+
+
+async def main(rows: int, limit: int, repeat: int) -> None:
+	response_adapter = TypeAdapter(Page)
+	async with seeded_session(rows) as session_factory:
+		async with session_factory() as session:
+			books = await crud.get_books(session, limit=limit)
+			book_rows = await crud.get_book_rows(session, columns=serializers.BOOK_FIELDS, limit=limit)
+
+			def model_encode() -> bytes:
+				page = Page(items=[models.BookResponseModel.model_validate(book) for book in books])
+				content = response_adapter.dump_python(response_adapter.validate_python(page), mode="json")
+				return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+			def fast_encode() -> bytes:
+				return serializers.dump_page(book_rows, None)
+
+			assert json.loads(model_encode()) == json.loads(fast_encode())
+
+			async def load_models() -> None:
+				session.expunge_all()
+				await crud.get_books(session, limit=limit)
+
+			async def load_rows() -> None:
+				await crud.get_book_rows(session, columns=serializers.BOOK_FIELDS, limit=limit)
+
+			async def encode_models() -> None:
+				model_encode()
+
+			async def encode_rows() -> None:
+				fast_encode()
+
+			async def full_models() -> None:
+				session.expunge_all()
+				books[:] = await crud.get_books(session, limit=limit)
+				model_encode()
+
+			async def full_rows() -> None:
+				book_rows[:] = await crud.get_book_rows(session, columns=serializers.BOOK_FIELDS, limit=limit)
+				fast_encode()
+
+			cases = {
+				"load (entities)": load_models,
+				"load (rows)": load_rows,
+				"encode (response models)": encode_models,
+				"encode (type adapter)": encode_rows,
+				"load + encode (models)": full_models,
+				"load + encode (fast path)": full_rows,
+			}
+			for name, fn in cases.items():
+				report(f"{name}, {limit} books", await measure(fn, repeat=repeat))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=10_000)
+	parser.add_argument("--limit", type=int, default=100)
+	parser.add_argument("--repeat", type=int, default=200)
+	args = parser.parse_args()
+	asyncio.run(main(args.rows, args.limit, args.repeat))
@@ -0,0 +1,105 @@
+"""Read and write latency of concurrent requests on SQLite with each PRAGMA profile.
+
+Readers page through books while writers create them, each request in its own session and connection, for a fixed
+duration. Every profile runs on a fresh copy of the same seeded database:
+- `default`: what SQLite does without PRAGMAs, a rollback journal where a commit waits for readers to finish and
+  blocks new ones, synced on every commit.
+- `wal`: the write-ahead log with `synchronous=NORMAL`, readers and the writer no longer block each other.
+- `tuned`: `wal` along with the cache, memory mapping and temp store of the `SQLITE_*` settings.
+
+Usage:
+	python -m benchmarks.bench_sqlite [--rows 100000] [--readers 8] [--writers 2] [--duration 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import time
+from pathlib import Path
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.books import crud
+from app.books.models import CreateBookModel
+from app.books.schemas import Book
+from app.core import config
+from app.db.connection import set_sqlite_pragmas, sqlite_pragmas
+from benchmarks.common import book_row, report, seeded_database
+
+PAGE_SIZE = 20
+
+
+async def read(session_factory: async_sessionmaker[AsyncSession], rows: int) -> None:
+	async with session_factory() as session:
+		after = random.randrange(rows)
+		query = select(Book).where(Book.id > after).order_by(Book.id).limit(PAGE_SIZE)
+		(await session.execute(query)).scalars().all()
+
+
+async def write(session_factory: async_sessionmaker[AsyncSession], i: int) -> None:
+	async with session_factory() as session:
+		await crud.create_book(session, CreateBookModel(**book_row(i)))
+
+
+async def run_profile(
+	name: str, pragmas: dict[str, str | int], path: Path, rows: int, readers: int, writers: int, duration: float
+) -> None:
+	engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=readers + writers, max_overflow=0)
+	set_sqlite_pragmas(engine, pragmas)
+	session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+	timings: dict[str, list[float]] = {"reads": [], "writes": []}
+	errors = 0
+	deadline = time.perf_counter() + duration
+
+	async def worker(kind: str, number: int) -> None:
+		nonlocal errors
+		i = rows + number
+		while time.perf_counter() < deadline:
+			started = time.perf_counter()
+			try:
+				await (read(session_factory, rows) if kind == "reads" else write(session_factory, i))
+			except OperationalError:  # database is locked, after the busy timeout
+				errors += 1
+				continue
+			timings[kind].append((time.perf_counter() - started) * 1000)
+			i += writers
+
+	await asyncio.gather(
+		*(worker("reads", number) for number in range(readers)),
+		*(worker("writes", number) for number in range(writers)),
+	)
+	await engine.dispose()
+	for kind, kind_timings in timings.items():
+		report(f"{name} {kind} ({len(kind_timings) / duration:,.0f}/s)", kind_timings)
+	if errors:
+		print(f"{name}: {errors} requests failed on a locked database")
+
+
+async def main(rows: int, readers: int, writers: int, duration: float) -> None:
+	os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+	tuned = sqlite_pragmas(config.get_app_settings())
+	profiles: dict[str, dict[str, str | int]] = {
+		"default": {},
+		"wal": {"journal_mode": "wal", "synchronous": "normal"},
+		"tuned": tuned,
+	}
+	print(f"{readers} readers and {writers} writers for {duration}s per profile")
+	with seeded_database(rows) as seeded:
+		for name, pragmas in profiles.items():
+			path = seeded.with_name(f"{name}.db")
+			shutil.copy(seeded, path)
+			await run_profile(name, pragmas, path, rows, readers, writers, duration)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=100_000)
+	parser.add_argument("--readers", type=int, default=8)
+	parser.add_argument("--writers", type=int, default=2)
+	parser.add_argument("--duration", type=float, default=5)
+	args = parser.parse_args()
+	asyncio.run(main(args.rows, args.readers, args.writers, args.duration))
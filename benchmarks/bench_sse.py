@@ -0,0 +1,79 @@
+"""Idle CPU cost and fan-out latency of SSE clients subscribed to the event hub.
+
+Each client runs the generator of `GET /sse/updates/{channel}` and waits on its own queue. The script measures the
+CPU time the worker burns while the clients are idle, then the time for one event published on the event bus to
+reach every client, with each bus backend. The `redis` bus requires Redis at `REDISCLOUD_URL`.
+
+Usage:
+	python -m benchmarks.bench_sse [--clients 10000] [--idle 5] [--events 20] [--bus redis memory]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from contextlib import suppress
+
+from app.api.sse import event_generator
+from app.core import config, envelope
+from app.db.bus import EventBus, MemoryEventBus, RedisEventBus
+from app.db.redis import close_redis, init_redis
+from app.events.hub import EventHub
+from benchmarks.common import report
+
+CHANNEL = "bench:sse"
+
+
+async def client(hub: EventHub, received: list[asyncio.Event], i: int) -> None:
+	async for _ in event_generator(hub, CHANNEL, max_size=100, policy="drop_oldest"):
+		received[i].set()
+
+
+async def run(bus: EventBus, name: str, clients: int, idle: float, events: int) -> None:
+	hub = EventHub()
+	received = [asyncio.Event() for _ in range(clients)]
+	hub_task = asyncio.create_task(hub.run(bus))
+	tasks = [asyncio.create_task(client(hub, received, i)) for i in range(clients)]
+	await asyncio.sleep(1)
+
+	cpu_started, started = time.process_time(), time.perf_counter()
+	await asyncio.sleep(idle)
+	cpu = (time.process_time() - cpu_started) / (time.perf_counter() - started)
+	print(f"{name} bus, {clients:,} idle clients: {cpu:.1%} of a CPU")
+
+	payload = envelope.encode({"event": "bench", "data": {}})
+	timings = []
+	for _ in range(events):
+		for flag in received:
+			flag.clear()
+		started = time.perf_counter()
+		await bus.publish([(CHANNEL, payload, 0)])
+		for flag in received:
+			await flag.wait()
+		timings.append((time.perf_counter() - started) * 1000)
+	report(f"{name} bus, fan-out to {clients:,} clients", timings)
+
+	for task in (*tasks, hub_task):
+		task.cancel()
+		with suppress(asyncio.CancelledError):
+			await task
+	await bus.aclose()
+
+
+async def main(clients: int, idle: float, events: int, buses: list[str]) -> None:
+	os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+	init_redis(config.get_app_settings())
+	for name in buses:
+		bus: EventBus = MemoryEventBus() if name == "memory" else RedisEventBus()
+		await run(bus, name, clients, idle, events)
+	await close_redis()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--clients", type=int, default=10_000)
+	parser.add_argument("--idle", type=float, default=5)
+	parser.add_argument("--events", type=int, default=20)
+	parser.add_argument("--bus", nargs="+", choices=["redis", "memory"], default=["redis", "memory"])
+	args = parser.parse_args()
+	asyncio.run(main(args.clients, args.idle, args.events, args.bus))
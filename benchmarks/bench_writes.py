@@ -0,0 +1,84 @@
+"""Compare the latency and throughput of the books write path before and after single-statement writes.
+
+`legacy_*` reproduce the previous implementation: `commit` + `refresh` on create and update, a `get_book` before
+update and delete. Writes run one after another, each in its own session like a request.
+
+Usage:
+	python -m benchmarks.bench_writes [--rows 100000] [--writes 1000]
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.books import crud
+from app.books.models import CreateBookModel, UpdateBookModel
+from app.books.schemas import Book
+from benchmarks.common import book_row, report, seeded_session
+
+
+async def legacy_create_book(db: AsyncSession, book_model: CreateBookModel) -> Book:
+	db_book = Book(**book_model.model_dump())
+	db.add(db_book)
+	await db.commit()
+	await db.refresh(db_book)
+	return db_book
+
+
+async def legacy_update_book(db: AsyncSession, book_id: int, book_patch: UpdateBookModel) -> Book:
+	db_book = await crud.get_book(db, book_id)
+	for key, value in book_patch.model_dump(exclude_unset=True).items():
+		setattr(db_book, key, value)
+	await db.commit()
+	await db.refresh(db_book)
+	return db_book
+
+
+async def legacy_delete_book(db: AsyncSession, book_id: int) -> None:
+	db_book = await crud.get_book(db, book_id)
+	await db.delete(db_book)
+	await db.commit()
+
+
+async def run_writes(
+	name: str,
+	session_factory: async_sessionmaker[AsyncSession],
+	writes: int,
+	write: Callable[[AsyncSession, int], Awaitable[object]],
+) -> None:
+	timings = []
+	started = time.perf_counter()
+	for i in range(writes):
+		write_started = time.perf_counter()
+		async with session_factory() as session:
+			await write(session, i)
+		timings.append((time.perf_counter() - write_started) * 1000)
+	elapsed = time.perf_counter() - started
+	report(f"{name} ({writes / elapsed:,.0f} writes/s)", timings)
+
+
+async def main(rows: int, writes: int) -> None:
+	new_book = CreateBookModel(**book_row(rows))
+	patch = UpdateBookModel(title="Updated title", genre="updated")
+	async with seeded_session(rows) as session_factory:
+		# Each variant updates then deletes its own range of seeded ids
+		for variant, offset in (("legacy", 1), ("returning", 1 + writes)):
+			create, update, delete = (
+				(legacy_create_book, legacy_update_book, legacy_delete_book)
+				if variant == "legacy"
+				else (crud.create_book, crud.update_book, crud.delete_book)
+			)
+			await run_writes(f"{variant} create", session_factory, writes, lambda db, i: create(db, new_book))
+			await run_writes(f"{variant} update", session_factory, writes, lambda db, i: update(db, offset + i, patch))
+			await run_writes(f"{variant} delete", session_factory, writes, lambda db, i: delete(db, offset + i))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=100_000)
+	parser.add_argument("--writes", type=int, default=1000)
+	args = parser.parse_args()
+	asyncio.run(main(args.rows, args.writes))
@@ -0,0 +1,86 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite file seeded with synthetic books, never against `books.db`.
+"""
+
+import statistics
+import tempfile
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.auth import schemas as auth_schemas  # noqa: F401 - registers the Users table
+from app.books.schemas import Book
+from app.db.connection import Base
+
+SEED_CHUNK_SIZE = 10_000
+GENRES = ("fantasy", "science fiction", "mystery", "romance", "horror", "biography", "history", "poetry")
+
+
+def book_row(i: int) -> dict[str, Any]:
+	"""Deterministic synthetic book number `i`."""
+	return {
+		"title": f"Title {i}",
+		"author": f"Author {i % 5_000}",
+		"published_date": date(1900, 1, 1) + timedelta(days=i % 45_000),
+		"summary": f"Summary of book {i}. " * 8,
+		"genre": GENRES[i % len(GENRES)],
+	}
+
+
+def seed_books(path: Path, rows: int) -> None:
+	"""Create the schema in a new SQLite file at `path` and insert `rows` books."""
+	engine = create_engine(f"sqlite:///{path}")
+	Base.metadata.create_all(engine)
+	with engine.begin() as conn:
+		for start in range(0, rows, SEED_CHUNK_SIZE):
+			stop = min(start + SEED_CHUNK_SIZE, rows)
+			conn.execute(insert(Book), [book_row(i) for i in range(start, stop)])
+	engine.dispose()
+
+
+@contextmanager
+def seeded_database(rows: int) -> Iterator[Path]:
+	"""Seed a temporary database file with `rows` books and yield its path."""
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = Path(tmp_dir) / "bench.db"
+		started = time.perf_counter()
+		seed_books(path, rows)
+		print(f"seeded {rows:,} books in {time.perf_counter() - started:.1f}s")
+		yield path
+
+
+@asynccontextmanager
+async def seeded_session(rows: int) -> AsyncIterator[async_sessionmaker[AsyncSession]]:
+	"""Seed a temporary database with `rows` books and yield a session factory bound to it."""
+	with seeded_database(rows) as path:
+		engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+		try:
+			yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+		finally:
+			await engine.dispose()
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], repeat: int, warmup: int = 1) -> list[float]:
+	"""Run `fn` `warmup + repeat` times and return the latency of the last `repeat` runs in milliseconds."""
+	for _ in range(warmup):
+		await fn()
+	timings = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		await fn()
+		timings.append((time.perf_counter() - started) * 1000)
+	return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+	"""Print the median, p95 and max of a list of millisecond timings."""
+	ordered = sorted(timings)
+	p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+	print(f"{name:<40} median {statistics.median(ordered):9.3f} ms   p95 {p95:9.3f} ms   max {ordered[-1]:9.3f} ms")
@@ -2,12 +2,15 @@ from pathlib import Path
 from typing import AsyncGenerator
 
 import pytest
+import redis.asyncio as aioredis
 from httpx import ASGITransport, AsyncClient
 from polyfactory.pytest_plugin import register_fixture
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import AppSettings, get_app_settings
+from app.db.bus import EventBus, MemoryEventBus, RedisEventBus
 from app.db.connection import create_db, get_db
+from app.db.redis import close_redis, init_redis
 from app.main import BooksAPI, create_app
 from tests import mocks
 
@@ -31,6 +34,10 @@ def test_settings(monkeysession: pytest.MonkeyPatch) -> AppSettings:
 		"DATABASE_URL": "sqlite+aiosqlite:///./test.db",
 		"JWT_SECRET": "test_secret",
 		"JWT_EXPIRE_MINUTES": "30",
+		"BCRYPT_ROUNDS": "4",  # the lowest cost, to keep the tests fast
+		# every test logs in from the same address
+		"LOGIN_RATE_LIMIT_PER_IP": "0",
+		"EVENT_BUS": "memory",
 	}
 	for key, value in env_dict.items():
 		monkeysession.setenv(key.upper(), value)
@@ -58,11 +65,25 @@ async def setup_db(test_settings: AppSettings) -> None:
 	await create_db(test_settings)
 	yield None
 
-	db_file = Path("./test.db")
-	if db_file.exists():
+	# NOTE with the WAL journal, along with its -wal and -shm files
+	for db_file in Path(".").glob("test.db*"):
 		db_file.unlink()
 
 
+@pytest.fixture(scope="session", autouse=True)
+async def redis(test_settings: AppSettings) -> AsyncGenerator[aioredis.Redis, None]:
+	yield init_redis(test_settings)
+	await close_redis()
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def bus(request: pytest.FixtureRequest, redis: aioredis.Redis) -> AsyncGenerator[EventBus, None]:
+	"""Every event bus backend, to run the tests of the events against each of them."""
+	bus: EventBus = MemoryEventBus() if request.param == "memory" else RedisEventBus(redis)
+	yield bus
+	await bus.aclose()
+
+
 @pytest.fixture
 async def db(setup_db) -> AsyncGenerator[AsyncSession, None]:
 	async for session in get_db():
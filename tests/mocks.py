@@ -7,6 +7,7 @@ from app import auth, books
 
 class BookFactory(SQLAlchemyFactory[books.schemas.Book]):
 	__set_as_default_factory_for_type__ = True
+	__set_primary_key__ = False  # let the database assign ids, random ones collide across tests
 
 
 class CreateBookFactory(ModelFactory[books.models.CreateBookModel]):
@@ -2,7 +2,11 @@ import asyncio
 
 from httpx import AsyncClient
 
-from app.auth.security import create_access_token
+from app.auth.cache import get_user_cache, user_key
+from app.auth.security import create_access_token, decode_access_token, get_token_cache
+from app.core.config import AppSettings, get_app_settings
+from app.main import BooksAPI
+from tests.mocks import UserModelFactory
 
 
 async def test_without_authentication(client: AsyncClient) -> None:
@@ -12,6 +16,17 @@ async def test_without_authentication(client: AsyncClient) -> None:
 	assert r.json() == {"detail": "Not authenticated"}
 
 
+async def test_metrics_require_authentication(client: AsyncClient, get_valid_user_jwt: str) -> None:
+	r = await client.get("/metrics")
+
+	assert r.status_code == 403
+
+	r = await client.get("/metrics", headers={"Authorization": f"Bearer {get_valid_user_jwt}"})
+
+	assert r.status_code == 200
+	assert "user_cache" in r.json()
+
+
 async def test_empty_token(client: AsyncClient) -> None:
 	headers = {"Authorization": "Bearer "}
 
@@ -59,3 +74,70 @@ async def test_jwt_with_nonexistent_user(client: AsyncClient) -> None:
 	r = await client.get("/books", headers=headers)
 	assert r.status_code == 401
 	assert r.json() == {"detail": "Could not validate credentials"}
+
+
+async def test_unknown_user_is_cached_until_registered(
+	client: AsyncClient,
+	user_model_factory: UserModelFactory,
+) -> None:
+	user = user_model_factory.build()
+	headers = {"Authorization": f"Bearer {create_access_token(subject=user.username)}"}
+	r = await client.get("/books", headers=headers)
+	assert r.status_code == 401
+	assert get_user_cache().local.get(user_key(user.username)) is False
+
+	await client.post("/auth/register", json=user.model_dump())
+
+	r = await client.get("/books", headers=headers)
+	assert r.status_code == 200
+
+
+async def test_user_is_cached(client: AsyncClient, get_valid_user_jwt: str) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cache = get_user_cache()
+
+	await client.get("/books", headers=headers)
+	hits = cache.stats()["hits"]
+	await client.get("/books", headers=headers)
+
+	assert cache.stats()["hits"] == hits + 1
+
+
+async def test_user_event_invalidates_cache(client: AsyncClient, get_valid_user_jwt: str) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	username = decode_access_token(get_valid_user_jwt)["sub"]
+	cache = get_user_cache()
+	await client.get("/books", headers=headers)
+
+	cache.handle_event({"event": "user_deleted", "data": {"user": user_key(username)}})
+
+	assert cache.local.get(user_key(username)) is None
+
+
+async def test_stateless_mode_skips_user_lookup(
+	app: BooksAPI,
+	client: AsyncClient,
+	test_settings: AppSettings,
+) -> None:
+	token = create_access_token(subject="stateless_user")
+	headers = {"Authorization": f"Bearer {token}"}
+	stateless_settings = test_settings.model_copy(update={"auth_stateless": True})
+	app.dependency_overrides[get_app_settings] = lambda: stateless_settings
+	try:
+		r = await client.get("/books", headers=headers)
+	finally:
+		app.dependency_overrides[get_app_settings] = lambda: test_settings
+
+	assert r.status_code == 200
+
+
+def test_verified_token_is_cached() -> None:
+	token = create_access_token(subject="cached_user")
+	cache = get_token_cache()
+	hits = cache.stats()["hits"]
+
+	claims = decode_access_token(token)
+	claims["sub"] = "tampered"
+
+	assert decode_access_token(token)["sub"] == "cached_user"
+	assert cache.stats()["hits"] == hits + 1
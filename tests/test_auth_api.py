@@ -1,7 +1,27 @@
+import uuid
+
+import bcrypt
+import pytest
+import redis.asyncio as aioredis
 from httpx import AsyncClient
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth.security import decode_access_token
+from app.auth import security
+from app.auth.revocation import REVOKED_KEY_PREFIX, RevocationList
+from app.auth.schemas import User
+from app.auth.security import (
+	BCRYPT_ROUNDS_KEY,
+	calibrate_bcrypt_rounds,
+	calibrate_password_hashing,
+	decode_access_token,
+	get_bcrypt_rounds,
+	get_hash_rounds,
+	get_password_executor,
+)
+from app.core.config import AppSettings, get_app_settings
+from app.db.redis import create_redis_client, get_redis
+from app.main import BooksAPI
 from tests import mocks
 
 
@@ -80,3 +100,202 @@ async def test_login_with_incorrect_password(
 
 	assert r.status_code == 401
 	assert r.json() == {"detail": "Incorrect username or password"}
+
+
+@pytest.mark.parametrize("old_rounds,new_rounds", [(4, 5), (6, 6)])
+async def test_login_only_rehashes_password_with_a_lower_cost(
+	db: AsyncSession,
+	client: AsyncClient,
+	monkeypatch: pytest.MonkeyPatch,
+	user_model_factory: mocks.UserModelFactory,
+	old_rounds: int,
+	new_rounds: int,
+) -> None:
+	monkeypatch.setattr(get_app_settings(), "bcrypt_rounds", 5)
+	user = user_model_factory.build()
+	old_hash = bcrypt.hashpw(user.password.encode("utf-8"), bcrypt.gensalt(rounds=old_rounds)).decode("utf-8")
+	await db.execute(insert(User).values(username=user.username, password_hash=old_hash))
+	await db.commit()
+
+	r = await client.post("/auth/login", json=user.model_dump())
+	new_hash = await db.scalar(select(User.password_hash).where(User.username == user.username))
+
+	assert r.status_code == 200
+	assert (new_hash != old_hash) == (new_rounds != old_rounds)
+	assert get_hash_rounds(new_hash) == new_rounds
+	assert (await client.post("/auth/login", json=user.model_dump())).status_code == 200
+
+
+async def test_calibrated_bcrypt_cost_is_shared_by_workers(
+	redis: aioredis.Redis, monkeypatch: pytest.MonkeyPatch
+) -> None:
+	settings = get_app_settings()
+	monkeypatch.setattr(settings, "bcrypt_rounds", None)
+	monkeypatch.setattr(settings, "bcrypt_min_rounds", 4)
+	monkeypatch.setattr(settings, "bcrypt_max_rounds", 4)
+	monkeypatch.setattr(security, "_calibrated_rounds", None)
+	await redis.delete(BCRYPT_ROUNDS_KEY)
+	try:
+		assert await calibrate_password_hashing(redis) == 4
+		# NOTE the cost another worker stored first wins over the one calibrated here
+		await redis.set(BCRYPT_ROUNDS_KEY, 5)
+		assert await calibrate_password_hashing(redis) == get_bcrypt_rounds() == 5
+		assert settings.bcrypt_rounds is None
+	finally:
+		await redis.delete(BCRYPT_ROUNDS_KEY)
+
+
+def test_calibrate_bcrypt_rounds_is_bounded() -> None:
+	assert calibrate_bcrypt_rounds(target_ms=0, min_rounds=4, max_rounds=6) == 4
+	assert calibrate_bcrypt_rounds(target_ms=60_000, min_rounds=4, max_rounds=6) == 6
+
+
+async def test_login_rate_limited_per_username(
+	app: BooksAPI,
+	client: AsyncClient,
+	test_settings: AppSettings,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	incorrect_password = {"username": login_data.username, "password": "wrongpassword"}
+	limited_settings = test_settings.model_copy(update={"login_rate_limit_per_username": 2})
+	app.dependency_overrides[get_app_settings] = lambda: limited_settings
+	try:
+		statuses = [(await client.post("/auth/login", json=incorrect_password)).status_code for _ in range(2)]
+		hashed = get_password_executor().stats()["completed"]
+		r = await client.post("/auth/login", json=login_data.model_dump())
+	finally:
+		app.dependency_overrides[get_app_settings] = lambda: test_settings
+
+	assert statuses == [401, 401]
+	assert r.status_code == 429
+	assert 0 < int(r.headers["Retry-After"]) <= test_settings.login_rate_limit_window_seconds
+	assert get_password_executor().stats()["completed"] == hashed
+
+
+async def test_refresh_token_rotation(
+	client: AsyncClient,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	refresh_token = (await client.post("/auth/login", json=login_data.model_dump())).json()["refresh_token"]
+
+	r = await client.post("/auth/refresh", json={"refresh_token": refresh_token})
+
+	assert r.status_code == 200
+	tokens = r.json()
+	assert decode_access_token(tokens["access_token"])["sub"] == login_data.username
+	assert tokens["refresh_token"] != refresh_token
+
+	r = await client.post("/auth/refresh", json={"refresh_token": refresh_token})
+	assert r.status_code == 401
+	assert r.json() == {"detail": "Invalid refresh token."}
+
+
+async def test_login_and_refresh_without_redis(
+	app: BooksAPI,
+	client: AsyncClient,
+	test_settings: AppSettings,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	refresh_token = (await client.post("/auth/login", json=login_data.model_dump())).json()["refresh_token"]
+	unreachable = create_redis_client(test_settings.model_copy(update={"redis_url": "redis://127.0.0.1:1"}))
+	app.dependency_overrides[get_redis] = lambda: unreachable
+	try:
+		login = await client.post("/auth/login", json=login_data.model_dump())
+		refresh = await client.post("/auth/refresh", json={"refresh_token": refresh_token})
+	finally:
+		del app.dependency_overrides[get_redis]
+		await unreachable.aclose()
+
+	assert login.status_code == 200
+	assert decode_access_token(login.json()["access_token"])["sub"] == login_data.username
+	assert login.json()["refresh_token"] is None
+	assert refresh.status_code == 503
+	assert refresh.json() == {"detail": "Refresh tokens are unavailable, try again later."}
+	assert int(refresh.headers["Retry-After"]) > 0
+
+
+async def test_refresh_token_is_not_an_access_token(
+	client: AsyncClient,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	tokens = (await client.post("/auth/login", json=login_data.model_dump())).json()
+
+	r = await client.get("/books", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+	assert r.status_code == 401
+
+	r = await client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]})
+	assert r.status_code == 401
+
+
+async def test_logout_revokes_tokens(
+	client: AsyncClient,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	tokens = (await client.post("/auth/login", json=login_data.model_dump())).json()
+	headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+	r = await client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+	assert r.status_code == 204
+
+	r = await client.get("/books", headers=headers)
+	assert r.status_code == 401
+	r = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+	assert r.status_code == 401
+
+
+async def test_logout_without_redis(
+	app: BooksAPI,
+	client: AsyncClient,
+	test_settings: AppSettings,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	login_data = user_model_factory.build()
+	await client.post("/auth/register", json=login_data.model_dump())
+	tokens = (await client.post("/auth/login", json=login_data.model_dump())).json()
+	headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+	unreachable = create_redis_client(test_settings.model_copy(update={"redis_url": "redis://127.0.0.1:1"}))
+	app.dependency_overrides[get_redis] = lambda: unreachable
+	try:
+		responses = [
+			await client.post("/auth/logout", headers=headers),
+			await client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]}),
+		]
+	finally:
+		del app.dependency_overrides[get_redis]
+		await unreachable.aclose()
+
+	for r in responses:
+		assert r.status_code == 503
+		assert r.json() == {"detail": "Refresh tokens are unavailable, try again later."}
+		assert int(r.headers["Retry-After"]) > 0
+	r = await client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+	assert r.status_code == 204
+
+
+async def test_revocation_filter_is_rebuilt_from_redis(test_settings: AppSettings) -> None:
+	redis = create_redis_client(test_settings)
+	revoking, other_worker = (
+		RevocationList(capacity=100, error_rate=0.01),
+		RevocationList(capacity=100, error_rate=0.01),
+	)
+	jti = uuid.uuid4().hex
+	try:
+		await revoking.revoke(redis, jti, expires_in=60)
+		assert not await other_worker.is_revoked(redis, jti)
+
+		await other_worker.reload(redis)
+
+		assert await other_worker.is_revoked(redis, jti)
+	finally:
+		await redis.delete(f"{REVOKED_KEY_PREFIX}{jti}")
+		await redis.aclose()
@@ -1,6 +1,18 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+import redis.asyncio as aioredis
 from httpx import AsyncClient
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.books import crud, models, pagination
+from app.books.cache import BookCache, get_book_cache
+from app.books.schemas import Book
 from tests import mocks
 
 
@@ -33,7 +45,129 @@ async def test_get_books(
 	r = await client.get("/books", headers=headers)
 
 	assert r.status_code == 200
-	assert len(r.json()) >= 10
+	assert len(r.json()["items"]) >= 10
+
+
+async def test_get_books_matches_response_model(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	books = await book_factory.create_batch_async(3)
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books", headers=headers, params={"sort": "-id", "limit": 3})
+
+	assert r.status_code == 200
+	assert r.headers["content-type"] == "application/json"
+	expected = [models.BookResponseModel.model_validate(book).model_dump(mode="json") for book in reversed(books)]
+	assert r.json()["items"] == expected
+
+
+async def test_get_books_sparse_fields(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	await book_factory.create_batch_async(3)
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	params = {"fields": "title,author", "sort": "-published_date", "limit": 2}
+
+	r = await client.get("/books", headers=headers, params=params)
+
+	assert r.status_code == 200
+	assert all(item.keys() == {"id", "title", "author"} for item in r.json()["items"])
+
+	r = await client.get("/books", headers=headers, params={**params, "after": r.json()["next_cursor"]})
+
+	assert r.status_code == 200
+	assert all(item.keys() == {"id", "title", "author"} for item in r.json()["items"])
+
+
+async def test_get_books_unknown_fields(client: AsyncClient, get_valid_user_jwt: str) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books", headers=headers, params={"fields": "title,isbn"})
+
+	assert r.status_code == 400
+	assert r.json()["detail"] == "Unknown book fields: isbn."
+
+
+async def test_get_books_cursor_pagination(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	books = await book_factory.create_batch_async(5)
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books", params={"limit": 2}, headers=headers)
+	seen_ids = [book["id"] for book in r.json()["items"]]
+	while r.json()["next_cursor"] is not None:
+		assert 'rel="next"' in r.headers["Link"]
+		r = await client.get("/books", params={"limit": 2, "after": r.json()["next_cursor"]}, headers=headers)
+		assert r.status_code == 200
+		seen_ids.extend(book["id"] for book in r.json()["items"])
+
+	assert "Link" not in r.headers
+	assert seen_ids == sorted(seen_ids)
+	assert {book.id for book in books}.issubset(seen_ids)
+
+
+async def test_get_books_legacy_skip(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	await book_factory.create_batch_async(3)
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	first_page = await client.get("/books", params={"limit": 2}, headers=headers)
+	r = await client.get("/books", params={"limit": 1, "skip": 1}, headers=headers)
+
+	assert r.status_code == 200
+	assert r.json()["items"] == first_page.json()["items"][1:]
+
+
+@pytest.mark.parametrize(
+	"cursor",
+	[
+		"not-a-cursor",
+		pagination.encode_cursor({"id": True}),
+		pagination.encode_cursor({"id": 2**70}),
+	],
+)
+async def test_get_books_invalid_cursor(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	cursor: str,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books", params={"after": cursor}, headers=headers)
+
+	assert r.status_code == 400
+	assert r.json() == {"detail": "Invalid pagination cursor."}
+
+
+async def test_get_books_cursor_and_skip(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cursor = pagination.encode_cursor({"id": 1})
+
+	r = await client.get("/books", params={"after": cursor, "skip": 1}, headers=headers)
+
+	assert r.status_code == 400
 
 
 async def test_get_book(
@@ -55,6 +189,176 @@ async def test_get_book(
 	assert r.json()["author"] == book.author
 
 
+async def test_get_book_etag(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get(f"/books/{book.id}", headers=headers)
+	etag = r.headers["ETag"]
+
+	r = await client.get(f"/books/{book.id}", headers={**headers, "If-None-Match": etag})
+	assert r.status_code == 304
+	assert r.headers["ETag"] == etag
+	assert r.content == b""
+
+	await client.patch(f"/books/{book.id}", json={"title": "New Edition"}, headers=headers)
+
+	r = await client.get(f"/books/{book.id}", headers={**headers, "If-None-Match": etag})
+	assert r.status_code == 200
+	assert r.headers["ETag"] != etag
+	assert r.json()["title"] == "New Edition"
+
+
+async def test_get_books_etag(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	await client.post("/books", json=create_book_factory.build().model_dump(mode="json"), headers=headers)
+
+	r = await client.get("/books", headers=headers, params={"limit": 1})
+	etag = r.headers["ETag"]
+
+	r = await client.get("/books", headers={**headers, "If-None-Match": f"W/{etag}"}, params={"limit": 1})
+	assert r.status_code == 304
+	assert r.content == b""
+
+	# NOTE invalid parameters are rejected even when nothing changed
+	cursor = pagination.encode_cursor({"id": 1})
+	for params in ({"fields": "nope"}, {"after": cursor, "skip": 1}, {"after": cursor, "sort": "title"}):
+		r = await client.get("/books", headers={**headers, "If-None-Match": etag}, params={"limit": 1, **params})
+		assert r.status_code == 400, params
+
+	r = await client.post("/books", json=create_book_factory.build().model_dump(mode="json"), headers=headers)
+	await client.delete(f"/books/{r.json()['id']}", headers=headers)
+
+	r = await client.get("/books", headers={**headers, "If-None-Match": etag}, params={"limit": 1})
+	assert r.status_code == 200
+	assert r.headers["ETag"] != etag
+
+
+async def test_get_book_sparse_fields(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get(f"/books/{book.id}", headers=headers, params={"fields": "title"})
+
+	assert r.status_code == 200
+	assert r.json() == {"id": book.id, "title": book.title}
+
+	r = await client.get(f"/books/{book.id}", headers=headers, params={"fields": "summary,rating"})
+
+	assert r.status_code == 400
+
+
+async def test_get_book_is_cached(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cache = get_book_cache()
+
+	await client.get(f"/books/{book.id}", headers=headers)
+	hits = cache.local.hits
+	r = await client.get(f"/books/{book.id}", headers=headers)
+
+	assert r.status_code == 200
+	assert r.json()["id"] == book.id
+	assert cache.local.hits == hits + 1
+
+	r = await client.get("/metrics", headers=headers)
+	assert r.json()["book_cache"]["hits"] == cache.local.hits
+
+
+async def test_book_cache_dropped_on_remote_event(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cache = get_book_cache()
+	await client.get(f"/books/{book.id}", headers=headers)
+
+	# Simulate another worker updating the book
+	await db.execute(update(Book).where(Book.id == book.id).values(title="Changed Elsewhere"))
+	await db.commit()
+	cache.handle_event({"event": "book_updated", "data": {"id": book.id, "title": "Changed Elsewhere"}})
+	r = await client.get(f"/books/{book.id}", headers=headers)
+
+	assert r.json()["title"] == "Changed Elsewhere"
+
+
+async def test_book_read_racing_a_write_is_not_cached(
+	db: AsyncSession,
+	redis: aioredis.Redis,
+	monkeypatch: pytest.MonkeyPatch,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	cache = BookCache(max_size=10, ttl=60, shared=True)
+	get_book = crud.get_book
+
+	async def get_book_then_write(db: AsyncSession, book_id: int) -> Book:
+		stale = await get_book(db, book_id)
+		await cache.invalidate(book_id)  # a write committed while the stale row was being read
+		return stale
+
+	monkeypatch.setattr(crud, "get_book", get_book_then_write)
+	await cache.get_book(db, book.id)
+
+	assert cache.local.get(book.id) is None
+	assert await redis.get(cache._redis_key(book.id)) is None
+
+
+async def test_book_read_racing_a_write_elsewhere_is_dropped_by_its_event(
+	db: AsyncSession,
+	redis: aioredis.Redis,
+	monkeypatch: pytest.MonkeyPatch,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	writer, reader = BookCache(max_size=10, ttl=60, shared=True), BookCache(max_size=10, ttl=60, shared=True)
+	get_book = crud.get_book
+
+	async def get_book_then_write(db: AsyncSession, book_id: int) -> Book:
+		stale = await get_book(db, book_id)
+		await writer.invalidate(book_id)  # a write committed by another worker while the stale row was being read
+		return stale
+
+	monkeypatch.setattr(crud, "get_book", get_book_then_write)
+	await reader.get_book(db, book.id)
+	assert await redis.get(reader._redis_key(book.id)) is not None
+
+	reader.handle_event({"event": "book_updated", "data": {"id": book.id}})
+	await asyncio.gather(*reader._deletions)
+
+	assert reader.local.get(book.id) is None
+	assert await redis.get(reader._redis_key(book.id)) is None
+
+
 async def test_get_book_not_found(
 	client: AsyncClient,
 	get_valid_user_jwt: str,
@@ -79,6 +383,8 @@ async def test_update_book(
 	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
 	updated_data = {"title": "Updated Title", "author": "Updated Author"}
 
+	await client.get(f"/books/{book.id}", headers=headers)  # warm the cache
+
 	r = await client.patch(f"/books/{book.id}", json=updated_data, headers=headers)
 
 	assert r.status_code == 200
@@ -87,6 +393,25 @@ async def test_update_book(
 	assert r.json()["title"] == updated_data["title"]
 	assert r.json()["author"] == updated_data["author"]
 
+	r = await client.get(f"/books/{book.id}", headers=headers)
+	assert r.json()["title"] == updated_data["title"]
+
+
+async def test_update_book_empty_patch(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.patch(f"/books/{book.id}", json={}, headers=headers)
+
+	assert r.status_code == 200
+	assert r.json()["title"] == book.title
+
 
 async def test_update_book_not_found(
 	client: AsyncClient,
@@ -102,6 +427,21 @@ async def test_update_book_not_found(
 	assert r.json() == {"detail": f"Book with id {invalid_book_id} not found."}
 
 
+async def test_write_after_not_found_write(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	# NOTE the rollback of the 404 must not expire the user cached by its request
+	r = await client.patch("/books/999999", json={"title": "Updated Title"}, headers=headers)
+	assert r.status_code == 404
+	r = await client.post("/books", json=create_book_factory.build().model_dump(mode="json"), headers=headers)
+
+	assert r.status_code == 201
+
+
 async def test_delete_book(
 	db: AsyncSession,
 	client: AsyncClient,
@@ -133,3 +473,274 @@ async def test_delete_book_not_found(
 
 	assert r.status_code == 404
 	assert r.json() == {"detail": f"Book with id {invalid_book_id} not found."}
+
+
+async def test_create_books_bulk(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	books_data = [book.model_dump(mode="json") for book in create_book_factory.batch(3)]
+	books_data.insert(1, {"title": "Missing author and genre"})
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.post("/books/bulk", json=books_data, headers=headers)
+
+	assert r.status_code == 201
+	ids = r.json()["ids"]
+	assert len(ids) == 4
+	assert ids[1] is None
+	assert [error["index"] for error in r.json()["errors"]] == [1]
+	for book_id, book_data in zip([ids[0], *ids[2:]], [books_data[0], *books_data[2:]]):
+		r = await client.get(f"/books/{book_id}", headers=headers)
+		assert r.json()["title"] == book_data["title"]
+
+
+async def test_create_books_bulk_atomic(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	books_data = [book.model_dump(mode="json") for book in create_book_factory.batch(2)]
+	books_data.append({"title": "Missing author and genre"})
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.post("/books/bulk", params={"atomic": True}, json=books_data, headers=headers)
+
+	assert r.status_code == 422
+	assert [error["index"] for error in r.json()["detail"]] == [2]
+
+
+async def test_export_books_ndjson(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books/export", params={"format": "ndjson"}, headers=headers)
+
+	assert r.status_code == 200
+	assert r.headers["content-type"] == "application/x-ndjson"
+	rows = [json.loads(line) for line in r.text.splitlines()]
+	assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+	assert {"id": book.id, "title": book.title} in [{"id": row["id"], "title": row["title"]} for row in rows]
+
+
+async def test_export_books_csv(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async()
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books/export", params={"format": "csv"}, headers=headers)
+
+	assert r.status_code == 200
+	assert r.headers["content-type"].startswith("text/csv")
+	rows = list(csv.DictReader(io.StringIO(r.text)))
+	assert {"id": str(book.id), "title": book.title} in [{"id": row["id"], "title": row["title"]} for row in rows]
+
+
+async def test_search_books(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	in_title = await book_factory.create_async(title="The Quokkaphile Chronicles")
+	in_summary = await book_factory.create_async(summary="A story about a quokkaphile and her island.")
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books/search", params={"q": "quokkaphile"}, headers=headers)
+
+	assert r.status_code == 200
+	items = r.json()["items"]
+	assert [item["id"] for item in items] == [in_title.id, in_summary.id]
+	assert "<mark>Quokkaphile</mark>" in items[0]["snippet"]
+
+
+async def test_search_books_prefix_and_pagination(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	books = [await book_factory.create_async(title=f"Wombatology volume {i}") for i in range(3)]
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books/search", params={"q": "wombat*", "limit": 2}, headers=headers)
+	seen_ids = [item["id"] for item in r.json()["items"]]
+	next_page = await client.get(
+		"/books/search",
+		params={"q": "wombat*", "limit": 2, "after": r.json()["next_cursor"]},
+		headers=headers,
+	)
+	seen_ids.extend(item["id"] for item in next_page.json()["items"])
+
+	assert 'rel="next"' in r.headers["Link"]
+	assert next_page.json()["next_cursor"] is None
+	assert sorted(seen_ids) == sorted(book.id for book in books)
+
+
+@pytest.mark.parametrize(
+	"keys",
+	[{"rank": -1.0, "id": 2**70}, {"rank": -1.0, "id": True}, {"rank": True, "id": 1}, {"rank": "-1", "id": 1}],
+)
+async def test_search_books_invalid_cursor(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	keys: dict[str, object],
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get(
+		"/books/search", params={"q": "wombat", "after": pagination.encode_cursor(keys)}, headers=headers
+	)
+
+	assert r.status_code == 400
+	assert r.json() == {"detail": "Invalid pagination cursor."}
+
+
+async def test_search_books_follows_updates(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	book = await book_factory.create_async(title="Platypodes of the North")
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	await client.patch(f"/books/{book.id}", json={"title": "Echidnas of the South"}, headers=headers)
+	old_title = await client.get("/books/search", params={"q": "platypodes"}, headers=headers)
+	new_title = await client.get("/books/search", params={"q": "echidnas"}, headers=headers)
+
+	assert old_title.json()["items"] == []
+	assert [item["id"] for item in new_title.json()["items"]] == [book.id]
+
+
+async def test_search_books_without_words(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+
+	r = await client.get("/books/search", params={"q": '"*" -:'}, headers=headers)
+
+	assert r.status_code == 400
+	assert r.json() == {"detail": "Search query must contain at least one word."}
+
+
+async def test_get_books_filtered(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	author = "Ursula Filterwell"
+	in_range = await book_factory.create_async(author=author, genre="fantasy", published_date=date(1970, 6, 1))
+	await book_factory.create_async(author=author, genre="fantasy", published_date=date(1990, 6, 1))
+	await book_factory.create_async(author=author, genre="poetry", published_date=date(1970, 6, 1))
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	params = {"author": author, "genre": "fantasy", "published_from": "1970-01-01", "published_to": "1979-12-31"}
+
+	r = await client.get("/books", params=params, headers=headers)
+
+	assert r.status_code == 200
+	assert [book["id"] for book in r.json()["items"]] == [in_range.id]
+
+
+async def test_get_books_sorted_with_cursor(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	book_factory: mocks.BookFactory,
+) -> None:
+	book_factory.__async_session__ = db
+	author = "Sorty McSortface"
+	dates = [date(2001, 1, 1), None, date(1999, 1, 1), date(2001, 1, 1), None]
+	books = [await book_factory.create_async(author=author, published_date=day) for day in dates]
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	params: dict[str, str | int] = {"author": author, "sort": "-published_date", "limit": 2}
+
+	r = await client.get("/books", params=params, headers=headers)
+	seen = r.json()["items"]
+	while r.json()["next_cursor"] is not None:
+		r = await client.get("/books", params={**params, "after": r.json()["next_cursor"]}, headers=headers)
+		seen.extend(r.json()["items"])
+
+	# NOTE descending order puts books without a date last, ties are ordered by descending id
+	expected = sorted(
+		books,
+		key=lambda book: (book.published_date is not None, book.published_date or date.min, book.id),
+	)
+	assert [book["id"] for book in seen] == [book.id for book in reversed(expected)]
+
+
+async def test_get_books_cursor_from_other_sort(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cursor = pagination.encode_cursor({"id": 1})
+
+	r = await client.get("/books", params={"sort": "title", "after": cursor}, headers=headers)
+
+	assert r.status_code == 400
+
+
+@pytest.mark.parametrize(
+	("sort", "value"),
+	[("title", ["a"]), ("-author", {"a": 1}), ("title", 1), ("published_date", 1), ("published_date", "1st May")],
+)
+async def test_get_books_cursor_with_invalid_sort_key(
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	sort: str,
+	value: object,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	cursor = pagination.encode_cursor({sort.removeprefix("-"): value, "id": 1})
+
+	r = await client.get("/books", params={"sort": sort, "after": cursor}, headers=headers)
+
+	assert r.status_code == 400
+	assert r.json() == {"detail": "Invalid pagination cursor."}
+
+
+@pytest.mark.parametrize(
+	"filters",
+	[
+		models.BookFilterModel(author="author"),
+		models.BookFilterModel(genre="genre"),
+		models.BookFilterModel(published_from=date(2000, 1, 1)),
+		models.BookFilterModel(published_to=date(2000, 1, 1)),
+		models.BookFilterModel(author="author", published_from=date(2000, 1, 1), published_to=date(2001, 1, 1)),
+		models.BookFilterModel(genre="genre", published_from=date(2000, 1, 1)),
+		models.BookFilterModel(author="author", genre="genre"),
+		# NOTE not a bind parameter
+		models.BookFilterModel(author="a :b"),
+	],
+)
+@pytest.mark.parametrize("sort", ["id", "-title", "author", "-published_date"])
+async def test_get_books_filters_use_index(
+	db: AsyncSession,
+	filters: models.BookFilterModel,
+	sort: models.BookSort,
+) -> None:
+	last_book = {"id": 1, "title": "title", "author": "author", "published_date": "2000-01-01"}
+	query = crud.build_books_query(sort=sort, filters=filters, after=last_book)
+
+	plan = await crud.explain_query_plan(db, query)
+
+	assert not any(step.startswith("SCAN") for step in plan), plan
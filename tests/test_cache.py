@@ -0,0 +1,39 @@
+from app.core.cache import TTLCache
+
+
+def test_cache_hit_and_miss() -> None:
+	cache = TTLCache[str, int](max_size=10, ttl=60)
+	cache.set("a", 1)
+
+	assert cache.get("a") == 1
+	assert cache.get("b") is None
+	assert cache.stats()["hits"] == 1
+	assert cache.stats()["misses"] == 1
+
+
+def test_cache_entry_expires() -> None:
+	cache = TTLCache[str, int](max_size=10, ttl=60)
+	cache.set("a", 1, ttl=0)
+
+	assert cache.get("a") is None
+	assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used() -> None:
+	cache = TTLCache[str, int](max_size=2, ttl=60)
+	cache.set("a", 1)
+	cache.set("b", 2)
+	cache.get("a")
+	cache.set("c", 3)
+
+	assert cache.get("b") is None
+	assert cache.get("a") == 1
+	assert cache.get("c") == 3
+	assert cache.stats()["evictions"] == 1
+
+
+def test_cache_disabled_with_zero_size() -> None:
+	cache = TTLCache[str, int](max_size=0, ttl=60)
+	cache.set("a", 1)
+
+	assert cache.get("a") is None
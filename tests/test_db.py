@@ -0,0 +1,68 @@
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.books import crud
+from app.books.models import UpdateBookModel
+from app.core.config import AppSettings
+from app.db.connection import Base, create_engine
+
+
+async def test_sqlite_connections_get_the_pragma_profile(test_settings: AppSettings, tmp_path: Path) -> None:
+	settings = test_settings.model_copy(
+		update={"database_url": f"sqlite+aiosqlite:///{tmp_path / 'pragmas.db'}", "sqlite_cache_size_kib": 1_024}
+	)
+	engine = create_engine(settings)
+	try:
+		async with engine.connect() as conn:
+			pragmas = {
+				name: (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+				for name in ("journal_mode", "synchronous", "cache_size", "temp_store", "busy_timeout")
+			}
+		# NOTE synchronous NORMAL is 1 and temp_store MEMORY is 2
+		assert pragmas == {
+			"journal_mode": "wal",
+			"synchronous": 1,
+			"cache_size": -1_024,
+			"temp_store": 2,
+			"busy_timeout": 5_000,
+		}
+		assert engine.pool.size() == settings.database_pool_size
+	finally:
+		await engine.dispose()
+
+
+async def test_in_memory_sqlite_has_no_pool_to_size(test_settings: AppSettings) -> None:
+	engine = create_engine(test_settings.model_copy(update={"database_url": "sqlite+aiosqlite://"}))
+	try:
+		async with engine.connect() as conn:
+			assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "memory"
+	finally:
+		await engine.dispose()
+
+
+async def test_books_written_after_the_version_migration_get_a_new_version(
+	test_settings: AppSettings, tmp_path: Path
+) -> None:
+	path = tmp_path / "legacy.db"
+	with sqlite3.connect(path) as legacy:
+		legacy.execute(
+			"CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, "
+			"published_date DATE, summary VARCHAR, genre VARCHAR NOT NULL)"
+		)
+		legacy.execute("INSERT INTO books (title, author, genre) VALUES ('Title', 'Author', 'Genre')")
+	legacy.close()
+	engine = create_engine(test_settings.model_copy(update={"database_url": f"sqlite+aiosqlite:///{path}"}))
+	try:
+		async with engine.begin() as conn:
+			await conn.run_sync(Base.metadata.create_all)
+		async with AsyncSession(engine, expire_on_commit=False) as session:
+			assert (await crud.get_book(session, 1)).version == 1
+			book = await crud.update_book(session, 1, UpdateBookModel(title="New Title"))
+
+		# NOTE the ETag of a book is its id and version, the same version would answer 304 with the old title
+		assert book.version > 1
+	finally:
+		await engine.dispose()
@@ -0,0 +1,294 @@
+import asyncio
+import json
+from contextlib import suppress
+
+import pytest
+import redis.asyncio as aioredis
+from httpx import AsyncClient
+from starlette.testclient import TestClient
+
+from app.api.sse import event_generator
+from app.core import envelope
+from app.db.bus import EventBus, MemoryEventBus, publish_event
+from app.db.redis import parse_stream_id, stream_key
+from app.events.filters import EventFilter, SubscriptionIndex
+from app.events.hub import EventHub, SharedEvent, Subscription, get_event_hub
+from app.main import BooksAPI
+
+
+def book_event(event_type: str, book_id: int, author: str, genre: str) -> dict[str, object]:
+	tags = {"book_id": [book_id], "author": [author], "genre": [genre]}
+	return {"event": event_type, "data": {"id": book_id}, "tags": tags}
+
+
+def parse_frame(frame: bytes) -> dict[str, str]:
+	fields = (line.partition(": ") for line in frame.decode().strip().split("\r\n"))
+	return {name: value for name, _, value in fields}
+
+
+async def test_subscription_drops_oldest_events_when_full() -> None:
+	hub = EventHub()
+
+	async with hub.subscribe("test", max_size=2) as subscription:
+		for i in range(3):
+			hub.dispatch("test", {"event": "e", "data": {"i": i}})
+
+		assert [(await anext(subscription)).event["data"]["i"] for _ in range(2)] == [1, 2]
+		assert hub.stats()["dropped"] == 1
+	assert hub.stats()["subscribers"] == 0
+	assert hub.stats()["dropped"] == 1
+
+
+async def test_subscription_conflates_events_of_the_same_book() -> None:
+	subscription = Subscription("books", max_size=10, policy="conflate")
+
+	subscription.put(SharedEvent({"event": "book_created", "data": {"id": 1, "title": "a"}}))
+	subscription.put(SharedEvent({"event": "books_created", "data": {"ids": [2, 3]}}))
+	subscription.put(SharedEvent({"event": "book_updated", "data": {"id": 1, "title": "b"}}))
+	subscription.put(SharedEvent({"event": "book_updated", "data": {"id": 1, "author": "c"}}))
+	subscription.put(SharedEvent({"event": "book_updated", "data": {"id": 4, "title": "d"}}))
+	subscription.put(SharedEvent({"event": "book_deleted", "data": {"id": 4}}))
+
+	events = [(await anext(subscription)).event for _ in range(3)]
+	assert events == [
+		{"event": "books_created", "data": {"ids": [2, 3]}},
+		{"event": "book_created", "data": {"id": 1, "title": "b", "author": "c"}},
+		{"event": "book_deleted", "data": {"id": 4}},
+	]
+	assert subscription.counters["conflated"] == 3
+
+
+async def test_subscription_disconnects_slow_client() -> None:
+	subscription = Subscription("books", max_size=2, policy="disconnect")
+
+	for i in range(3):
+		subscription.put(SharedEvent({"event": "e", "data": {"i": i}}))
+
+	assert subscription.disconnected
+	assert [event async for event in subscription] == []
+	assert subscription.counters["disconnected"] == 1
+
+
+def test_envelope_round_trips_with_either_codec() -> None:
+	event = {"event": "book_updated", "data": {"id": 1, "title": "Dune"}, "tags": {"author": ["Herbert"]}}
+
+	json_payload = envelope.encode(event)
+	msgpack_payload = envelope.encode(event, "msgpack")
+
+	assert envelope.decode(json_payload) == envelope.decode(msgpack_payload) == event
+	assert len(msgpack_payload) < len(json_payload)
+	assert envelope.decode_message(envelope.pack_message(msgpack_payload, "1-0")) == {**event, "id": "1-0"}
+
+
+def test_envelope_rejects_unknown_versions() -> None:
+	with pytest.raises(ValueError):
+		envelope.decode(b'{"v": 2, "event": "e", "data": {}}')
+	with pytest.raises(ValueError):
+		envelope.decode_message(b"1-0")
+	# NOTE events stored before the envelope was versioned
+	assert envelope.decode(b'{"event": "e", "data": {}}') == {"event": "e", "data": {}}
+
+
+async def test_binary_events_are_replayed_from_the_stream(redis: aioredis.Redis, bus: EventBus) -> None:
+	channel = f"test:{id(bus)}:msgpack"
+	await publish_event(bus, channel, "e", {"i": 0}, stream_max_len=100, codec="msgpack")
+	try:
+		[event] = [event async for event in bus.read_stream(channel, after_id="0-0")]
+
+		assert event["id"] == await bus.first_stream_id(channel)
+		assert event["data"]["i"] == 0
+	finally:
+		await redis.delete(stream_key(channel))
+
+
+async def test_hub_broadcasts_bus_events(bus: EventBus) -> None:
+	hub = EventHub()
+	channel = f"test:{id(hub)}"
+	heard: list[dict[str, object]] = []
+	subscribed = asyncio.Event()
+	hub.add_listener(channel, heard.append, on_subscribe=subscribed.set)
+	task = asyncio.create_task(hub.run(bus))
+	try:
+		await asyncio.wait_for(subscribed.wait(), timeout=5)
+		async with hub.subscribe(channel, max_size=10) as first, hub.subscribe(channel, max_size=10) as second:
+			await bus.publish([(channel, b"not json", 0), (channel, envelope.encode({"event": "e", "data": {}}), 0)])
+
+			events = [await asyncio.wait_for(anext(s), timeout=5) for s in (first, second)]
+
+		# NOTE decoded and framed once for every client
+		assert events[0] is events[1]
+		assert events[0].sse_frame == b"event: e\r\ndata: {}\r\n\r\n"
+		assert heard == [events[0].event]
+		stats = hub.stats()
+		assert (stats["received"], stats["delivered"], stats["malformed"]) == (2, 2, 1)
+	finally:
+		task.cancel()
+		with suppress(asyncio.CancelledError):
+			await task
+
+
+async def test_hub_survives_failing_listeners() -> None:
+	bus = MemoryEventBus()
+	hub = EventHub()
+	channel = f"test:{id(hub)}"
+	heard: list[dict[str, object]] = []
+	subscribed = asyncio.Event()
+
+	def fail(event: dict[str, object]) -> None:
+		raise RuntimeError("listener bug")
+
+	# NOTE registered again on every start of the application, each listener is only called once
+	hub.add_listener(channel, heard.append)
+	hub.add_listener(channel, fail)
+	hub.add_listener(channel, heard.append, on_subscribe=subscribed.set)
+	task = asyncio.create_task(hub.run(bus))
+	try:
+		await asyncio.wait_for(subscribed.wait(), timeout=5)
+		async with hub.subscribe(channel, max_size=10) as subscription:
+			for i in range(2):
+				await bus.publish([(channel, envelope.encode({"event": "e", "data": {"i": i}}), 0)])
+			events = [await asyncio.wait_for(anext(subscription), timeout=5) for _ in range(2)]
+
+		assert [event.event["data"] for event in events] == [{"i": 0}, {"i": 1}]
+		assert heard == [event.event for event in events]
+		assert hub.stats()["errors"] == 2
+		assert not task.done()
+	finally:
+		task.cancel()
+		with suppress(asyncio.CancelledError):
+			await task
+
+
+async def test_sse_replays_events_after_last_event_id(redis: aioredis.Redis, bus: EventBus) -> None:
+	hub = EventHub()
+	channel = f"test:{id(hub)}"
+	for i in range(3):
+		await publish_event(bus, channel, "e", {"i": i}, stream_max_len=100)
+	first_id, second_id, third_id = [event["id"] async for event in bus.read_stream(channel, after_id="0-0")]
+	try:
+		events = event_generator(hub, channel, 10, "drop_oldest", bus, last_event_id=first_id)
+
+		assert [parse_frame(await anext(events))["id"] for _ in range(2)] == [second_id, third_id]
+		hub.dispatch(channel, {"event": "e", "data": {"i": 2}, "id": third_id})
+		hub.dispatch(channel, {"event": "e", "data": {"i": 3}, "id": "9999999999999-0"})
+		assert json.loads(parse_frame(await anext(events))["data"]) == {"i": 3}
+		await events.aclose()
+	finally:
+		await redis.delete(stream_key(channel))
+
+
+async def test_sse_asks_to_resync_when_missed_events_were_trimmed(redis: aioredis.Redis, bus: EventBus) -> None:
+	hub = EventHub()
+	channel = f"test:{id(hub)}"
+	await publish_event(bus, channel, "e", {}, stream_max_len=100)
+	try:
+		events = event_generator(hub, channel, 10, "drop_oldest", bus, last_event_id="1-0")
+
+		assert parse_frame(await anext(events))["event"] == "resync"
+		assert parse_frame(await anext(events))["event"] == "e"
+		await events.aclose()
+	finally:
+		await redis.delete(stream_key(channel))
+
+
+async def test_memory_bus_caps_streams_like_redis() -> None:
+	bus = MemoryEventBus()
+	await bus.publish([("test:capped", envelope.encode({"event": "e", "data": {"i": i}}), 2) for i in range(3)])
+
+	stored = [event async for event in bus.read_stream("test:capped", after_id="0-0")]
+	assert [event["data"]["i"] for event in stored] == [1, 2]
+	# NOTE increasing ids, even within the same millisecond
+	assert parse_stream_id(stored[0]["id"]) < parse_stream_id(stored[1]["id"])
+	assert await bus.first_stream_id("test:capped") == stored[0]["id"]
+	assert bus.stats() == {"published": 3, "channels": 0, "stored": 2}
+
+
+async def test_sse_rejects_invalid_last_event_id(client: AsyncClient) -> None:
+	r = await client.get("/sse/updates/books", headers={"Last-Event-ID": "latest"})
+
+	assert r.status_code == 400
+
+
+def test_subscription_index_matches_every_given_dimension() -> None:
+	index = SubscriptionIndex[str]()
+	index.add("all")
+	index.add("empty", EventFilter(author=[]))
+	index.add("tolkien", EventFilter(author=["Tolkien"]))
+	index.add("tolkien updates", EventFilter(author=["Tolkien"], event=["book_updated"]))
+	index.add("books 1 and 2", EventFilter(book_id=[1, 2]))
+	index.add("fantasy or horror", EventFilter(genre=["Fantasy", "Horror"]))
+
+	assert set(index.match(book_event("book_created", 1, "Tolkien", "Fantasy"))) == {
+		"all",
+		"empty",
+		"tolkien",
+		"books 1 and 2",
+		"fantasy or horror",
+	}
+	assert set(index.match(book_event("book_updated", 3, "Tolkien", "Poetry"))) == {
+		"all",
+		"empty",
+		"tolkien",
+		"tolkien updates",
+	}
+	assert set(index.match({"event": "resync", "data": {}})) == {"all", "empty"}
+
+	index.remove("tolkien")
+	index.remove("all")
+	assert set(index.match(book_event("book_updated", 3, "Tolkien", "Poetry"))) == {"empty", "tolkien updates"}
+	assert len(index) == 4
+
+
+async def test_hub_delivers_events_matching_the_filter_of_each_client() -> None:
+	hub = EventHub()
+
+	async with (
+		hub.subscribe("books", max_size=10, event_filter=EventFilter(author=["Tolkien"])) as tolkien,
+		hub.subscribe("books", max_size=10, event_filter=EventFilter(genre=["Horror"])) as horror,
+	):
+		hub.dispatch("books", book_event("book_created", 1, "Tolkien", "Fantasy"))
+		hub.set_filter(horror, EventFilter(genre=["Fantasy"]))
+		hub.dispatch("books", book_event("book_created", 2, "Herbert", "Fantasy"))
+
+		assert (await anext(tolkien)).event["data"]["id"] == 1
+		assert (await anext(horror)).event["data"]["id"] == 2
+		assert hub.stats()["delivered"] == 2
+
+
+async def test_sse_sends_matching_events_without_their_tags() -> None:
+	hub = EventHub()
+	event_filter = EventFilter(book_id=[2])
+	events = event_generator(hub, "books", 10, "drop_oldest", event_filter=event_filter)
+
+	# NOTE subscribes on the first iteration
+	first = asyncio.ensure_future(anext(events))
+	await asyncio.sleep(0)
+	for book_id in (1, 2):
+		hub.dispatch("books", book_event("book_deleted", book_id, "Tolkien", "Fantasy"))
+
+	assert await first == b'event: book_deleted\r\ndata: {"id": 2}\r\n\r\n'
+	await events.aclose()
+
+
+def test_websocket_changes_filters_without_reconnecting(app: BooksAPI) -> None:
+	hub = EventHub()
+	app.dependency_overrides[get_event_hub] = lambda: hub
+	try:
+		with TestClient(app).websocket_connect("/ws/updates/books?author=Tolkien") as ws:
+			ws.portal.call(hub.dispatch, "books", book_event("book_created", 1, "Herbert", "Science Fiction"))
+			ws.portal.call(hub.dispatch, "books", book_event("book_created", 2, "Tolkien", "Fantasy"))
+			assert ws.receive_json() == {"event": "book_created", "data": {"id": 2}}
+
+			ws.send_json({"author": "Tolkien"})
+			assert ws.receive_json()["event"] == "error"
+			ws.send_bytes(b'{"genre": ["Fantasy"]}')
+			assert ws.receive_json() == {"event": "error", "data": {"detail": "Filters must be sent as text messages."}}
+			ws.send_json({"genre": ["Science Fiction"]})
+			assert ws.receive_json() == {"event": "filter", "data": {"genre": ["Science Fiction"]}}
+
+			ws.portal.call(hub.dispatch, "books", book_event("book_updated", 2, "Tolkien", "Fantasy"))
+			ws.portal.call(hub.dispatch, "books", book_event("book_updated", 1, "Herbert", "Science Fiction"))
+			assert ws.receive_json() == {"event": "book_updated", "data": {"id": 1}}
+		assert hub.stats()["subscribers"] == 0
+	finally:
+		del app.dependency_overrides[get_event_hub]
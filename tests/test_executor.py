@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.executor import BoundedExecutor, ExecutorBusyError
+
+
+async def test_executor_runs_off_the_event_loop() -> None:
+	executor = BoundedExecutor("test", max_workers=2, max_queue=2)
+
+	thread_name = await executor.run(lambda: threading.current_thread().name)
+
+	assert thread_name.startswith("test")
+	await asyncio.sleep(0)  # let the completion be recorded
+	assert executor.stats()["completed"] == 1
+	assert executor.stats()["in_flight"] == 0
+
+
+async def test_executor_rejects_when_queue_is_full() -> None:
+	executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+	release = threading.Event()
+	running = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+	await asyncio.sleep(0)
+
+	assert executor.stats()["queued"] == 1
+	with pytest.raises(ExecutorBusyError):
+		await executor.run(release.wait)
+	assert executor.stats()["rejected"] == 1
+
+	release.set()
+	await asyncio.gather(*running)
+	await asyncio.sleep(0)
+	assert executor.stats()["completed"] == 2
+
+
+async def test_executor_frees_the_slot_of_a_failed_submit() -> None:
+	executor = BoundedExecutor("test", max_workers=1, max_queue=0)
+	executor.shutdown()
+
+	for _ in range(2):
+		with pytest.raises(RuntimeError):
+			await executor.run(lambda: None)
+
+	assert executor.stats()["in_flight"] == 0
+	assert executor.stats()["rejected"] == 0
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any
+
+import pytest
+import redis.asyncio as aioredis
+from httpx import AsyncClient
+from redis.exceptions import ConnectionError
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.cache import user_key
+from app.core import envelope
+from app.core.config import AppSettings
+from app.db.bus import EventBus, EventSubscriber, RedisEventBus
+from app.db.redis import create_redis_client, stream_key
+from app.events.outbox import OutboxEvent, OutboxPublisher, add_event
+from tests import mocks
+
+
+async def pending_events(db: AsyncSession) -> list[dict[str, Any]]:
+	result = await db.execute(select(OutboxEvent.payload).order_by(OutboxEvent.id))
+	return [envelope.decode(payload) for payload in result.scalars()]
+
+
+async def next_message(pubsub: EventSubscriber) -> dict[str, Any]:
+	# NOTE `get_message` returns None for the subscription confirmations it skips
+	while True:
+		message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5)
+		if message is not None:
+			return message
+
+
+async def test_book_write_adds_its_event_to_the_outbox(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	await db.execute(delete(OutboxEvent))
+	await db.commit()
+
+	book = create_book_factory.build()
+	r = await client.post("/books", json=book.model_dump(mode="json"), headers=headers)
+	await client.delete("/books/999999999", headers=headers)
+
+	events = await pending_events(db)
+	assert [event["event"] for event in events] == ["book_created"]
+	assert events[0]["data"]["id"] == r.json()["id"]
+	assert events[0]["tags"] == {"book_id": [r.json()["id"]], "author": [book.author], "genre": [book.genre]}
+
+
+async def test_book_update_is_tagged_with_the_previous_author(
+	db: AsyncSession,
+	client: AsyncClient,
+	get_valid_user_jwt: str,
+	create_book_factory: mocks.CreateBookFactory,
+) -> None:
+	headers = {"Authorization": f"Bearer {get_valid_user_jwt}"}
+	book = create_book_factory.build(author="Before", genre="fantasy")
+	book_id = (await client.post("/books", json=book.model_dump(mode="json"), headers=headers)).json()["id"]
+	await db.execute(delete(OutboxEvent))
+	await db.commit()
+
+	await client.patch(f"/books/{book_id}", json={"author": "After"}, headers=headers)
+
+	[event] = await pending_events(db)
+	assert event["tags"] == {"book_id": [book_id], "author": ["After", "Before"], "genre": ["fantasy"]}
+
+
+async def test_registration_adds_its_event_to_the_outbox(
+	db: AsyncSession,
+	client: AsyncClient,
+	user_model_factory: mocks.UserModelFactory,
+) -> None:
+	await db.execute(delete(OutboxEvent))
+	await db.commit()
+	user = user_model_factory.build()
+
+	# NOTE the event bus is not involved, a registration does not fail once the user exists
+	r = await client.post("/auth/register", json=user.model_dump())
+
+	assert r.status_code == 201
+	[event] = await pending_events(db)
+	assert event["event"] == "user_created"
+	assert event["data"]["user"] == user_key(user.username)
+
+
+async def test_publisher_publishes_in_order(db: AsyncSession, bus: EventBus) -> None:
+	publisher = OutboxPublisher(batch_size=2, interval=1, lease=30)
+	channel = f"test:{id(publisher)}"
+	await db.execute(delete(OutboxEvent))
+	for i in range(3):
+		await add_event(db, channel, "e", {"i": i})
+	await db.commit()
+
+	async with bus.subscriber() as pubsub:
+		await pubsub.subscribe(channel)
+		assert await publisher.publish_pending(bus) == 2
+		assert await publisher.publish_pending(bus) == 1
+		messages = [await asyncio.wait_for(next_message(pubsub), timeout=5) for _ in range(3)]
+
+	events = [envelope.decode_message(message["data"]) for message in messages]
+	assert [event["data"]["i"] for event in events] == [0, 1, 2]
+	assert await pending_events(db) == []
+
+
+async def test_publisher_retries_after_failure(
+	db: AsyncSession, redis: aioredis.Redis, test_settings: AppSettings
+) -> None:
+	publisher = OutboxPublisher(batch_size=10, interval=1, lease=0)
+	unreachable = RedisEventBus(
+		create_redis_client(test_settings.model_copy(update={"redis_url": "redis://127.0.0.1:1"}))
+	)
+	await db.execute(delete(OutboxEvent))
+	await add_event(db, f"test:{id(publisher)}", "e", {})
+	await db.commit()
+
+	with pytest.raises(ConnectionError):
+		await publisher.publish_pending(unreachable)
+	assert len(await pending_events(db)) == 1
+	await asyncio.sleep(0.01)  # let the lease expire
+	assert await publisher.publish_pending(RedisEventBus(redis)) == 1
+	assert await pending_events(db) == []
+	await unreachable.redis.aclose()
+
+
+async def test_streamed_event_is_published_with_its_stream_id(
+	db: AsyncSession, redis: aioredis.Redis, bus: EventBus
+) -> None:
+	publisher = OutboxPublisher(batch_size=10, interval=1, lease=30)
+	channel = f"test:{id(publisher)}"
+	await db.execute(delete(OutboxEvent))
+	await add_event(db, channel, "e", {"ids": []}, stream_max_len=100)
+	await db.commit()
+
+	try:
+		async with bus.subscriber() as pubsub:
+			await pubsub.subscribe(channel)
+			await publisher.publish_pending(bus)
+			message = await asyncio.wait_for(next_message(pubsub), timeout=5)
+
+		event = envelope.decode_message(message["data"])
+		assert event["id"] == await bus.first_stream_id(channel)
+		assert [stored["data"] async for stored in bus.read_stream(channel, "0")] == [event["data"]]
+	finally:
+		await redis.delete(stream_key(channel))
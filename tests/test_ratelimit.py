@@ -0,0 +1,39 @@
+import pytest
+
+from app.core.config import AppSettings
+from app.core.ratelimit import RateLimitedError, SlidingWindowLimiter
+from app.db.redis import create_redis_client
+
+
+async def test_local_limiter_rejects_over_limit() -> None:
+	limiter = SlidingWindowLimiter(window=60, prefix="test")
+
+	await limiter.hit({"a": 2}, redis=None)
+	await limiter.hit({"a": 2}, redis=None)
+	with pytest.raises(RateLimitedError) as e:
+		await limiter.hit({"a": 2}, redis=None)
+
+	assert 0 < e.value.retry_after <= 60
+	assert limiter.stats()["rejected"] == 1
+
+
+async def test_rejected_request_does_not_count_against_other_keys() -> None:
+	limiter = SlidingWindowLimiter(window=60, prefix="test")
+	await limiter.hit({"ip": 1}, redis=None)
+
+	with pytest.raises(RateLimitedError):
+		await limiter.hit({"ip": 1, "user": 1}, redis=None)
+	await limiter.hit({"user": 1}, redis=None)
+
+
+async def test_redis_limiter_is_shared(test_settings: AppSettings) -> None:
+	redis = create_redis_client(test_settings)
+	limiters = [SlidingWindowLimiter(window=60, prefix="test") for _ in range(2)]
+	key = f"shared:{id(limiters)}"
+	try:
+		await limiters[0].hit({key: 1}, redis)
+		with pytest.raises(RateLimitedError):
+			await limiters[1].hit({key: 1}, redis)
+	finally:
+		await redis.delete(f"test:{key}")
+		await redis.aclose()
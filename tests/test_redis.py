@@ -0,0 +1,41 @@
+import pytest
+import redis.asyncio as aioredis
+from httpx import AsyncClient
+from redis.exceptions import ConnectionError
+
+from app.core.config import AppSettings
+from app.db.redis import create_redis_pool
+from tests import mocks
+
+
+async def test_pool_counts_waits_for_a_connection(test_settings: AppSettings) -> None:
+	settings = test_settings.model_copy(update={"redis_max_connections": 1, "redis_pool_timeout_seconds": 0.05})
+	pool = create_redis_pool(settings)
+	redis = aioredis.Redis.from_pool(pool)
+	try:
+		connection = await pool.get_connection("PING")
+		with pytest.raises(ConnectionError):
+			await redis.ping()
+		await pool.release(connection)
+		await redis.ping()
+
+		assert pool.stats() | {"connections": 1, "in_use": 0, "acquired": 3, "waited": 1, "timeouts": 1} == pool.stats()
+	finally:
+		await redis.aclose()
+
+
+async def test_requests_share_the_pool(client: AsyncClient, user_model_factory: mocks.UserModelFactory) -> None:
+	user = user_model_factory.build()
+	await client.post("/auth/register", json=user.model_dump())
+	token = (await client.post("/auth/login", json=user.model_dump())).json()["access_token"]
+	headers = {"Authorization": f"Bearer {token}"}
+	before = (await client.get("/metrics", headers=headers)).json()["redis_pool"]
+	for _ in range(3):
+		# NOTE every attempt is counted by the login rate limiter in Redis
+		await client.post("/auth/login", json=user.model_dump())
+
+	stats = (await client.get("/metrics", headers=headers)).json()["redis_pool"]
+
+	assert stats["acquired"] >= before["acquired"] + 3
+	assert stats["connections"] == max(before["connections"], 1)
+	assert stats["in_use"] == 0